@@ -0,0 +1,201 @@
+import json
+import math
+import os
+
+# 通知条件の定義ファイル (未設定・存在しない場合は DEFAULT_RULES を使用)
+DEFAULT_RULES_PATH = os.environ.get('ALERT_RULES_PATH', 'alert_rules.json')
+BOAT_COUNT = 6
+
+# 従来の通知条件 (1号艇が単勝1番人気でない)
+DEFAULT_RULES = [
+    {
+        'name': '1号艇が1番人気以外',
+        'conditions': [{'type': 'favorite_not', 'boat': 1}],
+        'title': '⚡ 波乱レース ({minutesLeft}分前)',
+        'message': '{stadium} {raceNo}R\n締切: {deadlineTime} (残り約{minutesLeft}分)\n🌊 波乱レース予報（1号艇が1番人気以外）🌊\n{url}'
+    }
+]
+
+
+class RaceOdds:
+    """
+    1レース分の単勝オッズを解析済みの形で保持するクラス
+
+    オッズページの取得・解析は1レースにつき1回だけ行い、全ルールがこのオブジェクトを参照する。
+    """
+    def __init__(self, odds_map):
+        self.odds = dict(odds_map)
+        # 人気順 (オッズの低い順。同率は艇番の小さい順)
+        self.ranking = sorted(self.odds, key=lambda boat: (self.odds[boat], boat))
+
+    @property
+    def favoriteBoat(self):
+        return self.ranking[0] if self.ranking else None
+
+    @property
+    def favoriteOdds(self):
+        return self.odds[self.ranking[0]] if self.ranking else None
+
+    @property
+    def secondBoat(self):
+        return self.ranking[1] if len(self.ranking) > 1 else None
+
+    @property
+    def secondOdds(self):
+        return self.odds[self.ranking[1]] if len(self.ranking) > 1 else None
+
+    @property
+    def gap(self):
+        """
+        1番人気と2番人気のオッズ差 (2艇以上のオッズがない場合は None)
+        """
+        if self.secondOdds is None:
+            return None
+        return self.secondOdds - self.favoriteOdds
+
+    def isFavorite(self, boat):
+        """
+        指定艇が1番人気か (同率1位も含む)
+        """
+        return boat in self.odds and self.odds[boat] == self.favoriteOdds
+
+    def favoriteMargin(self, boat=1):
+        """
+        指定艇が1番人気かどうかが入れ替わるまでの余裕 (指定艇と他艇の最低オッズの比の対数の絶対値)
+
+        0 に近いほど、締切までのオッズの変動で判定が入れ替わりやすい。比較できない場合は None
+        """
+        others = [odds for other, odds in self.odds.items() if other != boat]
+        if boat not in self.odds or not others or self.odds[boat] <= 0 or min(others) <= 0:
+            return None
+        return abs(math.log(self.odds[boat] / min(others)))
+
+    def templateFields(self):
+        """
+        通知テンプレートで使える値 (オッズのない項目は NaN)
+        """
+        nan = float('nan')
+        fields = {
+            'favoriteBoat': self.favoriteBoat,
+            'favoriteOdds': self.favoriteOdds if self.favoriteOdds is not None else nan,
+            'secondBoat': self.secondBoat,
+            'secondOdds': self.secondOdds if self.secondOdds is not None else nan,
+            'gap': self.gap if self.gap is not None else nan,
+        }
+        for boat in range(1, BOAT_COUNT + 1):
+            fields[f"odds{boat}"] = self.odds.get(boat, nan)
+        return fields
+
+
+def _favoriteNot(odds, boat=1):
+    return not odds.isFavorite(boat)
+
+
+def _favoriteOddsAbove(odds, threshold):
+    return odds.favoriteOdds is not None and odds.favoriteOdds > threshold
+
+
+def _favoriteGapBelow(odds, threshold):
+    return odds.gap is not None and odds.gap < threshold
+
+
+def _favoriteGapAbove(odds, threshold):
+    return odds.gap is not None and odds.gap > threshold
+
+
+def _boatOddsBelow(odds, boat, threshold):
+    return boat in odds.odds and odds.odds[boat] < threshold
+
+
+def _boatOddsAbove(odds, boat, threshold):
+    return boat in odds.odds and odds.odds[boat] > threshold
+
+
+# 条件の種類 -> 判定関数 (ルール定義の "type" に指定する)
+CONDITIONS = {
+    'favorite_not': _favoriteNot,              # boat 号艇が1番人気でない
+    'favorite_odds_above': _favoriteOddsAbove, # 1番人気のオッズが threshold より高い
+    'favorite_gap_below': _favoriteGapBelow,   # 1番人気と2番人気のオッズ差が threshold 未満
+    'favorite_gap_above': _favoriteGapAbove,   # 1番人気と2番人気のオッズ差が threshold より大きい
+    'boat_odds_below': _boatOddsBelow,         # boat 号艇のオッズが threshold 未満
+    'boat_odds_above': _boatOddsAbove,         # boat 号艇のオッズが threshold より高い
+}
+
+
+class AlertRule:
+    """
+    通知条件1つ分。conditions をすべて満たしたときに、自身のテンプレートで通知文を作る
+    """
+    def __init__(self, name, conditions, title, message):
+        self.name = name
+        self.conditions = []
+        for condition in conditions:
+            params = dict(condition)
+            conditionType = params.pop('type', None)
+            if conditionType not in CONDITIONS:
+                raise ValueError(f"ルール '{name}': 不明な条件 '{conditionType}'")
+            self.conditions.append((CONDITIONS[conditionType], params))
+        self.title = title
+        self.message = message
+
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data['name'], data.get('conditions', []), data['title'], data['message'])
+
+    def matches(self, odds):
+        return all(func(odds, **params) for func, params in self.conditions)
+
+    def render(self, race, odds, minutesLeft, url):
+        """
+        テンプレートに値を埋め込み、{'title', 'message', 'url'} を返す
+        """
+        fields = odds.templateFields()
+        fields.update({
+            'stadium': race['stadium'],
+            'jcd': race['jcd'],
+            'raceNo': race['raceNo'],
+            'deadlineTime': race['deadlineTime'],
+            'minutesLeft': int(minutesLeft),
+            'url': url,
+            'rule': self.name,
+        })
+        return {'title': self.title.format(**fields), 'message': self.message.format(**fields), 'url': url}
+
+
+class RuleEngine:
+    """
+    解析済みオッズ (RaceOdds) に対して複数の通知条件をまとめて評価するクラス
+
+    ルールを増やしてもオッズの取得・解析は増えない。
+    """
+    def __init__(self, rules=None):
+        self.rules = rules if rules is not None else loadRules()
+
+    def evaluate(self, odds):
+        """
+        条件を満たしたルールを定義順に返す
+        """
+        return [rule for rule in self.rules if rule.matches(odds)]
+
+    def buildNotification(self, matchedRules, race, odds, minutesLeft, url):
+        """
+        1レース分の通知を作る。複数のルールに該当した場合は最初のルールのテンプレートを使い、
+        残りのルール名を末尾に添える
+        """
+        notification = matchedRules[0].render(race, odds, minutesLeft, url)
+        if len(matchedRules) > 1:
+            others = ', '.join(rule.name for rule in matchedRules[1:])
+            notification['message'] += f"\n(他の該当条件: {others})"
+        return notification
+
+
+def loadRules(path=DEFAULT_RULES_PATH):
+    """
+    ルール定義 (JSON のリスト) を読み込む。ファイルがなければ DEFAULT_RULES を使う
+    """
+    definitions = DEFAULT_RULES
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            definitions = json.load(f)
+        print(f"通知ルール読み込み: {path} ({len(definitions)} 件)")
+    return [AlertRule.fromDict(data) for data in definitions]
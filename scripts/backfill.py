@@ -0,0 +1,200 @@
+import argparse
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import page_parser
+from schedule_fetcher import ScheduleFetcher
+from odds_store import OddsStore
+
+# バックフィルで書き出す part ファイルの識別子 (日単位で書き直すときに削除する)
+BACKFILL_TAG = 'backfill'
+CHECKPOINT_FILE = 'backfill_checkpoint.json'
+
+
+# --- 解析用プロセスで実行する関数 (pickle できるようモジュール直下に置く) ---
+
+_backend = None
+
+
+def _parserBackend(name):
+    global _backend
+    if _backend is None or _backend.name != name:
+        _backend = page_parser.getBackend(name)
+    return _backend
+
+
+def _parseIndex(content, backendName):
+    return _parserBackend(backendName).parseActiveStadiums(content)
+
+
+def _parseSchedule(content, backendName):
+    return _parserBackend(backendName).parseStadiumSchedule(content)
+
+
+def _parseOdds(content, backendName):
+    return _parserBackend(backendName).parseWinOddsPartial(content)
+
+
+class Backfiller:
+    """
+    過去の開催日のスケジュールと確定単勝オッズをまとめて取得し、OddsStore に保存するクラス
+
+    - ダウンロードはスレッドプールで並列に行う (送信間隔は fetcher の rateLimiter で制限)
+    - HTML解析 (CPU処理) はプロセスプールに任せ、ダウンロードを止めない
+    - 1日分が終わるたびに保存してチェックポイントに記録し、中断しても続きから再開できる
+    確定オッズは締切時刻のスナップショット (ts = deadline) として保存する。
+    """
+    def __init__(self, fetcher=None, store=None, checkpointPath=None, parseProcesses=None):
+        # 過去の日付のページは取り直さない (チェックポイントで管理する) ため、監視用のレスポンスキャッシュは使わない
+        self.fetcher = fetcher or ScheduleFetcher(maxWorkers=8, responseCache=False)
+        self.store = store or OddsStore()
+        self.checkpointPath = checkpointPath or os.path.join(self.store.baseDir, CHECKPOINT_FILE)
+        # 0 ならプロセスプールを使わず、ダウンロードしたスレッドでそのまま解析する
+        self.parseProcesses = parseProcesses
+
+    def run(self, dateFrom, dateTo):
+        """
+        dateFrom〜dateTo (YYYYMMDD、両端含む) のうち未完了の日を取得する
+
+        Returns:
+            dict: {'days', 'races', 'odds', 'failedDays'}
+        """
+        completed = self._loadCheckpoint()
+        dates = [d for d in self._dateRange(dateFrom, dateTo) if d not in completed]
+        print(f"バックフィル: {dateFrom}〜{dateTo} 対象 {len(dates)} 日 (完了済み {len(completed)} 日)")
+
+        totals = {'days': 0, 'races': 0, 'odds': 0, 'failedDays': []}
+        ioPool = ThreadPoolExecutor(max_workers=max(1, self.fetcher.maxWorkers))
+        cpuPool = ProcessPoolExecutor(max_workers=self.parseProcesses) if self.parseProcesses != 0 else None
+        try:
+            for dateStr in dates:
+                start = time.monotonic()
+                result = self._backfillDate(dateStr, ioPool, cpuPool)
+                totals['races'] += result['races']
+                totals['odds'] += result['odds']
+                # 取得に失敗したページがある日はチェックポイントに記録せず、次回の実行で取り直す
+                if result['failures']:
+                    totals['failedDays'].append(dateStr)
+                else:
+                    completed.add(dateStr)
+                    self._saveCheckpoint(completed)
+                    totals['days'] += 1
+                print(f"{dateStr}: {result['stadiums']} 場 / {result['races']} レース / オッズ {result['odds']} 件"
+                      f" / 取得失敗 {result['failures']} ({time.monotonic() - start:.1f}秒)")
+        finally:
+            ioPool.shutdown()
+            if cpuPool:
+                cpuPool.shutdown()
+
+        print(f"バックフィル終了: {totals['days']} 日 / {totals['races']} レース / オッズ {totals['odds']} 件"
+              f" (未完了 {len(totals['failedDays'])} 日)")
+        return totals
+
+    def _backfillDate(self, dateStr, ioPool, cpuPool):
+        """
+        1日分のスケジュールと確定オッズを取得して保存する
+        """
+        result = {'stadiums': 0, 'races': 0, 'odds': 0, 'failures': 0}
+        baseUrl = self.fetcher.baseUrl
+
+        entries = self._fetchAndParse(f"{baseUrl}/index?hd={dateStr}", _parseIndex, cpuPool, missing=[])
+        if entries is None:
+            result['failures'] += 1
+            return result
+        stadiums = ScheduleFetcher.buildActiveStadiums(entries)
+        result['stadiums'] = len(stadiums)
+
+        def fetchSchedule(stadium):
+            rows = self._fetchAndParse(f"{baseUrl}/raceindex?jcd={stadium['jcd']}&hd={dateStr}", _parseSchedule, cpuPool,
+                                       missing=[])
+            return stadium, rows
+
+        races = []
+        for stadium, rows in ioPool.map(fetchSchedule, stadiums):
+            if rows is None:
+                result['failures'] += 1
+                continue
+            races.extend(ScheduleFetcher.buildSchedule(stadium['jcd'], dateStr, rows))
+        result['races'] = len(races)
+
+        def fetchOdds(race):
+            odds_map = self._fetchAndParse(
+                f"{baseUrl}/oddstf?jcd={race.jcd}&rno={race.raceNo}&hd={dateStr}", _parseOdds, cpuPool, missing={})
+            return race, odds_map
+
+        # 途中で中断した前回分を消してから書き直す (同じ日のデータが重複しないように)
+        self.store.removeParts(dateStr, BACKFILL_TAG)
+        for race, odds_map in ioPool.map(fetchOdds, races):
+            if odds_map is None:
+                result['failures'] += 1
+            elif odds_map:
+                self.store.append(race, odds_map, race.deadlineDatetime)
+                result['odds'] += 1
+        self.store.flush(tag=BACKFILL_TAG)
+        return result
+
+    def _fetchAndParse(self, url, parseFunc, cpuPool, missing=None):
+        """
+        ページを取得して解析する。取得失敗時は None
+
+        ページが存在しない (404 など、再試行しても変わらない) 場合は missing を返し、
+        その日・場・レースは「データなし」として完了扱いにする。
+        """
+        resp, status = self.fetcher.fetchPage(url)
+        if not resp:
+            return missing if self.fetcher.isMissingPage(status) else None
+        backendName = self.fetcher.parser.name
+        try:
+            if cpuPool is None:
+                return parseFunc(resp.content, backendName)
+            return cpuPool.submit(parseFunc, resp.content, backendName).result()
+        except Exception as e:
+            print(f"解析エラー: {url} - {e}")
+            return None
+
+    @staticmethod
+    def _dateRange(dateFrom, dateTo):
+        day = datetime.datetime.strptime(dateFrom, '%Y%m%d').date()
+        last = datetime.datetime.strptime(dateTo, '%Y%m%d').date()
+        while day <= last:
+            yield day.strftime('%Y%m%d')
+            day += datetime.timedelta(days=1)
+
+    def _loadCheckpoint(self):
+        if not os.path.exists(self.checkpointPath):
+            return set()
+        try:
+            with open(self.checkpointPath, 'r', encoding='utf-8') as f:
+                return set(json.load(f).get('completed', []))
+        except (OSError, ValueError) as e:
+            print(f"チェックポイント読み込みエラー: {e}")
+            return set()
+
+    def _saveCheckpoint(self, completed):
+        dirName = os.path.dirname(self.checkpointPath)
+        if dirName:
+            os.makedirs(dirName, exist_ok=True)
+        tmpPath = f"{self.checkpointPath}.tmp"
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            json.dump({'completed': sorted(completed),
+                       'updatedAt': datetime.datetime.now().isoformat(timespec='seconds')}, f)
+        os.replace(tmpPath, self.checkpointPath)
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="過去の開催日のスケジュールと確定単勝オッズをまとめて取得する")
+    argParser.add_argument('--from', dest='dateFrom', required=True, help="開始日 (YYYYMMDD)")
+    argParser.add_argument('--to', dest='dateTo', required=True, help="終了日 (YYYYMMDD)")
+    argParser.add_argument('--workers', type=int, default=8, help="同時ダウンロード数")
+    argParser.add_argument('--rps', type=float, default=2.0, help="秒間リクエスト数の上限")
+    argParser.add_argument('--parse-processes', type=int, default=None,
+                           help="HTML解析のプロセス数 (省略時はCPU数、0でプロセスを使わない)")
+    argParser.add_argument('--output', default=None, help="保存先ディレクトリ (省略時は ODDS_STORE_DIR または data/odds)")
+    argParser.add_argument('--checkpoint', default=None, help="チェックポイントファイル (省略時は保存先ディレクトリ内)")
+    args = argParser.parse_args()
+
+    fetcher = ScheduleFetcher(maxWorkers=args.workers, requestsPerSecond=args.rps, responseCache=False)
+    store = OddsStore(args.output) if args.output else OddsStore()
+    Backfiller(fetcher, store, args.checkpoint, args.parse_processes).run(args.dateFrom, args.dateTo)
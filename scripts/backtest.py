@@ -0,0 +1,345 @@
+import argparse
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from schedule_fetcher import ScheduleFetcher
+from odds_store import OddsStore, BOAT_COUNT
+from alert_rules import CONDITIONS, loadRules
+
+DEFAULT_RESULT_DIR = os.environ.get('RESULT_STORE_DIR', 'data/results')
+
+# 1レース = 1行 (winner は1着の艇番、payout は100円あたりの単勝払戻金)
+RESULT_COLUMNS = {
+    'date': np.int32,
+    'jcd': np.int8,
+    'rno': np.int8,
+    'winner': np.int8,
+    'payout': np.int32,
+}
+
+
+def raceKeys(date, jcd, rno):
+    """
+    レースを一意に表すキー (YYYYMMDD * 10000 + jcd * 100 + rno) の配列
+    """
+    return date.astype(np.int64) * 10000 + jcd.astype(np.int64) * 100 + rno
+
+
+class ResultStore:
+    """
+    レース結果 (単勝の1着・払戻金) を開催日ごとの results.npz に保存するクラス
+    """
+    def __init__(self, baseDir=DEFAULT_RESULT_DIR):
+        self.baseDir = baseDir
+
+    def _path(self, date):
+        return os.path.join(self.baseDir, f"date={date}", 'results.npz')
+
+    def hasDate(self, date):
+        return os.path.exists(self._path(date))
+
+    def save(self, date, rows):
+        """
+        1日分の結果 [(jcd, rno, winner, payout), ...] を書き出す (既存のファイルは置き換える)
+        """
+        path = self._path(date)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        columns = {'date': np.full(len(rows), int(date), dtype=np.int32)}
+        for i, name in enumerate(('jcd', 'rno', 'winner', 'payout')):
+            columns[name] = np.array([row[i] for row in rows], dtype=RESULT_COLUMNS[name])
+        tmpPath = os.path.join(os.path.dirname(path), '.results.npz.tmp')
+        with open(tmpPath, 'wb') as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmpPath, path)
+
+    def load(self, dateFrom=None, dateTo=None):
+        parts = {name: [] for name in RESULT_COLUMNS}
+        for path in sorted(glob.glob(os.path.join(self.baseDir, 'date=*', 'results.npz'))):
+            date = os.path.basename(os.path.dirname(path))[len('date='):]
+            if (dateFrom and date < dateFrom) or (dateTo and date > dateTo):
+                continue
+            with np.load(path) as data:
+                for name in parts:
+                    parts[name].append(data[name])
+        return {name: (np.concatenate(arrays) if arrays else np.array([], dtype=RESULT_COLUMNS[name]))
+                for name, arrays in parts.items()}
+
+
+def fetchResults(fetcher, oddsStore, resultStore, dateFrom, dateTo, refresh=False):
+    """
+    オッズを保存済みのレースについて、レース結果ページを取得して ResultStore に保存する
+
+    結果を保存済みの日は取得しない (refresh=True で取り直す)。取得に失敗したレースがある日は保存しない。
+
+    Returns:
+        dict: {'days', 'races', 'failedDays'}
+    """
+    columns = oddsStore.load(dateFrom, dateTo)
+    keys = np.unique(raceKeys(columns['date'], columns['jcd'], columns['rno']))
+    totals = {'days': 0, 'races': 0, 'failedDays': []}
+
+    def fetchOne(key):
+        date, jcd, rno = key // 10000, key // 100 % 100, key % 100
+        resp, status = fetcher.fetchPage(f"{fetcher.baseUrl}/raceresult?rno={rno}&jcd={jcd:02d}&hd={date}")
+        if not resp and not fetcher.isMissingPage(status):
+            return None
+        # 結果ページのないレース・不成立・未確定のレースは winner=0 (払戻なし) として記録する
+        result = fetcher.parser.parseRaceResult(resp.content) if resp else {}
+        return (jcd, rno, result.get('winner', 0), result.get('payout', 0))
+
+    with ThreadPoolExecutor(max_workers=max(1, fetcher.maxWorkers)) as executor:
+        for date in np.unique(keys // 10000):
+            date = str(date)
+            if resultStore.hasDate(date) and not refresh:
+                continue
+            dayKeys = [int(key) for key in keys[keys // 10000 == int(date)]]
+            rows = list(executor.map(fetchOne, dayKeys))
+            failed = sum(1 for row in rows if row is None)
+            if failed:
+                print(f"{date}: 取得失敗 {failed} / {len(rows)} レース (次回の実行で取り直します)")
+                totals['failedDays'].append(date)
+                continue
+            resultStore.save(date, rows)
+            totals['days'] += 1
+            totals['races'] += len(rows)
+            print(f"{date}: {len(rows)} レースの結果を保存")
+    return totals
+
+
+class OddsMatrix:
+    """
+    複数レースの単勝オッズ (n × 6、オッズなしは NaN) から人気順などを列ごとにまとめて求めるクラス
+
+    alert_rules.RaceOdds のベクトル版。各プロパティは長さ n の配列。
+    """
+    def __init__(self, odds):
+        self.odds = odds
+        filled = np.where(np.isnan(odds), np.inf, odds)
+        # 人気順 (オッズの低い順。同率は艇番の小さい順)
+        ranking = np.argsort(filled, axis=1, kind='stable')
+        rows = np.arange(len(odds))
+        self.favoriteBoat = ranking[:, 0] + 1
+        self.secondBoat = ranking[:, 1] + 1
+        self.favoriteOdds = np.where(np.isinf(filled[rows, ranking[:, 0]]), np.nan, filled[rows, ranking[:, 0]])
+        self.secondOdds = np.where(np.isinf(filled[rows, ranking[:, 1]]), np.nan, filled[rows, ranking[:, 1]])
+        self.gap = self.secondOdds - self.favoriteOdds
+
+    def boatOdds(self, boat):
+        return self.odds[:, boat - 1]
+
+    def isFavorite(self, boat):
+        return self.boatOdds(boat) == self.favoriteOdds
+
+
+# alert_rules.CONDITIONS と同じ条件のベクトル版 (threshold は (k, 1) の配列でもよく、その場合は k × n の判定になる)
+VECTOR_CONDITIONS = {
+    'favorite_not': lambda m, boat=1: ~m.isFavorite(boat),
+    'favorite_odds_above': lambda m, threshold: m.favoriteOdds > threshold,
+    'favorite_gap_below': lambda m, threshold: m.gap < threshold,
+    'favorite_gap_above': lambda m, threshold: m.gap > threshold,
+    'boat_odds_below': lambda m, boat, threshold: m.boatOdds(boat) < threshold,
+    'boat_odds_above': lambda m, boat, threshold: m.boatOdds(boat) > threshold,
+}
+
+# AlertRule が保持する判定関数 -> 条件の種類
+_CONDITION_TYPES = {func: conditionType for conditionType, func in CONDITIONS.items()}
+
+
+def parseSweep(text):
+    """
+    'favorite_odds_above=1.5,2,3' / 'boat_odds_above:boat=1=3,5,8' 形式の指定を
+    (条件の種類, 固定の引数, threshold の配列) に変換する
+    """
+    spec, values = text.rsplit('=', 1)
+    conditionType, *fixed = spec.split(':')
+    if conditionType not in VECTOR_CONDITIONS:
+        raise ValueError(f"不明な条件です: {conditionType} (選択肢: {', '.join(VECTOR_CONDITIONS)})")
+    params = {}
+    for item in fixed:
+        name, value = item.split('=', 1)
+        params[name] = int(value)
+    return conditionType, params, np.array([float(v) for v in values.split(',')])
+
+
+class Backtester:
+    """
+    保存済みの単勝オッズとレース結果を突き合わせ、通知ルールの的中率・回収率をまとめて集計するクラス
+
+    - 各レースの判定には、締切 decisionMinutes 分前までに取得した最後のスナップショットを使う
+      (バックフィルのデータは締切時刻の確定オッズのみのため、decisionMinutes=0 で使う)
+    - 通知ルールが該当したレースで bet の艇の単勝を100円買ったとして、的中率と回収率を求める
+    - 閾値の候補 (sweep) を与えると、全候補を1回の配列演算で評価する
+    レースごとの Python のループは使わない。
+    """
+    def __init__(self, oddsStore=None, resultStore=None):
+        self.oddsStore = oddsStore or OddsStore()
+        self.resultStore = resultStore or ResultStore()
+
+    def loadRaces(self, dateFrom=None, dateTo=None, decisionMinutes=0):
+        """
+        判定時点のオッズとレース結果が揃ったレースを返す
+
+        Returns:
+            dict: {'key', 'odds' (n × 6), 'winner', 'payout'}
+        """
+        columns = self.oddsStore.load(dateFrom, dateTo)
+        key = raceKeys(columns['date'], columns['jcd'], columns['rno'])
+        secondsLeft = columns['deadline'] - columns['ts']
+
+        # 判定時点までのスナップショットのうち、レースごとに最後のものを取り出す
+        usable = np.flatnonzero(secondsLeft >= decisionMinutes * 60)
+        order = usable[np.lexsort((columns['ts'][usable], key[usable]))]
+        sortedKeys = key[order]
+        isLast = np.r_[sortedKeys[1:] != sortedKeys[:-1], True] if len(order) else np.array([], dtype=bool)
+        snapshot = order[isLast]
+
+        results = self.resultStore.load(dateFrom, dateTo)
+        resultKey = raceKeys(results['date'], results['jcd'], results['rno'])
+        # 払戻のないレース (不成立など) は返還のため対象外
+        valid = results['winner'] > 0
+        _, oddsIdx, resultIdx = np.intersect1d(key[snapshot], resultKey[valid], assume_unique=True, return_indices=True)
+        rows = snapshot[oddsIdx]
+        # オッズが1艇もないスナップショット (発売前など) は判定できないため除く
+        hasOdds = ~np.isnan(columns['odds'][rows]).all(axis=1)
+        rows, resultIdx = rows[hasOdds], resultIdx[hasOdds]
+        return {
+            'key': key[rows],
+            'odds': columns['odds'][rows].astype(np.float64),
+            'winner': results['winner'][valid][resultIdx].astype(np.int64),
+            'payout': results['payout'][valid][resultIdx].astype(np.float64),
+        }
+
+    @staticmethod
+    def betBoats(matrix, bet):
+        """
+        買う艇番の配列 ('favorite' / 'second' / '1'〜'6')
+        """
+        if bet == 'favorite':
+            return matrix.favoriteBoat
+        if bet == 'second':
+            return matrix.secondBoat
+        return np.full(len(matrix.odds), int(bet))
+
+    @staticmethod
+    def ruleMask(matrix, rule):
+        """
+        AlertRule の条件をすべて満たすレースの真偽値配列
+        """
+        mask = np.ones(len(matrix.odds), dtype=bool)
+        for func, params in rule.conditions:
+            mask &= VECTOR_CONDITIONS[_CONDITION_TYPES[func]](matrix, **params)
+        return mask
+
+    @staticmethod
+    def evaluate(masks, hit, returns, boat1Won):
+        """
+        k × n の該当マスクごとに件数・的中率・回収率を求める
+        """
+        bets = masks.sum(axis=1)
+        hits = (masks & hit).sum(axis=1)
+        paid = (masks * returns).sum(axis=1)
+        boat1Wins = (masks & boat1Won).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return {
+                'bets': bets,
+                'hits': hits,
+                'hitRate': np.where(bets > 0, hits / bets, np.nan),
+                'roi': np.where(bets > 0, paid / (bets * 100.0), np.nan),
+                'boat1WinRate': np.where(bets > 0, boat1Wins / bets, np.nan),
+            }
+
+    def run(self, rules=None, sweeps=(), bet='favorite', dateFrom=None, dateTo=None, decisionMinutes=0):
+        """
+        全レース (基準)・各ルール・各ルール × 閾値の候補 を評価する
+
+        Args:
+            rules (list, optional): AlertRule のリスト。省略時は alert_rules.loadRules()
+            sweeps (list): parseSweep() の結果のリスト。各ルールにこの条件を追加した場合を閾値ごとに評価する
+
+        Returns:
+            list: [{'rule', 'sweep', 'threshold', 'bets', 'hits', 'hitRate', 'roi', 'boat1WinRate'}, ...]
+        """
+        rules = rules if rules is not None else loadRules()
+        races = self.loadRaces(dateFrom, dateTo, decisionMinutes)
+        matrix = OddsMatrix(races['odds'])
+        betBoat = self.betBoats(matrix, bet)
+        hit = races['winner'] == betBoat
+        returns = np.where(hit, races['payout'], 0.0)
+        boat1Won = races['winner'] == 1
+
+        rows = []
+
+        def addRows(name, sweepName, thresholds, masks):
+            stats = self.evaluate(masks, hit, returns, boat1Won)
+            for i, threshold in enumerate(thresholds):
+                rows.append({
+                    'rule': name, 'sweep': sweepName, 'threshold': threshold,
+                    **{field: values[i].item() for field, values in stats.items()}
+                })
+
+        addRows('(全レース)', None, [None], np.ones((1, len(hit)), dtype=bool))
+        for rule in rules:
+            base = self.ruleMask(matrix, rule)
+            addRows(rule.name, None, [None], base[np.newaxis, :])
+            for conditionType, params, thresholds in sweeps:
+                extra = VECTOR_CONDITIONS[conditionType](matrix, threshold=thresholds[:, np.newaxis], **params)
+                sweepName = conditionType + ''.join(f":{k}={v}" for k, v in params.items())
+                addRows(rule.name, sweepName, thresholds.tolist(), base[np.newaxis, :] & extra)
+        return rows
+
+
+def printReport(rows, races):
+    print(f"対象レース: {races}")
+    print(f"{'ルール':<24} {'閾値':<28} {'件数':>6} {'的中':>6} {'的中率':>7} {'回収率':>7} {'1号艇1着':>8}")
+    for row in rows:
+        label = f"{row['sweep']}={row['threshold']:g}" if row['sweep'] else '-'
+
+        def pct(value):
+            return f"{value * 100:6.1f}%" if value == value else '     -'
+
+        print(f"{row['rule']:<24} {label:<28} {row['bets']:>6} {row['hits']:>6} {pct(row['hitRate']):>7} "
+              f"{pct(row['roi']):>7} {pct(row['boat1WinRate']):>8}")
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="保存済みの単勝オッズとレース結果で通知ルールを検証する")
+    argParser.add_argument('--odds-dir', default=None, help="オッズの保存先 (省略時は ODDS_STORE_DIR または data/odds)")
+    argParser.add_argument('--result-dir', default=DEFAULT_RESULT_DIR, help="レース結果の保存先")
+    subParsers = argParser.add_subparsers(dest='command', required=True)
+
+    fetchParser = subParsers.add_parser('fetch-results', help="オッズを保存済みのレースの結果を取得する")
+    fetchParser.add_argument('--from', dest='dateFrom', required=True, help="開始日 (YYYYMMDD)")
+    fetchParser.add_argument('--to', dest='dateTo', required=True, help="終了日 (YYYYMMDD)")
+    fetchParser.add_argument('--workers', type=int, default=8, help="同時ダウンロード数")
+    fetchParser.add_argument('--rps', type=float, default=2.0, help="秒間リクエスト数の上限")
+    fetchParser.add_argument('--refresh', action='store_true', help="保存済みの日も取り直す")
+
+    runParser = subParsers.add_parser('run', help="通知ルールの的中率・回収率を集計する")
+    runParser.add_argument('--from', dest='dateFrom', help="開始日 (YYYYMMDD)")
+    runParser.add_argument('--to', dest='dateTo', help="終了日 (YYYYMMDD)")
+    runParser.add_argument('--bet', default='favorite', choices=['favorite', 'second'] + [str(b) for b in range(1, BOAT_COUNT + 1)],
+                           help="ルールが該当したレースで単勝を買う艇 (既定: 判定時点の1番人気)")
+    runParser.add_argument('--decision-minutes', type=float, default=0,
+                           help="締切何分前までのオッズで判定するか (既定: 0 = 確定オッズ)")
+    runParser.add_argument('--sweep', action='append', default=[],
+                           help="各ルールに追加して比較する条件と閾値 (例: favorite_odds_above=1.5,2,3 / boat_odds_above:boat=1=3,5,8)")
+    runParser.add_argument('--rules', default=None, help="ルール定義ファイル (省略時は ALERT_RULES_PATH または既定のルール)")
+    args = argParser.parse_args()
+
+    oddsStore = OddsStore(args.odds_dir) if args.odds_dir else OddsStore()
+    resultStore = ResultStore(args.result_dir)
+    if args.command == 'fetch-results':
+        # 取得済みの日は ResultStore で判定するため、監視用のレスポンスキャッシュは使わない
+        fetcher = ScheduleFetcher(maxWorkers=args.workers, requestsPerSecond=args.rps, responseCache=False)
+        totals = fetchResults(fetcher, oddsStore, resultStore, args.dateFrom, args.dateTo, args.refresh)
+        print(f"結果取得: {totals['days']} 日 / {totals['races']} レース (未完了 {len(totals['failedDays'])} 日)")
+    else:
+        backtester = Backtester(oddsStore, resultStore)
+        rules = loadRules(args.rules) if args.rules else None
+        try:
+            sweeps = [parseSweep(text) for text in args.sweep]
+        except ValueError as e:
+            argParser.error(str(e))
+        rows = backtester.run(rules, sweeps, args.bet, args.dateFrom, args.dateTo, args.decision_minutes)
+        printReport(rows, rows[0]['bets'] if rows else 0)
@@ -0,0 +1,271 @@
+import argparse
+import contextlib
+import datetime
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import page_parser
+from fixture_server import DEFAULT_FIXTURE_DIR, FixtureServer
+
+# 値が大きいほど悪化とみなす指標の接尾辞 (回帰判定に使用)
+LOWER_IS_BETTER = ('_ms', '_seconds', '_requests')
+
+
+def benchParse(fixtureDir=DEFAULT_FIXTURE_DIR, repeat=20):
+    """
+    ページ種別 × バックエンドごとの1ページあたり解析時間(ms, 中央値)を計測する
+    """
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(fixtureDir, '*', '*.html'))):
+        pageType = page_parser.detectPageType(path)
+        if pageType:
+            with open(path, 'rb') as f:
+                pages.setdefault(pageType, []).append(f.read())
+
+    results = {}
+    for backend in page_parser.availableBackends():
+        for pageType, contents in sorted(pages.items()):
+            methods = [(page_parser.PAGE_METHODS[pageType], '')]
+            if pageType == 'oddstf':
+                methods.append(('parseWinOddsPartial', '_partial'))
+            for methodName, suffix in methods:
+                method = getattr(backend, methodName)
+                samples = []
+                for content in contents:
+                    start = time.perf_counter()
+                    for _ in range(repeat):
+                        method(content)
+                    samples.append((time.perf_counter() - start) / repeat * 1000)
+                results[f"parse.{pageType}.{backend.name}{suffix}_ms"] = round(statistics.median(samples), 3)
+    return results
+
+
+def _deadlineShift(fixtureDir, minOffset, maxOffset):
+    """
+    保存済みスケジュールの締切時刻をずらす幅(分)を返す
+
+    check_and_notify() のチェック範囲 (現在時刻 + minOffset〜maxOffset分) に
+    入るレースが最も多くなるずらし幅を選ぶ。
+    """
+    backend = page_parser.getBackend()
+    minutes = []
+    for path in glob.glob(os.path.join(fixtureDir, '*', 'raceindex_*.html')):
+        with open(path, 'rb') as f:
+            for _, deadlineText in backend.parseStadiumSchedule(f.read()):
+                if ':' in deadlineText:
+                    hour, minute = deadlineText.split(':')
+                    minutes.append(int(hour) * 60 + int(minute))
+    if not minutes:
+        return 0
+    now = datetime.datetime.now()
+    # 秒の端数で範囲から外れないよう、1分の余裕を持たせる
+    windowStart = now.hour * 60 + now.minute + minOffset + 1
+
+    def countInWindow(shift):
+        return sum(1 for m in minutes if windowStart <= m + shift < windowStart + (maxOffset - minOffset - 1))
+
+    return max((windowStart - m for m in minutes), key=countInWindow)
+
+
+def benchBatch(fixtureDir=DEFAULT_FIXTURE_DIR, latency=0.05, errorRate=0.0, verbose=False):
+    """
+    ローカルの FixtureServer に対して check_and_notify() を実行し、
+    初回 (キャッシュなし) と2回目 (キャッシュあり) の所要時間・リクエスト数を計測する
+    """
+    import check_races_batch
+
+    shift = _deadlineShift(fixtureDir, check_races_batch.MIN_OFFSET, check_races_batch.MAX_OFFSET)
+    server = FixtureServer(fixtureDir, latency=latency, errorRate=errorRate,
+                           timeShiftMinutes=shift, seed=0).start()
+    savedEnv = dict(os.environ)
+    savedCwd = os.getcwd()
+    results = {}
+    try:
+        os.environ['BOATRACE_BASE_URL'] = server.baseUrl
+        os.environ['DISCORD_WEBHOOK_URL'] = server.webhookUrl
+        # ベンチマークではスプレッドシートに書き込まない
+        os.environ.pop('GOOGLE_SHEETS_CREDENTIALS', None)
+        os.environ.pop('GOOGLE_SHEET_KEY', None)
+
+        with tempfile.TemporaryDirectory() as workDir:
+            # logs/ や cache/ は一時ディレクトリに作らせる
+            os.chdir(workDir)
+            for label in ('cold', 'warm'):
+                server.resetCounts()
+                output = io.StringIO()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(sys.stdout if verbose else output):
+                    check_races_batch.check_and_notify()
+                elapsed = time.perf_counter() - start
+
+                counts = server.requestCounts
+                results[f"batch.{label}.total_seconds"] = round(elapsed, 3)
+                results[f"batch.{label}.total_requests"] = sum(
+                    counts[k] for k in ('index', 'raceindex', 'oddstf'))
+                for pageType in ('index', 'raceindex', 'oddstf'):
+                    results[f"batch.{label}.{pageType}_requests"] = counts[pageType]
+                results[f"batch.{label}.not_modified"] = counts['notModified']
+                results[f"batch.{label}.webhook_posts"] = counts['webhook']
+    finally:
+        os.chdir(savedCwd)
+        os.environ.clear()
+        os.environ.update(savedEnv)
+        server.stop()
+    return results
+
+
+def benchWindowScan(stadiums=24, races=12, days=7):
+    """
+    架空の複数日分のスケジュールでインデックスの作成時間と、1分ごとの範囲検索の速さを計測する
+    (check_and_notify / RaceMonitor が毎回行う「通知範囲のレースの抽出」に相当)
+    """
+    from schedule_index import ScheduleIndex
+    from synthetic_pages import generateDays
+
+    records = []
+    for day in generateDays(datetime.date.today(), days, stadiums=stadiums, racesPerStadium=races):
+        records.extend(day.races)
+
+    start = time.perf_counter()
+    index = ScheduleIndex(records)
+    buildSeconds = time.perf_counter() - start
+
+    # 全期間を1分刻みで走査する
+    first = datetime.datetime.combine(datetime.date.today(), datetime.time(0, 0))
+    scans = days * 24 * 60
+    found = 0
+    start = time.perf_counter()
+    for minute in range(scans):
+        found += len(index.window(first + datetime.timedelta(minutes=minute), 3, 18))
+    scanSeconds = time.perf_counter() - start
+
+    return {
+        'scale.index.races': len(records),
+        'scale.index.build_ms': round(buildSeconds * 1000, 3),
+        'scale.window_scan.per_scan_ms': round(scanSeconds / scans * 1000, 4),
+        'scale.window_scan.races_per_second': round(found / scanSeconds),
+    }
+
+
+def benchScale(stadiums=24, races=12, latency=0.05, errorRate=0.0, verbose=False):
+    """
+    締切が集中する架空の1日分のページを FixtureServer で配信し、check_and_notify() 1回分の
+    スループット (オッズ確認・配送) と、通知が届くまでの最大の遅れを計測する
+    """
+    import check_races_batch
+    from synthetic_pages import SyntheticDay
+
+    results = {}
+    savedEnv = dict(os.environ)
+    savedCwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workDir:
+        # 通知範囲の中央に、全場のレースの締切を集中させる
+        now = datetime.datetime.now()
+        minOffset, maxOffset = check_races_batch.MIN_OFFSET, check_races_batch.MAX_OFFSET
+        burstAt = now + datetime.timedelta(minutes=(minOffset + maxOffset) / 2)
+        day = SyntheticDay(now.date(), stadiums=stadiums, racesPerStadium=races, burstAt=burstAt)
+        fixtureDir = os.path.join(workDir, 'pages')
+        day.writeFixtures(fixtureDir)
+
+        server = FixtureServer(fixtureDir, latency=latency, errorRate=errorRate, seed=0).start()
+        try:
+            os.environ['BOATRACE_BASE_URL'] = server.baseUrl
+            os.environ['DISCORD_WEBHOOK_URL'] = server.webhookUrl
+            os.environ.pop('GOOGLE_SHEETS_CREDENTIALS', None)
+            os.environ.pop('GOOGLE_SHEET_KEY', None)
+            os.chdir(workDir)
+
+            output = io.StringIO()
+            runStart = time.time()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(sys.stdout if verbose else output):
+                check_races_batch.check_and_notify()
+            elapsed = time.perf_counter() - start
+
+            with open(os.path.join('logs', 'run_telemetry.jsonl'), 'r', encoding='utf-8') as f:
+                telemetry = json.loads(f.readlines()[-1])
+        finally:
+            os.chdir(savedCwd)
+            os.environ.clear()
+            os.environ.update(savedEnv)
+            server.stop()
+
+    stages = telemetry['stages']
+    counters = telemetry['counters']
+    oddsSeconds = stages.get('odds', {}).get('seconds', 0.0)
+    oddsRequests = server.requestCounts['oddstf']
+    notified = sum(items for _, items in server.webhookLog)
+    results.update({
+        'scale.batch.races': len(day.races),
+        'scale.batch.window_races': counters.get('races.window', 0),
+        'scale.batch.total_seconds': round(elapsed, 3),
+        'scale.batch.odds_seconds': round(oddsSeconds, 3),
+        'scale.batch.odds_checks_per_second': round(oddsRequests / oddsSeconds, 1) if oddsSeconds else 0,
+        'scale.batch.odds_deferred': counters.get('odds.deferred', 0),
+        'scale.batch.notify_seconds': round(stages.get('notify', {}).get('seconds', 0.0), 3),
+        'scale.batch.notifications': notified,
+        'scale.batch.webhook_posts': len(server.webhookLog),
+        # 実行開始から最後の通知が Webhook に届くまでの時間 (締切が集中した場合の最悪の遅れ)
+        'scale.batch.max_notify_lag_seconds': round(max((t for t, _ in server.webhookLog), default=runStart) - runStart, 3),
+    })
+    return results
+
+
+def findRegressions(results, baseline, tolerance):
+    """
+    ベースラインより tolerance (割合) 以上悪化した指標を返す
+    """
+    regressions = []
+    for key, value in results.items():
+        base = baseline.get(key)
+        if base is None or not key.endswith(LOWER_IS_BETTER):
+            continue
+        if value > base * (1 + tolerance) and value - base > 1e-3:
+            regressions.append((key, base, value))
+    return regressions
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="保存済みページを使ったオフラインベンチマーク")
+    argParser.add_argument('suite', nargs='?', choices=('parse', 'batch', 'scale', 'all'), default='all')
+    argParser.add_argument('--fixtures', default=DEFAULT_FIXTURE_DIR, help="保存済みページのディレクトリ")
+    argParser.add_argument('--repeat', type=int, default=20, help="解析ベンチマークの繰り返し回数")
+    argParser.add_argument('--latency', type=float, default=0.05, help="ローカルサーバーの応答遅延(秒)")
+    argParser.add_argument('--error-rate', type=float, default=0.0, help="ローカルサーバーが503を返す確率")
+    argParser.add_argument('--json', help="結果をJSONで保存するパス")
+    argParser.add_argument('--baseline', help="比較対象の結果JSON。悪化していれば終了コード1")
+    argParser.add_argument('--tolerance', type=float, default=0.25, help="許容する悪化の割合")
+    argParser.add_argument('--verbose', action='store_true', help="バッチ実行時のログを表示する")
+    argParser.add_argument('--stadiums', type=int, default=24, help="規模ベンチマークの開催場数")
+    argParser.add_argument('--races', type=int, default=12, help="規模ベンチマークの1場あたりのレース数")
+    argParser.add_argument('--days', type=int, default=7, help="範囲検索ベンチマークの日数")
+    args = argParser.parse_args()
+
+    results = {}
+    if args.suite in ('parse', 'all'):
+        results.update(benchParse(args.fixtures, args.repeat))
+    if args.suite in ('batch', 'all'):
+        results.update(benchBatch(args.fixtures, args.latency, args.error_rate, args.verbose))
+    if args.suite in ('scale', 'all'):
+        results.update(benchWindowScan(args.stadiums, args.races, args.days))
+        results.update(benchScale(args.stadiums, args.races, args.latency, args.error_rate, args.verbose))
+
+    for key, value in results.items():
+        print(f"{key:<45} {value}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = findRegressions(results, baseline, args.tolerance)
+        for key, base, value in regressions:
+            print(f"悪化: {key} {base} -> {value}")
+        sys.exit(1 if regressions else 0)
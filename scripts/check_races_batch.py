@@ -1,6 +1,15 @@
 import datetime
 from schedule_fetcher import ScheduleFetcher
+from schedule_cache import ScheduleCache
+from schedule_index import ScheduleIndex
 from race_notifier import RaceNotifier
+from notification_log import buildLogRow
+from notification_outbox import NotificationOutbox, buildSinks
+from race_state import RaceStateStore
+from alert_rules import RaceOdds, RuleEngine
+from fetch_planner import FetchPlanner, REASON_NOTIFIED, REASON_RECHECK
+from telemetry import Telemetry, DEFAULT_TELEMETRY_PATH, DEFAULT_PROMETHEUS_PATH
+import json
 import os
 import sys
 
@@ -13,11 +22,20 @@ import sys
 # XX:15実行: 18分後〜33分後
 # ...
 # これにより、常に「3分前〜18分前」の範囲にあるレースを検知して通知する。
-# 重複通知を防ぐため、このスクリプトはステートレス（状態を持たない）だが、
-# 実行頻度(15分)とチェック範囲(15分幅)を調整して漏れなくカバーする。
+#
+# 判定結果・通知状況は RaceStateStore (cache/race_state.sqlite3) に保存するため、
+# 実行間隔を2〜5分に縮めてチェック範囲が重なっても重複通知はされず、
+# 判定済みのレースはオッズを再取得しない。トリガーが1回抜けても次の実行で拾える。
+# (範囲は環境変数 NOTIFY_MIN_OFFSET / NOTIFY_MAX_OFFSET で変更可能)
 
-MIN_OFFSET = 3
-MAX_OFFSET = 18
+MIN_OFFSET = int(os.environ.get('NOTIFY_MIN_OFFSET', '3'))
+MAX_OFFSET = int(os.environ.get('NOTIFY_MAX_OFFSET', '18'))
+
+# オッズ確認の制限時間(秒)。これを過ぎても取得できないレースは今回の通知対象外とする
+ODDS_CHECK_DEADLINE_SECONDS = 120
+
+# 終了前に通知の配送を待つ最大時間(秒)。送り切れなかった通知は送信待ちキューに残り、次回の実行で再送される
+OUTBOX_DRAIN_SECONDS = float(os.environ.get('OUTBOX_DRAIN_SECONDS', '30'))
 
 def check_and_notify():
     # 環境変数からWebhook URLを取得 (GitHub Secrets対応)
@@ -32,136 +50,162 @@ def check_and_notify():
     notifier = RaceNotifier()
     notifier.discordWebhookUrl = webhook_url
 
+    # 通知は送信待ちキュー (cache/notification_outbox.sqlite3) に書き込み、送信先ごとのスレッドが非同期に配送する。
+    # 前回の実行で送れなかった通知は、スケジュール・オッズの取得と並行してここから再送される。
+    # (通知履歴 (logs/notification_history.sqlite3)・スプレッドシートも送信先の1つ。スプレッドシートは GOOGLE_SHEETS_CREDENTIALS / GOOGLE_SHEET_KEY 設定時のみ)
+    outbox = NotificationOutbox(buildSinks(notifier)).start()
+
     print("Fetching today's schedule...")
-    fetcher = ScheduleFetcher()
-    schedules = fetcher.fetchAllSchedules()
+    # 処理段階ごとの所要時間・リクエスト数・キャッシュヒット数などを計測する
+    telemetry = Telemetry()
+    fetcher = ScheduleFetcher(telemetry=telemetry)
+    # 当日のスケジュールはほぼ変わらないため、ディスクキャッシュ経由で取得する
+    # (SCHEDULE_CACHE_TTL_MINUTES 経過時 or 開催情報の変更検知時のみ再取得)
+    with telemetry.stage('schedule'):
+        schedules = ScheduleCache().getSchedules(fetcher)
     
     now = datetime.datetime.now()
     print(f"Current time: {now.strftime('%H:%M:%S')}")
     
     notify_count = 0
-    
-    # ディレクトリ作成 (念のため)
-    os.makedirs('logs', exist_ok=True)
-    log_file = 'logs/notification_history.csv'
-    
-    # CSVヘッダー書き込み (ファイルが存在しない場合のみ)
-    if not os.path.exists(log_file):
-        with open(log_file, 'w', encoding='utf-8') as f:
-            f.write('ActionTime,RaceDate,STADIUM_code,Stadium_name,RaceNo,DeadlineTime,MinutesLeft\n')
-
-    # スプレッドシート設定読み込み
-    google_creds_json = os.environ.get('GOOGLE_SHEETS_CREDENTIALS')
-    google_sheet_key = os.environ.get('GOOGLE_SHEET_KEY')
-    sheet_client = None
-    target_sheet = None
-
-    if google_creds_json and google_sheet_key:
-        try:
-            import gspread
-            from oauth2client.service_account import ServiceAccountCredentials
-            import json
-            
-            # JSON文字列から認証情報をロード
-            creds_dict = json.loads(google_creds_json)
-            scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
-            creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
-            sheet_client = gspread.authorize(creds)
-            
-            # シートを開く
-            workbook = sheet_client.open_by_key(google_sheet_key)
-            # 最初のシートを取得、なければ作成等のエラーハンドリングはあえてシンプルにする
-            target_sheet = workbook.sheet1
-            print("Successfully connected to Google Spreadsheet.")
-            
-            # ヘッダーチェック (A1セルが空なら書き込む)
-            if not target_sheet.cell(1, 1).value:
-                target_sheet.append_row(['ActionTime', 'RaceDate', 'STADIUM_code', 'Stadium_name', 'RaceNo', 'DeadlineTime', 'MinutesLeft'])
-                
-        except Exception as e:
-            print(f"Warning: Failed to connect to Google Sheets: {e}")
+
+    # 時間範囲に入っているレースを締切時刻のインデックスから取り出す (締切の早い順)
+    window_races = ScheduleIndex(schedules).window(now, MIN_OFFSET, MAX_OFFSET)
+
+    for race in window_races:
+        minutes_left = (race.deadlineDatetime - now).total_seconds() / 60
+        print(f"Match time: {race.stadium} {race.raceNo}R (Remaining: {minutes_left:.1f} min)")
+
+    # 前回までの実行で判定済み・通知済みのレースはオッズを再取得しない。
+    # 取得するレースは FetchPlanner が締切の近さと判定の不確かさで選ぶ (ODDS_FETCH_BUDGET 件まで)。
+    # 該当しなかったレースも、1番人気の差が小さければ通知範囲を外れる直前にもう一度確認する。
+    state_store = RaceStateStore()
+    states = state_store.getStates(window_races)
+    planner = FetchPlanner(MIN_OFFSET)
+    planned, deferred_races, skipped = planner.plan(window_races, states, now)
+
+    for race, reason in skipped:
+        if reason == REASON_NOTIFIED:
+            print(f"  Already notified: {race.stadium} {race.raceNo}R")
+        else:
+            print(f"  Already checked (no alert rule matched): {race.stadium} {race.raceNo}R")
+        telemetry.increment('race_state.hits')
+    for race, reason in planned:
+        if reason == REASON_RECHECK:
+            print(f"  Re-checking borderline race: {race.stadium} {race.raceNo}R")
+    if deferred_races:
+        print(f"Odds fetch budget ({planner.budget}) exceeded. Deferred {len(deferred_races)} races to the next run.")
+    telemetry.increment('odds.rechecked', sum(1 for _, reason in planned if reason == REASON_RECHECK))
+    telemetry.increment('odds.deferred', len(deferred_races))
+    races_to_check = [race for race, _ in planned]
+
+    # オッズページは1レースにつき1回だけ取得・解析し、全ての通知ルールをまとめて評価する
+    rule_engine = RuleEngine()
+    print(f"Checking odds for {len(races_to_check)} races ({len(rule_engine.rules)} rules)...")
+    with telemetry.stage('odds'):
+        odds_results, timed_out_races = fetcher.fetchWinOddsConcurrent(
+            races_to_check, timeoutSeconds=ODDS_CHECK_DEADLINE_SECONDS
+        )
+    telemetry.increment('races.window', len(window_races))
+    telemetry.increment('races.odds_timed_out', len(timed_out_races))
 
     # 通知対象レースを収集するリスト
     races_to_notify = []
     
-    for race in schedules:
-        deadline_dt = race['deadlineDatetime']
-        time_diff = deadline_dt - now
-        minutes_left = time_diff.total_seconds() / 60
+    # 締切の早い順に判定結果を確認する
+    for race, odds_map in odds_results:
+        raceNo = race.raceNo
+        minutes_left = (race.deadlineDatetime - now).total_seconds() / 60
         
-        # チェック範囲に入っているか
-        if MIN_OFFSET <= minutes_left < MAX_OFFSET:
-            print(f"Match time: {race['stadium']} {race['raceNo']}R (Remaining: {minutes_left:.1f} min)")
-            
-            # オッズチェック (1号艇が1番人気でないか)
-            jcd = race.get('jcd')
-            raceNo = race.get('raceNo')
-            
-            # 日付またぎ対応 (念のため)
-            race_date = deadline_dt.strftime('%Y%m%d')
-            
-            print(f"  Checking odds for {race['stadium']} {raceNo}R...")
-            is_favorite = fetcher.check1stBoatPopularity(jcd, raceNo, race_date)
-            
-            if is_favorite is None:
-                print(f"  -> Failed to fetch odds. Skipping.")
-                continue
-                
-            if is_favorite:
-                print(f"  -> Skipped: 1st boat IS the favorite.")
-                continue
-            
-            print(f"  -> Good! 1st boat is NOT the favorite. Adding to notification queue.")
+        # 日付またぎ対応 (念のため)
+        race_date = race.deadlineDatetime.strftime('%Y%m%d')
+        
+        print(f"  Odds for {race.stadium} {raceNo}R:")
+        
+        if not odds_map:
+            print(f"  -> Failed to fetch odds. Skipping.")
+            continue
+
+        race_odds = RaceOdds(odds_map)
+        matched_rules = rule_engine.evaluate(race_odds)
+        state_store.recordVerdict(race, bool(matched_rules), race_odds.favoriteMargin())
             
-            # 通知対象レースとして保存
-            races_to_notify.append({
-                'race': race,
-                'minutes_left': minutes_left,
-                'race_date': race_date
-            })
+        if not matched_rules:
+            print(f"  -> Skipped: no alert rule matched.")
+            continue
+        
+        print(f"  -> Good! Matched: {', '.join(rule.name for rule in matched_rules)}. Adding to notification queue.")
+        
+        # 通知対象レースとして保存
+        races_to_notify.append({
+            'race': race,
+            'minutes_left': minutes_left,
+            'race_date': race_date,
+            'odds': race_odds,
+            'rules': matched_rules
+        })
+
+    # 制限時間内にオッズを取得できなかったレースは別途報告する
+    if timed_out_races:
+        print(f"Odds check timed out ({ODDS_CHECK_DEADLINE_SECONDS}s) for {len(timed_out_races)} races:")
+        for race in timed_out_races:
+            print(f"  - {race.stadium} {race.raceNo}R (締切 {race.deadlineTime})")
     
     # 残り時間の短い順にソート
     races_to_notify.sort(key=lambda x: x['minutes_left'])
+
+    # 送信予約を取れたレースのみ送信する (重なって動いている他の実行との二重送信防止)
+    races_to_notify = [r for r in races_to_notify if state_store.claimNotification(r['race'])]
     
-    # ソートされた順に通知を送信
+    # ソートされた順に通知メッセージを作成し、送信待ちキューに書き込む
     for race_info in races_to_notify:
         race = race_info['race']
         minutes_left = race_info['minutes_left']
         race_date = race_info['race_date']
-        raceNo = race.get('raceNo')
+        raceNo = race.raceNo
         
         # 出走表URLを生成
-        race_url = f"https://www.boatrace.jp/owpc/pc/race/racelist?rno={raceNo}&jcd={int(race['jcd']):02d}&hd={race_date}"
+        race_url = f"https://www.boatrace.jp/owpc/pc/race/racelist?rno={raceNo}&jcd={int(race.jcd):02d}&hd={race_date}"
         
-        msg = f"{race['stadium']} {race['raceNo']}R\n締切: {race['deadlineTime']} (残り約{int(minutes_left)}分)\n🌊 波乱レース予報（1号艇が1番人気以外）🌊\n{race_url}"
-        title = f"⚡ 波乱レース ({int(minutes_left)}分前)"
-        
-        success = notifier.sendNotification(msg, title)
-        if success:
-            notify_count += 1
-            
-            # ローカルCSVログ保存
-            try:
-                with open(log_file, 'a', encoding='utf-8') as f:
-                    # ActionTime, RaceDate, STADIUM_code, Stadium_name, RaceNo, DeadlineTime, MinutesLeft
-                    action_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    log_line = f"{action_time},{race_date},{race['jcd']},{race['stadium']},{raceNo},{race['deadlineTime']},{minutes_left:.1f}\n"
-                    f.write(log_line)
-                print(f"  -> Log saved to {log_file}")
-            except Exception as e:
-                print(f"  -> Failed to save log: {e}")
-            
-            # スプレッドシートログ保存
-            if target_sheet:
-                try:
-                    action_time = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    row_data = [action_time, race_date, race['jcd'], race['stadium'], raceNo, race['deadlineTime'], f"{minutes_left:.1f}"]
-                    target_sheet.append_row(row_data)
-                    print(f"  -> Log saved to Google Sheet")
-                except Exception as e:
-                    print(f"  -> Failed to save to Google Sheet: {e}")
+        # 該当したルールのテンプレートで通知文を作る
+        notification = rule_engine.buildNotification(
+            race_info['rules'], race, race_info['odds'], minutes_left, race_url
+        )
+        notification['logRow'] = buildLogRow(race, race_date, minutes_left)
+
+        # 締切を過ぎた通知は送らない (通知履歴には記録する)。
+        # キューに書き込んだ時点で配送は outbox が引き継ぐため、通知済みとして記録する
+        race_key = '_'.join(str(v) for v in RaceStateStore.raceKey(race))
+        outbox.enqueue(notification, raceKey=race_key, expiresAt=race.deadline)
+        state_store.markNotified(race)
+        notify_count += 1
+        print(f"  -> Queued: {race.stadium} {raceNo}R")
+
+    # 配送を最大 OUTBOX_DRAIN_SECONDS 秒待つ (前回の実行からの再送分を含む)
+    with telemetry.stage('notify'):
+        delivery = outbox.close(timeout=OUTBOX_DRAIN_SECONDS)
+
+    telemetry.increment('notifications.queued', notify_count)
+    for sink_name, sink_stats in delivery.items():
+        print(f"Outbox [{sink_name}]: {sink_stats['delivered']} delivered, {sink_stats['retried']} retried, "
+              f"{sink_stats['expired']} expired, {sink_stats['dead']} dead, {sink_stats['pending']} pending")
+        for key, value in sink_stats.items():
+            telemetry.increment(f"outbox.{sink_name}.{key}", value)
+
+    state_store.purge()
+    state_store.close()
     
-    print(f"Done. Sent {notify_count} notifications.")
+    stats = fetcher.fetchStats
+    print(f"HTTP: {stats['requests']} requests ({stats['attempts']} attempts, {stats['notModified']} not modified, "
+          f"{stats['failures']} failed), {stats['bytes'] / 1024:.0f} KB, {stats['elapsed']:.1f}s total, "
+          f"{stats['cacheHits']} served from response cache")
+    print(f"Done. Queued {notify_count} notifications.")
+
+    # 実行ごとの計測サマリーを出力する (日ごとの推移確認用に JSON Lines で追記)
+    summary = telemetry.writeJson(DEFAULT_TELEMETRY_PATH)
+    print(f"Telemetry: {json.dumps(summary, ensure_ascii=False)}")
+    if DEFAULT_PROMETHEUS_PATH:
+        telemetry.writePrometheus(DEFAULT_PROMETHEUS_PATH)
 
 if __name__ == "__main__":
     check_and_notify()
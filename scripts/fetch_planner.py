@@ -0,0 +1,96 @@
+import datetime
+import os
+from race_state import RaceStateStore, VERDICT_NO_ALERT
+
+# 1回の実行で取得するオッズページ数の上限 (公式サイトへのリクエスト数の上限)
+DEFAULT_ODDS_BUDGET = int(os.environ.get('ODDS_FETCH_BUDGET', '30'))
+# 1番人気の余裕 (RaceOdds.favoriteMargin) がこれ未満のレースは、判定が入れ替わりうるとみなして再確認する
+DEFAULT_BORDERLINE_MARGIN = float(os.environ.get('ODDS_RECHECK_MARGIN', '0.2'))
+# 通知範囲の下限 (MIN_OFFSET) からこの時間(分)以内に締切を迎えるレースを再確認の対象にする
+DEFAULT_RECHECK_MINUTES = float(os.environ.get('ODDS_RECHECK_MINUTES', '5'))
+# 同じレースを再確認する最短の間隔(分)
+DEFAULT_RECHECK_INTERVAL_MINUTES = float(os.environ.get('ODDS_RECHECK_INTERVAL_MINUTES', '2'))
+
+REASON_NEW = 'new'           # 未判定
+REASON_RETRY = 'retry'       # 該当したが未通知 (前回の送信失敗など)
+REASON_RECHECK = 'recheck'   # 該当しなかったが、判定が入れ替わりうる
+REASON_NOTIFIED = 'notified' # 通知済み
+REASON_SETTLED = 'settled'   # 該当せず、判定が入れ替わる見込みも小さい
+
+
+class FetchPlanner:
+    """
+    オッズを取得するレースと順番を、取得数の上限 (budget) の中で決めるクラス
+
+    優先度 = 締切の近さ × 判定の不確かさ
+      - 締切の近さ: 通知範囲の下限 (minOffset) までの残り時間が短いほど高い (次の実行では範囲外になるため)
+      - 不確かさ: 未判定のレースは 1。該当しなかったレースは1番人気の余裕が小さいほど高く、
+        余裕が borderlineMargin 以上なら再確認しない
+    該当しなかったレースの再確認は、通知範囲の下限の直前 (recheckMinutes 以内) にだけ行う。
+    上限を超えたレースは今回は取得せず、次の実行に回す。
+    """
+    def __init__(self, minOffset, budget=DEFAULT_ODDS_BUDGET, borderlineMargin=DEFAULT_BORDERLINE_MARGIN,
+                 recheckMinutes=DEFAULT_RECHECK_MINUTES, recheckIntervalMinutes=DEFAULT_RECHECK_INTERVAL_MINUTES):
+        self.minOffset = minOffset
+        self.budget = budget
+        self.borderlineMargin = borderlineMargin
+        self.recheckMinutes = recheckMinutes
+        self.recheckIntervalMinutes = recheckIntervalMinutes
+
+    def classify(self, race, state, now):
+        """
+        レースを取得する理由 (取得しない場合はその理由) を返す
+        """
+        if not state or state['verdict'] is None:
+            return REASON_NEW
+        if state['notified_at']:
+            return REASON_NOTIFIED
+        if state['verdict'] != VERDICT_NO_ALERT:
+            return REASON_RETRY
+
+        margin = state.get('margin')
+        if margin is None or margin >= self.borderlineMargin:
+            return REASON_SETTLED
+        minutesLeft = (race.deadlineDatetime - now).total_seconds() / 60
+        if minutesLeft - self.minOffset >= self.recheckMinutes:
+            return REASON_SETTLED
+        if state['checked_at']:
+            checkedAt = datetime.datetime.fromisoformat(state['checked_at'])
+            if (now - checkedAt).total_seconds() / 60 < self.recheckIntervalMinutes:
+                return REASON_SETTLED
+        return REASON_RECHECK
+
+    def priority(self, race, state, reason, now):
+        minutesLeft = (race.deadlineDatetime - now).total_seconds() / 60
+        urgency = 1.0 / (1.0 + max(0.0, minutesLeft - self.minOffset))
+        if reason == REASON_RECHECK:
+            return urgency * (1.0 - state['margin'] / self.borderlineMargin)
+        return urgency
+
+    def plan(self, races, states, now):
+        """
+        Args:
+            races (list): 通知範囲内のレース (RaceRecord)
+            states (dict): RaceStateStore.getStates() の結果
+            now (datetime): 現在時刻
+
+        Returns:
+            tuple: (fetch, deferred, skipped)
+                fetch: [(race, reason), ...] 今回取得するレース (優先度の高い順)
+                deferred: [race, ...] 上限を超えたため次の実行に回すレース (優先度の高い順)
+                skipped: [(race, reason), ...] 取得の必要がないレース
+        """
+        candidates = []
+        skipped = []
+        for race in races:
+            state = states.get(RaceStateStore.raceKey(race))
+            reason = self.classify(race, state, now)
+            if reason in (REASON_NOTIFIED, REASON_SETTLED):
+                skipped.append((race, reason))
+            else:
+                candidates.append((self.priority(race, state, reason, now), race, reason))
+
+        candidates.sort(key=lambda c: (-c[0], c[1].deadline))
+        fetch = [(race, reason) for _, race, reason in candidates[:self.budget]]
+        deferred = [race for _, race, _ in candidates[self.budget:]]
+        return fetch, deferred, skipped
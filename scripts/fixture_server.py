@@ -0,0 +1,248 @@
+import argparse
+import collections
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# 保存済みページ (record_fixtures.py で収集) の既定の置き場所
+DEFAULT_FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'fixtures', 'pages')
+
+# raceindex ページの締切時刻セル
+DEADLINE_PATTERN = re.compile(r'<td>(\d{2}):(\d{2})</td>')
+
+
+class FixtureServer:
+    """
+    保存済みページを公式サイトの代わりに返すローカルHTTPサーバー (ベンチマーク・動作確認用)
+
+    fixtures/pages/<hd>/ 以下の index.html / raceindex_jcdXX.html / oddstf_jcdXX_rnoYY.html
+    (/ raceresult_jcdXX_rnoYY.html) を
+    公式サイトと同じURL (…/race/index?hd=… など) で返す。
+    ScheduleFetcher は環境変数 BOATRACE_BASE_URL に baseUrl を設定すればこのサーバーを参照する。
+    また、POST /webhook は Discord Webhook の代わりに 204 を返す。
+    """
+    def __init__(self, fixtureDir=DEFAULT_FIXTURE_DIR, host='127.0.0.1', port=0,
+                 latency=0.0, jitter=0.0, errorRate=0.0, anyDate=True, timeShiftMinutes=0, seed=None):
+        """
+        Args:
+            fixtureDir (str): 保存済みページのディレクトリ
+            latency (float): 各レスポンスに加える遅延(秒)
+            jitter (float): 遅延に加えるランダム幅(秒)
+            errorRate (float): 503 (Retry-After付き) を返す確率 (0〜1)
+            anyDate (bool): Trueなら要求された hd に関係なく保存済みの日付のページを返す
+            timeShiftMinutes (int): raceindex の締切時刻をずらす分数 (現在時刻付近にレースを寄せる用)
+            seed (int, optional): 遅延・エラー発生の乱数シード
+        """
+        self.fixtureDir = fixtureDir
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.anyDate = anyDate
+        self.timeShiftMinutes = timeShiftMinutes
+        self.random = random.Random(seed)
+        # ページ種別ごとの受信リクエスト数
+        self.requestCounts = collections.Counter()
+        # 受信した Webhook の (受信時刻, 通知件数)。通知の遅れの計測用
+        self.webhookLog = []
+        self._lock = threading.Lock()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server._handleGet(self)
+
+            def do_POST(self):
+                server._handlePost(self)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def baseUrl(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/owpc/pc/race"
+
+    @property
+    def webhookUrl(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/webhook"
+
+    def start(self):
+        """
+        バックグラウンドスレッドでサーバーを起動する
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def resetCounts(self):
+        with self._lock:
+            self.requestCounts.clear()
+            self.webhookLog.clear()
+
+    def availableDates(self):
+        if not os.path.isdir(self.fixtureDir):
+            return []
+        return sorted(d for d in os.listdir(self.fixtureDir) if os.path.isdir(os.path.join(self.fixtureDir, d)))
+
+    def _count(self, key):
+        with self._lock:
+            self.requestCounts[key] += 1
+
+    def _simulateNetwork(self):
+        """
+        遅延・エラーを発生させる。エラーにする場合は True
+        """
+        with self._lock:
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+            failed = self.random.random() < self.errorRate
+        if delay > 0:
+            time.sleep(delay)
+        return failed
+
+    def _handlePost(self, handler):
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length)
+        self._count('webhook')
+        if self._simulateNetwork():
+            self._sendError(handler, 503)
+            return
+        try:
+            # Discord 形式なら embeds 1件が通知1件
+            items = len(json.loads(body).get('embeds') or [None])
+        except (ValueError, AttributeError):
+            items = 1
+        with self._lock:
+            self.webhookLog.append((time.time(), items))
+        handler.send_response(204)
+        handler.end_headers()
+
+    def _handleGet(self, handler):
+        parsed = urlparse(handler.path)
+        pageType = parsed.path.rstrip('/').rsplit('/', 1)[-1]
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        self._count(pageType)
+
+        if self._simulateNetwork():
+            self._sendError(handler, 503)
+            return
+
+        body = self._loadPage(pageType, params)
+        if body is None:
+            self._sendError(handler, 404)
+            return
+
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if handler.headers.get('If-None-Match') == etag:
+            self._count('notModified')
+            handler.send_response(304)
+            handler.send_header('ETag', etag)
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/html; charset=UTF-8')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.send_header('ETag', etag)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _sendError(self, handler, status):
+        handler.send_response(status)
+        if status == 503:
+            handler.send_header('Retry-After', '1')
+        handler.send_header('Content-Length', '0')
+        handler.end_headers()
+
+    def _loadPage(self, pageType, params):
+        """
+        リクエストに対応する保存済みページを返す。該当なしなら None
+        """
+        dates = self.availableDates()
+        hd = params.get('hd')
+        if hd not in dates:
+            if not self.anyDate or not dates:
+                return None
+            hd = dates[-1]
+        dateDir = os.path.join(self.fixtureDir, hd)
+
+        if pageType == 'index':
+            path = os.path.join(dateDir, 'index.html')
+        elif pageType == 'raceindex':
+            path = os.path.join(dateDir, f"raceindex_jcd{params.get('jcd', '')}.html")
+        elif pageType == 'oddstf':
+            path = self._oddsPath(dateDir, params)
+        elif pageType == 'raceresult':
+            try:
+                path = os.path.join(dateDir, f"raceresult_jcd{int(params.get('jcd', '')):02d}_rno{int(params.get('rno', '')):02d}.html")
+            except ValueError:
+                return None
+        else:
+            return None
+
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            body = f.read()
+
+        if pageType == 'raceindex' and self.timeShiftMinutes:
+            body = self._shiftDeadlines(body)
+        return body
+
+    def _oddsPath(self, dateDir, params):
+        """
+        オッズページのパスを返す。該当レースが保存されていなければ、保存済みの中から決まった1件を使う
+        """
+        try:
+            jcd = int(params.get('jcd', ''))
+            rno = int(params.get('rno', ''))
+        except ValueError:
+            return None
+        path = os.path.join(dateDir, f"oddstf_jcd{jcd:02d}_rno{rno:02d}.html")
+        if os.path.exists(path):
+            return path
+        candidates = sorted(f for f in os.listdir(dateDir) if f.startswith('oddstf_'))
+        if not candidates:
+            return None
+        return os.path.join(dateDir, candidates[(jcd * 13 + rno) % len(candidates)])
+
+    def _shiftDeadlines(self, body):
+        def shift(m):
+            minutes = (int(m.group(1)) * 60 + int(m.group(2)) + self.timeShiftMinutes) % (24 * 60)
+            return f"<td>{minutes // 60:02d}:{minutes % 60:02d}</td>"
+        return DEADLINE_PATTERN.sub(shift, body.decode('utf-8')).encode('utf-8')
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="保存済みページを返すローカルHTTPサーバー")
+    argParser.add_argument('--fixtures', default=DEFAULT_FIXTURE_DIR, help="保存済みページのディレクトリ")
+    argParser.add_argument('--port', type=int, default=8080)
+    argParser.add_argument('--latency', type=float, default=0.0, help="レスポンス遅延(秒)")
+    argParser.add_argument('--jitter', type=float, default=0.0, help="遅延のランダム幅(秒)")
+    argParser.add_argument('--error-rate', type=float, default=0.0, help="503を返す確率 (0〜1)")
+    argParser.add_argument('--time-shift', type=int, default=0, help="締切時刻をずらす分数")
+    args = argParser.parse_args()
+
+    fixtureServer = FixtureServer(args.fixtures, port=args.port, latency=args.latency, jitter=args.jitter,
+                                  errorRate=args.error_rate, timeShiftMinutes=args.time_shift)
+    print(f"BOATRACE_BASE_URL={fixtureServer.baseUrl}")
+    print(f"DISCORD_WEBHOOK_URL={fixtureServer.webhookUrl}")
+    try:
+        fixtureServer.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n停止しました。")
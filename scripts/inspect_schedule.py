@@ -1,20 +1,21 @@
-import requests
 from bs4 import BeautifulSoup
 import datetime
+from schedule_fetcher import ScheduleFetcher
 
 # 調査日時（本日）
 date_str = datetime.datetime.now().strftime('%Y%m%d')
-baseUrl = "https://www.boatrace.jp/owpc/pc/race"
 
-# User-Agentヘッダー（アクセス拒否回避用）
-headers = {
-    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-}
+# 公式サイトへのアクセスは ScheduleFetcher 経由で行う
+# (User-Agent・リトライ・送信間隔の制御に加え、他のスクリプトと共通のレスポンスキャッシュを使う)
+fetcher = ScheduleFetcher()
+baseUrl = fetcher.baseUrl
 
 # 1. 下関(19)のレース一覧ページを直接取得
 urlIndex = f"{baseUrl}/raceindex?jcd=19&hd={date_str}"
 print(f"下関ページ取得中: {urlIndex}")
-resp = requests.get(urlIndex, headers=headers)
+resp, _ = fetcher.fetchPage(urlIndex)
+if resp is None:
+    raise SystemExit(f"取得失敗: {urlIndex}")
 soup = BeautifulSoup(resp.content, 'html.parser')
 
 # 直接詳細解析へ
@@ -1,7 +1,14 @@
+import argparse
+import heapq
+import itertools
+import threading
 import time
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from schedule_fetcher import ScheduleFetcher
+from schedule_index import ScheduleIndex
 from race_notifier import RaceNotifier
+from alert_rules import RaceOdds, RuleEngine
 
 class RaceMonitor:
     """
@@ -15,16 +22,29 @@ class RaceMonitor:
     def __init__(self):
         self.fetcher = ScheduleFetcher()
         self.notifier = RaceNotifier()
+        self.ruleEngine = RuleEngine() # デーモンモードで使う通知条件
         self.schedules = []
+        self.scheduleIndex = ScheduleIndex() # 締切時刻順のインデックス (範囲検索用)
         self.notifiedRaces = set() # 通知済みレースのID (jcd_rno) を保持
         self.notificationOffsetMinutes = 3 # 何分前に通知するか
 
+        # デーモンモード用の状態
+        self._eventQueue = [] # (実行時刻, 連番, レースID) の優先度付きキュー
+        self._sequence = itertools.count()
+        self._racesById = {} # レースID -> 最新のレース情報
+        self._checkedRaces = {} # レースID -> オッズ確認済みのレースの締切時刻 (締切が変わらない限り再登録しない)
+        self._pendingSchedules = None # 再取得スレッドから受け取った最新スケジュール
+        self._lock = threading.Lock()
+        self._wakeEvent = threading.Event()
+        self._stopEvent = threading.Event()
+
     def initialize(self):
         """
         起動時のデータ読み込み
         """
         # 今日のスケジュールを取得
         self.schedules = self.fetcher.fetchAllSchedules()
+        self.scheduleIndex = ScheduleIndex(self.schedules)
         print(f"監視対象: Total {len(self.schedules)} レース")
 
     def run(self):
@@ -41,8 +61,8 @@ class RaceMonitor:
             while True:
                 self._checkAndNotify()
                 
-                # 次のチェックまで待機 (間隔は60秒)
-                time.sleep(60)
+                # 次のチェックまで待機 (最大60秒。次のレースが通知範囲に入る時刻が先に来ればそこまで)
+                time.sleep(self._secondsUntilNextWindow(60))
         except KeyboardInterrupt:
             print("\n監視を停止しました。")
 
@@ -52,14 +72,15 @@ class RaceMonitor:
         """
         now = datetime.datetime.now()
         
-        for race in self.schedules:
+        # 締切が「現在〜notificationOffsetMinutes 分後」のレースのみをインデックスから取り出す
+        for race in self.scheduleIndex.window(now, 0, self.notificationOffsetMinutes):
             # レース固有ID作成 (例: "02_01" -> 02場 1R)
-            raceId = f"{race['jcd']}_{race['raceNo']}"
+            raceId = f"{race.jcd}_{race.raceNo}"
             
             if raceId in self.notifiedRaces:
                 continue
             
-            headlineDt = race['deadlineDatetime']
+            headlineDt = race.deadlineDatetime
             
             # 締切までの残り時間（分）
             timeDiff = headlineDt - now
@@ -74,16 +95,176 @@ class RaceMonitor:
             
             if 0 < minutesLeft <= self.notificationOffsetMinutes:
                 # 通知メッセージ作成
-                msg = f"{race['stadium']} {race['raceNo']}R\n締切: {race['deadlineTime']} (残り約{int(minutesLeft)}分)"
+                msg = f"{race.stadium} {race.raceNo}R\n締切: {race.deadlineTime} (残り約{int(minutesLeft)}分)"
                 title = f"⏳ 締切{self.notificationOffsetMinutes}分前通知"
                 
                 # 通知送信
                 success = self.notifier.sendNotification(msg, title)
                 if success:
-                    print(f"通知完了: {raceId} - {msg.replace('\n', ' ')}")
+                    oneLineMsg = msg.replace('\n', ' ')
+                    print(f"通知完了: {raceId} - {oneLineMsg}")
                     self.notifiedRaces.add(raceId)
 
+    def _secondsUntilNextWindow(self, maxSeconds):
+        """
+        次のレースが通知範囲に入るまでの秒数 (maxSeconds を上限とする)
+        """
+        now = datetime.datetime.now()
+        nextDeadline = self.scheduleIndex.nextDeadline(now + datetime.timedelta(minutes=self.notificationOffsetMinutes))
+        if nextDeadline is None:
+            return maxSeconds
+        seconds = (nextDeadline - datetime.timedelta(minutes=self.notificationOffsetMinutes) - now).total_seconds()
+        return min(maxSeconds, max(1.0, seconds))
+
+    def runDaemon(self, refreshIntervalMinutes=30):
+        """
+        デーモンモードのメインループ。
+
+        締切時刻順の優先度付きキューを持ち、次のレースのチェック時刻 (締切 notificationOffsetMinutes 分前)
+        まで正確に待機してから、単勝オッズを確認して通知する (通知ルールに該当した場合のみ)。
+        スケジュールはバックグラウンドで refreshIntervalMinutes ごとに再取得し、再起動なしで反映する。
+        """
+        self._mergeSchedules(self.schedules)
+
+        refresher = threading.Thread(target=self._refreshLoop, args=(refreshIntervalMinutes,), daemon=True)
+        refresher.start()
+
+        print(f"デーモンモードで監視を開始します... (締切{self.notificationOffsetMinutes}分前にオッズ確認)")
+
+        # オッズ確認・通知は待機ループを止めないようワーカースレッドで行う
+        executor = ThreadPoolExecutor(max_workers=max(1, self.fetcher.maxWorkers))
+        try:
+            while not self._stopEvent.is_set():
+                with self._lock:
+                    pending = self._pendingSchedules
+                    self._pendingSchedules = None
+                if pending is not None:
+                    self._mergeSchedules(pending)
+
+                for race in self._popDueRaces():
+                    executor.submit(self._checkRaceOdds, race)
+
+                # 次のレースのチェック時刻まで待機 (スケジュール更新時は途中で起こされる)
+                timeout = self._secondsUntilNextEvent()
+                self._wakeEvent.wait(timeout)
+                self._wakeEvent.clear()
+        except KeyboardInterrupt:
+            print("\n監視を停止しました。")
+        finally:
+            self._stopEvent.set()
+            executor.shutdown(wait=False)
+
+    def _raceId(self, race):
+        return f"{race.deadlineDatetime.strftime('%Y%m%d')}_{race.jcd}_{race.raceNo}"
+
+    def _checkTime(self, race):
+        return race.deadlineDatetime - datetime.timedelta(minutes=self.notificationOffsetMinutes)
+
+    def _mergeSchedules(self, schedules):
+        """
+        スケジュールをキューに反映する。締切時刻が変わったレースは新しい時刻で登録し直す
+        """
+        now = datetime.datetime.now()
+        added = 0
+        # 締切を過ぎた確認済みのレースは忘れる
+        self._checkedRaces = {raceId: deadline for raceId, deadline in self._checkedRaces.items() if deadline > now}
+        # 締切を過ぎたレースは二分探索で読み飛ばす
+        for race in ScheduleIndex(schedules).after(now):
+            raceId = self._raceId(race)
+            current = self._racesById.get(raceId)
+            if current is not None and current['deadlineDatetime'] == race.deadlineDatetime:
+                continue
+            if self._checkedRaces.get(raceId) == race.deadlineDatetime:
+                continue
+            # 確認済みでも締切が変わったレースは新しいチェック時刻で確認し直す
+            self._checkedRaces.pop(raceId, None)
+            self._racesById[raceId] = race
+            # 古い時刻のエントリはキューに残るが、取り出し時に最新情報と照合して捨てる
+            heapq.heappush(self._eventQueue, (self._checkTime(race), next(self._sequence), raceId))
+            added += 1
+        if added:
+            print(f"監視キューに {added} レースを登録しました。(待機中: {len(self._racesById)} レース)")
+
+    def _popDueRaces(self):
+        """
+        チェック時刻を迎えたレースをキューから取り出す
+        """
+        now = datetime.datetime.now()
+        dueRaces = []
+        while self._eventQueue and self._eventQueue[0][0] <= now:
+            checkTime, _, raceId = heapq.heappop(self._eventQueue)
+            race = self._racesById.get(raceId)
+            # 再取得で締切が変わった古いエントリ / 通知済みは捨てる
+            if race is None or self._checkTime(race) != checkTime or raceId in self.notifiedRaces:
+                continue
+            del self._racesById[raceId]
+            self._checkedRaces[raceId] = race.deadlineDatetime
+            if race.deadlineDatetime <= now:
+                continue
+            dueRaces.append(race)
+        return dueRaces
+
+    def _secondsUntilNextEvent(self):
+        if not self._eventQueue:
+            return None
+        return max(0.0, (self._eventQueue[0][0] - datetime.datetime.now()).total_seconds())
+
+    def _refreshLoop(self, refreshIntervalMinutes):
+        """
+        一定間隔でスケジュールを再取得し、メインループを起こす (バックグラウンドスレッド)
+        """
+        schedules = self.schedules
+        while not self._stopEvent.wait(refreshIntervalMinutes * 60):
+            try:
+                # 終了済み・まだ先のレース場は再取得せず、前回の結果を使い回す
+                schedules = self.fetcher.refreshSchedules(schedules)
+            except Exception as e:
+                print(f"スケジュール再取得エラー: {e}")
+                continue
+            with self._lock:
+                self._pendingSchedules = schedules
+            self._wakeEvent.set()
+
+    def _checkRaceOdds(self, race):
+        """
+        単勝オッズを1回取得し、通知ルールのいずれかに該当すれば通知する (ワーカースレッド)
+        """
+        raceId = self._raceId(race)
+        raceDate = race.deadlineDatetime.strftime('%Y%m%d')
+        try:
+            odds_map = self.fetcher.fetchWinOdds(race.jcd, race.raceNo, raceDate)
+        except Exception as e:
+            print(f"オッズ確認エラー: {raceId} - {e}")
+            return
+
+        if not odds_map:
+            print(f"オッズ取得失敗: {race.stadium} {race.raceNo}R")
+            return
+        raceOdds = RaceOdds(odds_map)
+        matchedRules = self.ruleEngine.evaluate(raceOdds)
+        if not matchedRules:
+            print(f"通知対象外 (該当ルールなし): {race.stadium} {race.raceNo}R")
+            return
+
+        minutesLeft = (race.deadlineDatetime - datetime.datetime.now()).total_seconds() / 60
+        raceUrl = f"https://www.boatrace.jp/owpc/pc/race/racelist?rno={race.raceNo}&jcd={race.jcd}&hd={raceDate}"
+        notification = self.ruleEngine.buildNotification(matchedRules, race, raceOdds, minutesLeft, raceUrl)
+
+        if self.notifier.sendNotification(notification['message'], notification['title']):
+            print(f"通知完了: {raceId}")
+            self.notifiedRaces.add(raceId)
+
 if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="PCローカル実行用のレース監視")
+    argParser.add_argument('--daemon', action='store_true',
+                           help="締切時刻ちょうどに起動するデーモンモードで実行する (オッズ確認あり)")
+    argParser.add_argument('--refresh-minutes', type=float, default=30,
+                           help="デーモンモードでスケジュールを再取得する間隔(分)")
+    args = argParser.parse_args()
+
     monitor = RaceMonitor()
     monitor.initialize()
-    monitor.run()
+    if args.daemon:
+        monitor.runDaemon(args.refresh_minutes)
+    else:
+        monitor.run()
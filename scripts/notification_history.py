@@ -0,0 +1,174 @@
+import argparse
+import csv
+import os
+import sqlite3
+from notification_log import DEFAULT_CSV_PATH, LOG_HEADER
+
+DEFAULT_HISTORY_PATH = os.environ.get('NOTIFICATION_HISTORY_PATH', 'logs/notification_history.sqlite3')
+
+# 集計の単位 -> (SQLの式, 列見出し)
+GROUPINGS = {
+    'date': ('race_date', 'RaceDate'),
+    'stadium': ('jcd || \' \' || stadium', 'Stadium'),
+    'race': ('race_no', 'RaceNo'),
+    'hour': ('CAST(substr(action_time, 12, 2) AS INTEGER)', 'Hour'),
+    'deadline_hour': ('CAST(substr(deadline_time, 1, 2) AS INTEGER)', 'DeadlineHour'),
+}
+
+
+class NotificationHistoryStore:
+    """
+    通知履歴をSQLiteに保存する出力先 (従来のCSVへの追記の置き換え)
+
+    1回の実行分をまとめて1トランザクションで書き込み、日付・レース場・レース番号で絞り込んで集計できる。
+    同じ通知 (通知時刻・レースが同じ行) は二重に記録しないため、CSVの取り込みは何度実行してもよい。
+    """
+    name = 'SQLite'
+
+    def __init__(self, path=DEFAULT_HISTORY_PATH):
+        self.path = path
+        dirName = os.path.dirname(path)
+        if dirName:
+            os.makedirs(dirName, exist_ok=True)
+        # 送信待ちキュー (notification_outbox.py) のワーカースレッドから書き込むため、作成したスレッド以外からも使う
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS notifications (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    action_time TEXT NOT NULL,
+                    race_date TEXT NOT NULL,
+                    jcd TEXT NOT NULL,
+                    stadium TEXT,
+                    race_no INTEGER NOT NULL,
+                    deadline_time TEXT,
+                    minutes_left REAL,
+                    UNIQUE (race_date, jcd, race_no, action_time)
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS notifications_jcd ON notifications (jcd, race_date)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS notifications_action ON notifications (action_time)")
+
+    def close(self):
+        self.conn.close()
+
+    def write(self, rows):
+        """
+        LOG_HEADER の順の行をまとめて書き込む
+
+        Returns:
+            int: 追加した行数 (記録済みの行は除く)
+        """
+        values = [self._toRecord(row) for row in rows]
+        with self.conn:
+            before = self.conn.total_changes
+            self.conn.executemany("""
+                INSERT OR IGNORE INTO notifications
+                    (action_time, race_date, jcd, stadium, race_no, deadline_time, minutes_left)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, values)
+            return self.conn.total_changes - before
+
+    @staticmethod
+    def _toRecord(row):
+        actionTime, raceDate, jcd, stadium, raceNo, deadlineTime, minutesLeft = row[:len(LOG_HEADER)]
+        return (str(actionTime), str(raceDate), f"{int(jcd):02d}", stadium, int(raceNo), deadlineTime,
+                float(minutesLeft) if minutesLeft not in (None, '') else None)
+
+    def importCsv(self, path=DEFAULT_CSV_PATH, batchSize=1000):
+        """
+        従来の通知履歴CSVを取り込む (ヘッダー行・列数の足りない行は読み飛ばす)
+
+        Returns:
+            tuple: (読み込んだ行数, 追加した行数)
+        """
+        total = added = 0
+        batch = []
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.reader(f):
+                if len(row) < len(LOG_HEADER) or row[0] == LOG_HEADER[0]:
+                    continue
+                batch.append(row)
+                if len(batch) >= batchSize:
+                    total += len(batch)
+                    added += self.write(batch)
+                    batch = []
+        if batch:
+            total += len(batch)
+            added += self.write(batch)
+        return total, added
+
+    @staticmethod
+    def _filters(dateFrom=None, dateTo=None, jcd=None):
+        clauses, params = [], []
+        if dateFrom:
+            clauses.append("race_date >= ?")
+            params.append(dateFrom)
+        if dateTo:
+            clauses.append("race_date <= ?")
+            params.append(dateTo)
+        if jcd:
+            clauses.append("jcd = ?")
+            params.append(f"{int(jcd):02d}")
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def countBy(self, grouping, dateFrom=None, dateTo=None, jcd=None):
+        """
+        通知件数を grouping (GROUPINGS のキー) ごとに集計する
+
+        Returns:
+            list: [(値, 件数), ...] 値の順
+        """
+        expression, _ = GROUPINGS[grouping]
+        where, params = self._filters(dateFrom, dateTo, jcd)
+        return self.conn.execute(
+            f"SELECT {expression} AS k, COUNT(*) FROM notifications{where} GROUP BY k ORDER BY k", params
+        ).fetchall()
+
+    def recent(self, limit=20, dateFrom=None, dateTo=None, jcd=None):
+        """
+        新しい順に通知履歴を返す (LOG_HEADER の順の行)
+        """
+        where, params = self._filters(dateFrom, dateTo, jcd)
+        return self.conn.execute(f"""
+            SELECT action_time, race_date, jcd, stadium, race_no, deadline_time, minutes_left
+            FROM notifications{where} ORDER BY action_time DESC LIMIT ?
+        """, (*params, limit)).fetchall()
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="通知履歴 (SQLite) の取り込み・集計")
+    argParser.add_argument('--db', default=DEFAULT_HISTORY_PATH, help="通知履歴のファイル")
+    subParsers = argParser.add_subparsers(dest='command', required=True)
+
+    importParser = subParsers.add_parser('import', help="従来の通知履歴CSVを取り込む")
+    importParser.add_argument('--csv', default=DEFAULT_CSV_PATH, help="取り込むCSVファイル")
+
+    for commandName, helpText in (('summary', "件数を集計する"), ('recent', "直近の通知を表示する")):
+        subParser = subParsers.add_parser(commandName, help=helpText)
+        subParser.add_argument('--from', dest='dateFrom', help="開始日 (YYYYMMDD)")
+        subParser.add_argument('--to', dest='dateTo', help="終了日 (YYYYMMDD)")
+        subParser.add_argument('--jcd', help="レース場コード")
+        if commandName == 'summary':
+            subParser.add_argument('--by', choices=sorted(GROUPINGS), default='stadium',
+                                   help="集計の単位 (hour は通知した時刻、deadline_hour は締切時刻)")
+        else:
+            subParser.add_argument('--limit', type=int, default=20)
+    args = argParser.parse_args()
+
+    store = NotificationHistoryStore(args.db)
+    if args.command == 'import':
+        total, added = store.importCsv(args.csv)
+        print(f"取り込み: {args.csv} {total} 行 (追加 {added} 行、記録済み {total - added} 行)")
+    elif args.command == 'summary':
+        rows = store.countBy(args.by, args.dateFrom, args.dateTo, args.jcd)
+        print(f"{GROUPINGS[args.by][1]},Count")
+        for key, count in rows:
+            print(f"{key},{count}")
+        print(f"Total,{sum(count for _, count in rows)}")
+    else:
+        print(','.join(LOG_HEADER))
+        for row in store.recent(args.limit, args.dateFrom, args.dateTo, args.jcd):
+            print(','.join('' if v is None else str(v) for v in row))
+    store.close()
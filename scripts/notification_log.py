@@ -0,0 +1,85 @@
+import datetime
+import hashlib
+import json
+import os
+
+# 通知履歴の列 (CSV・スプレッドシート共通)
+LOG_HEADER = ['ActionTime', 'RaceDate', 'STADIUM_code', 'Stadium_name', 'RaceNo', 'DeadlineTime', 'MinutesLeft']
+
+# 従来の通知履歴CSV (notification_history.py import の取り込み元)
+DEFAULT_CSV_PATH = 'logs/notification_history.csv'
+# スプレッドシートのヘッダー確認済みマーカーの置き場所 (Actionsのキャッシュ対象)
+DEFAULT_MARKER_DIR = 'cache'
+
+
+def buildLogRow(race, raceDate, minutesLeft, actionTime=None):
+    """
+    通知したレース1件分の履歴の行 (LOG_HEADER の順) を作る
+    """
+    actionTime = actionTime or datetime.datetime.now()
+    return [
+        actionTime.strftime('%Y-%m-%d %H:%M:%S'),
+        raceDate,
+        race['jcd'],
+        race['stadium'],
+        race['raceNo'],
+        race['deadlineTime'],
+        f"{minutesLeft:.1f}"
+    ]
+
+
+class SheetsLogSink:
+    """
+    通知履歴をGoogleスプレッドシートの最初のシートへ書き込む出力先
+
+    gspread / oauth2client は実際に書き込むときに初めてインポートする。
+    ヘッダー行の有無は一度確認したらマーカーファイルに記録し、以降の実行では確認しない。
+    """
+    name = 'Google Sheet'
+
+    def __init__(self, credentialsJson, sheetKey, markerDir=DEFAULT_MARKER_DIR):
+        self.credentialsJson = credentialsJson
+        self.sheetKey = sheetKey
+        keyHash = hashlib.sha1(sheetKey.encode('utf-8')).hexdigest()[:12]
+        self.markerPath = os.path.join(markerDir, f"sheets_header_{keyHash}.ok")
+
+    @classmethod
+    def fromEnv(cls):
+        """
+        環境変数 GOOGLE_SHEETS_CREDENTIALS / GOOGLE_SHEET_KEY が設定されていれば出力先を作る
+        """
+        credentialsJson = os.environ.get('GOOGLE_SHEETS_CREDENTIALS')
+        sheetKey = os.environ.get('GOOGLE_SHEET_KEY')
+        if credentialsJson and sheetKey:
+            return cls(credentialsJson, sheetKey)
+        return None
+
+    def _openSheet(self):
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+
+        # JSON文字列から認証情報をロード
+        creds_dict = json.loads(self.credentialsJson)
+        scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, scope)
+        client = gspread.authorize(creds)
+        # 最初のシートを取得、なければ作成等のエラーハンドリングはあえてシンプルにする
+        return client.open_by_key(self.sheetKey).sheet1
+
+    def write(self, rows):
+        sheet = self._openSheet()
+
+        # ヘッダーチェック (A1セルが空ならデータと同じ呼び出しで書き込む)
+        values = [list(row) for row in rows]
+        if not os.path.exists(self.markerPath):
+            if not sheet.cell(1, 1).value:
+                values.insert(0, LOG_HEADER)
+
+        # 1回のAPI呼び出しでまとめて追記する
+        sheet.append_rows(values)
+
+        if not os.path.exists(self.markerPath):
+            os.makedirs(os.path.dirname(self.markerPath) or '.', exist_ok=True)
+            with open(self.markerPath, 'w', encoding='utf-8') as f:
+                f.write(datetime.datetime.now().isoformat(timespec='seconds'))
+
@@ -0,0 +1,414 @@
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import requests
+from notification_log import SheetsLogSink
+from notification_history import NotificationHistoryStore
+
+# Actions のキャッシュ対象 (cache/) に置き、未送信の通知を次回の実行へ引き継ぐ
+DEFAULT_OUTBOX_PATH = os.environ.get('NOTIFICATION_OUTBOX_PATH', 'cache/notification_outbox.sqlite3')
+
+STATUS_PENDING = 'pending'     # 未送信 (再送待ちを含む)
+STATUS_DELIVERED = 'delivered' # 送信済み
+STATUS_EXPIRED = 'expired'     # 締切を過ぎたため送信しなかった
+STATUS_DEAD = 'dead'           # 再送回数の上限に達した
+
+# 名前を変えた送信先 (旧名 -> 新名)。旧名で積まれた未送信の通知は新しい送信先から送る
+LEGACY_SINK_NAMES = {
+    'csv': 'history',  # 通知履歴の出力先をCSVからSQLite (notification_history.py) に変更
+}
+
+
+# --- 送信先 ---
+# 各送信先は name / batchSize / expires と deliver(items) -> [bool, ...] を持つ。
+# items は [{'title', 'message', 'url', 'logRow'}, ...]。
+
+class DiscordSink:
+    """
+    Discord Webhook へ送る (複数件を1メッセージにまとめる)
+    """
+    name = 'discord'
+    batchSize = 50
+    expires = True
+
+    def __init__(self, notifier):
+        self.notifier = notifier
+
+    def deliver(self, items):
+        return self.notifier.sendBatch(items)
+
+
+class MacSink:
+    """
+    Macのデスクトップ通知で1件ずつ表示する
+    """
+    name = 'mac'
+    batchSize = 1
+    expires = True
+
+    def __init__(self, notifier):
+        self.notifier = notifier
+
+    def deliver(self, items):
+        return [self.notifier._sendMac(item['message'], item.get('title') or self.notifier.notificationTitle)
+                for item in items]
+
+
+class WebhookSink:
+    """
+    任意のURLへ通知をJSONでPOSTする ({'title', 'message', 'url'})
+    """
+    name = 'webhook'
+    batchSize = 1
+    expires = True
+
+    def __init__(self, url):
+        self.url = url
+        self.session = requests.Session()
+
+    @classmethod
+    def fromEnv(cls):
+        """
+        環境変数 NOTIFY_WEBHOOK_URL が設定されていれば送信先を作る
+        """
+        url = os.environ.get('NOTIFY_WEBHOOK_URL')
+        return cls(url) if url else None
+
+    def deliver(self, items):
+        results = []
+        for item in items:
+            try:
+                resp = self.session.post(self.url, json={key: item.get(key) for key in ('title', 'message', 'url')},
+                                         timeout=(5, 20))
+                resp.raise_for_status()
+                results.append(True)
+            except requests.exceptions.RequestException as e:
+                print(f"  -> Webhook送信エラー: {e}")
+                results.append(False)
+        return results
+
+
+class StdoutSink:
+    """
+    標準出力へ書き出す (動作確認用)
+    """
+    name = 'stdout'
+    batchSize = 50
+    expires = True
+
+    def deliver(self, items):
+        for item in items:
+            print(f"[{item.get('title')}] {item['message']}")
+        return [True] * len(items)
+
+
+class HistoryLogSink:
+    """
+    通知履歴の出力先 (NotificationHistoryStore / SheetsLogSink) へ1行ずつ記録する
+
+    履歴は締切後でも記録する (expires = False)。まとめて1回の書き込みで追記する。
+    """
+    batchSize = 100
+    expires = False
+
+    def __init__(self, logSink, name):
+        self.logSink = logSink
+        self.name = name
+
+    def deliver(self, items):
+        self.logSink.write([item['logRow'] for item in items])
+        print(f"  -> Log saved to {self.logSink.name} ({len(items)} rows)")
+        return [True] * len(items)
+
+
+def buildSinks(notifier):
+    """
+    環境変数の設定に応じて送信先の一覧を作る
+
+    - DISCORD_WEBHOOK_URL があれば Discord、なければ (Macの場合) デスクトップ通知
+    - NOTIFY_WEBHOOK_URL があれば任意のWebhook、NOTIFY_STDOUT があれば標準出力
+    - 通知履歴は常にSQLite (logs/notification_history.sqlite3) へ、GOOGLE_SHEETS_CREDENTIALS / GOOGLE_SHEET_KEY があればスプレッドシートへも記録
+    """
+    sinks = []
+    if notifier.discordWebhookUrl:
+        sinks.append(DiscordSink(notifier))
+    elif sys.platform == 'darwin':
+        sinks.append(MacSink(notifier))
+    sinks.append(WebhookSink.fromEnv())
+    if os.environ.get('NOTIFY_STDOUT'):
+        sinks.append(StdoutSink())
+    sinks.append(HistoryLogSink(NotificationHistoryStore(), 'history'))
+    sheets = SheetsLogSink.fromEnv()
+    if sheets:
+        sinks.append(HistoryLogSink(sheets, 'sheets'))
+    return [sink for sink in sinks if sink is not None]
+
+
+class NotificationOutbox:
+    """
+    通知をSQLiteの送信待ちキューに書き込み、送信先ごとのワーカースレッドが非同期に配送するクラス
+
+    - enqueue() はディスクに書くだけで戻るため、呼び出し側 (オッズ確認など) を止めない
+    - 送信に失敗した通知は指数バックオフ (ジッター付き) で maxAttempts 回まで再送する
+    - 送信待ちが maxPending 件を超えると enqueue() は空くまで待つ (最大 enqueueTimeout 秒)
+    - close() は最大 timeout 秒だけ配送を待ち、残った通知はキューに残す
+    - 前回の実行で送れなかった通知は start() 後にワーカーが再送する (締切を過ぎたものは送らない)
+    送信先ごとに1行ずつ記録するため、ある送信先の失敗は他の送信先に影響しない。
+    """
+    def __init__(self, sinks, path=DEFAULT_OUTBOX_PATH, maxAttempts=5, retryBase=2.0, retryMax=60.0,
+                 maxPending=200, enqueueTimeout=10.0, leaseSeconds=120.0, lingerSeconds=0.2):
+        self.sinks = {sink.name: sink for sink in sinks if sink is not None}
+        self.path = path
+        self.maxAttempts = maxAttempts
+        self.retryBase = retryBase
+        self.retryMax = retryMax
+        self.maxPending = maxPending
+        self.enqueueTimeout = enqueueTimeout
+        # 取り出した通知を他のプロセスが重ねて送らないよう確保しておく時間(秒)
+        self.leaseSeconds = leaseSeconds
+        # 続けて積まれる通知を1回の送信にまとめるため、最初の1件から待つ時間(秒)
+        self.lingerSeconds = lingerSeconds
+
+        dirName = os.path.dirname(path)
+        if dirName:
+            os.makedirs(dirName, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sink TEXT NOT NULL,
+                race_key TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL,
+                lease_until REAL,
+                expires_at REAL,
+                delivered_at REAL,
+                last_error TEXT
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, sink, next_attempt_at)")
+        # 同じレースの通知を同じ送信先へ二重に積まない
+        self.conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS outbox_race_sink ON outbox (race_key, sink)")
+        self._migrateSinkNames()
+
+        self._dbLock = threading.Lock()
+        self._condition = threading.Condition()
+        self._stopEvent = threading.Event()
+        self._workers = []
+        self.stats = {name: {'delivered': 0, 'retried': 0, 'expired': 0, 'dead': 0} for name in self.sinks}
+
+    def _migrateSinkNames(self):
+        """
+        旧名の送信先の行を新しい名前に付け替える
+
+        同じレースの行が新しい名前で既にある場合は、旧名の行を削除する (二重に送らない)。
+        """
+        with self.conn:
+            for oldName, newName in LEGACY_SINK_NAMES.items():
+                self.conn.execute("UPDATE OR IGNORE outbox SET sink=? WHERE sink=?", (newName, oldName))
+                self.conn.execute("DELETE FROM outbox WHERE sink=?", (oldName,))
+
+    def start(self):
+        """
+        送信先ごとのワーカースレッドを起動する (前回の未送信分もここから再送される)
+        """
+        replay = self.pendingCount()
+        if replay:
+            print(f"前回の未送信通知 {replay} 件を再送します。")
+        for sink in self.sinks.values():
+            worker = threading.Thread(target=self._workerLoop, args=(sink,), daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def enqueue(self, item, raceKey=None, expiresAt=None):
+        """
+        通知1件を全送信先のキューに書き込む
+
+        Args:
+            item (dict): {'title', 'message', 'url', 'logRow'}
+            raceKey (str, optional): レースを表すキー (同じキーの通知は1回しか積まない)
+            expiresAt (float, optional): この時刻 (UNIX秒) を過ぎたら送らない (履歴への記録は行う)
+
+        Returns:
+            int: 書き込んだ行数
+        """
+        # 送信待ちが溜まりすぎている場合は、ワーカーが追いつくまで待つ
+        deadline = time.monotonic() + self.enqueueTimeout
+        with self._condition:
+            while self.pendingCount() >= self.maxPending and time.monotonic() < deadline:
+                self._condition.wait(0.5)
+
+        now = time.time()
+        payload = json.dumps(item, ensure_ascii=False)
+        added = 0
+        with self._dbLock:
+            for name in self.sinks:
+                cursor = self.conn.execute("""
+                    INSERT OR IGNORE INTO outbox (sink, race_key, payload, status, created_at, next_attempt_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (name, raceKey, payload, STATUS_PENDING, now, now, expiresAt))
+                added += cursor.rowcount
+        with self._condition:
+            self._condition.notify_all()
+        return added
+
+    def pendingCount(self, dueBefore=None):
+        """
+        現在の送信先の未送信件数 (dueBefore を指定するとその時刻までに送信予定のもののみ)
+        """
+        if not self.sinks:
+            return 0
+        placeholders = ','.join('?' * len(self.sinks))
+        sql = f"SELECT COUNT(*) FROM outbox WHERE status=? AND sink IN ({placeholders})"
+        params = [STATUS_PENDING, *self.sinks]
+        if dueBefore is not None:
+            sql += " AND next_attempt_at <= ?"
+            params.append(dueBefore)
+        with self._dbLock:
+            return self.conn.execute(sql, params).fetchone()[0]
+
+    def close(self, timeout=30.0):
+        """
+        最大 timeout 秒まで配送を待ってからワーカーを止める
+
+        timeout 内に再送予定がない通知はキューに残し、次回の実行で再送する。
+        接続は全ワーカーが終了してから閉じる。
+
+        Returns:
+            dict: {送信先名: {'delivered', 'retried', 'expired', 'dead', 'pending'}}
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while time.monotonic() < deadline:
+                remaining = deadline - time.monotonic()
+                if self.pendingCount(dueBefore=time.time() + remaining) == 0:
+                    break
+                self._condition.wait(min(0.5, remaining))
+
+        self._stopEvent.set()
+        with self._condition:
+            self._condition.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=max(0.0, deadline - time.monotonic()) + 5.0)
+        # 送信中のまま止まらないワーカーがいる場合は接続を閉じない (確保した通知は leaseSeconds 後に再送される)
+        running = [worker for worker in self._workers if worker.is_alive()]
+
+        result = {}
+        for name, stats in self.stats.items():
+            with self._dbLock:
+                pending = self.conn.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE status=? AND sink=?", (STATUS_PENDING, name)
+                ).fetchone()[0]
+            result[name] = dict(stats, pending=pending)
+        if running:
+            print(f"送信中のワーカー {len(running)} 件が終了しないため、送信待ちキューを開いたままにします。")
+            return result
+        self._purge()
+        with self._dbLock:
+            self.conn.close()
+        return result
+
+    def _workerLoop(self, sink):
+        # 停止後は新たに取り出さない (close() が接続を閉じる前に抜ける)
+        while not self._stopEvent.is_set():
+            rows = self._claimDue(sink.name, sink.batchSize)
+            if not rows:
+                with self._condition:
+                    self._condition.wait(0.5)
+                continue
+            if len(rows) < sink.batchSize and self.lingerSeconds and not self._stopEvent.wait(self.lingerSeconds):
+                rows += self._claimDue(sink.name, sink.batchSize - len(rows))
+            self._deliver(sink, rows)
+            with self._condition:
+                self._condition.notify_all()
+
+    def _claimDue(self, sinkName, limit):
+        """
+        送信時刻を迎えた通知を取り出し、一定時間だけ確保する
+        """
+        now = time.time()
+        claimed = []
+        with self._dbLock:
+            rows = self.conn.execute("""
+                SELECT id, payload, attempts, expires_at FROM outbox
+                WHERE status=? AND sink=? AND next_attempt_at <= ? AND (lease_until IS NULL OR lease_until < ?)
+                ORDER BY id LIMIT ?
+            """, (STATUS_PENDING, sinkName, now, now, limit)).fetchall()
+            for row in rows:
+                cursor = self.conn.execute(
+                    "UPDATE outbox SET lease_until=? WHERE id=? AND (lease_until IS NULL OR lease_until < ?)",
+                    (now + self.leaseSeconds, row[0], now)
+                )
+                if cursor.rowcount == 1:
+                    claimed.append(row)
+        return claimed
+
+    def _deliver(self, sink, rows):
+        now = time.time()
+        stats = self.stats[sink.name]
+        live = []
+        for rowId, payload, attempts, expiresAt in rows:
+            if sink.expires and expiresAt is not None and expiresAt < now:
+                self._update(rowId, STATUS_EXPIRED, attempts, None)
+                stats['expired'] += 1
+            else:
+                live.append((rowId, json.loads(payload), attempts))
+        if not live:
+            return
+
+        try:
+            results = sink.deliver([item for _, item, _ in live])
+            error = None
+        except Exception as e:
+            results = [False] * len(live)
+            error = str(e)
+            print(f"  -> {sink.name} 送信エラー: {e}")
+
+        for (rowId, _, attempts), success in zip(live, results):
+            attempts += 1
+            if success:
+                self._update(rowId, STATUS_DELIVERED, attempts, None, deliveredAt=time.time())
+                stats['delivered'] += 1
+            elif attempts >= self.maxAttempts:
+                self._update(rowId, STATUS_DEAD, attempts, error or 'delivery failed')
+                stats['dead'] += 1
+            else:
+                delay = random.uniform(0, min(self.retryMax, self.retryBase * (2 ** (attempts - 1))))
+                self._update(rowId, STATUS_PENDING, attempts, error or 'delivery failed', nextAttemptAt=time.time() + delay)
+                stats['retried'] += 1
+
+    def _update(self, rowId, status, attempts, error, nextAttemptAt=None, deliveredAt=None):
+        with self._dbLock:
+            self.conn.execute("""
+                UPDATE outbox SET status=?, attempts=?, last_error=?, lease_until=NULL,
+                    next_attempt_at=COALESCE(?, next_attempt_at), delivered_at=?
+                WHERE id=?
+            """, (status, attempts, error, nextAttemptAt, deliveredAt, rowId))
+
+    def _purge(self, keepDays=7):
+        """
+        送信が終わった (送信済み・期限切れ・上限到達) 古い行を削除する
+
+        設定から外れた送信先 (スプレッドシートの認証情報を消した場合など) の未送信の行は、
+        keepDays 日を過ぎたら送れないものとして上限到達 (dead) にし、あわせて削除する。
+        それより新しい行は、設定が戻れば次の実行で送られるよう残す。
+        """
+        limit = time.time() - keepDays * 86400
+        placeholders = ','.join('?' * len(self.sinks))
+        with self._dbLock:
+            cursor = self.conn.execute(f"""
+                UPDATE outbox SET status=?, last_error='sink not configured', lease_until=NULL
+                WHERE status=? AND created_at < ? AND sink NOT IN ({placeholders})
+            """, (STATUS_DEAD, STATUS_PENDING, limit, *self.sinks))
+            if cursor.rowcount:
+                print(f"設定されていない送信先の未送信通知 {cursor.rowcount} 件を破棄しました。")
+            self.conn.execute("DELETE FROM outbox WHERE status != ? AND created_at < ?", (STATUS_PENDING, limit))
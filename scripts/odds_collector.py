@@ -0,0 +1,128 @@
+import argparse
+import datetime
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from schedule_fetcher import ScheduleFetcher
+from schedule_cache import ScheduleCache
+from odds_store import OddsStore
+from response_cache import ResponseCache, DEFAULT_TTLS
+
+# 取得したスナップショットはこの行数か時間(秒)に達するまでまとめてから書き出す (小さな part ファイルを増やさない)
+DEFAULT_FLUSH_ROWS = int(os.environ.get('ODDS_FLUSH_ROWS', '1000'))
+DEFAULT_FLUSH_SECONDS = float(os.environ.get('ODDS_FLUSH_SECONDS', '600'))
+
+
+class OddsCollector:
+    """
+    締切が近づいたレースの単勝オッズを一定間隔で取得し、OddsStore に時系列として蓄積するクラス
+
+    各レースについて「締切 startMinutes 分前〜endMinutes 分前」の間、intervalSeconds ごとにスナップショットを取る。
+    書き出しは flushRows 行または flushSeconds 秒ごとにまとめ、収集の終了時に開催日ごとの part ファイルを1つにまとめる。
+    """
+    def __init__(self, fetcher=None, store=None, intervalSeconds=60, startMinutes=20, endMinutes=0,
+                 flushRows=DEFAULT_FLUSH_ROWS, flushSeconds=DEFAULT_FLUSH_SECONDS):
+        # 毎回最新のオッズを取得するため、オッズページはレスポンスキャッシュを使わない
+        self.fetcher = fetcher or ScheduleFetcher(responseCache=ResponseCache(ttls=dict(DEFAULT_TTLS, oddstf=0)))
+        self.store = store or OddsStore()
+        self.intervalSeconds = intervalSeconds
+        self.startMinutes = startMinutes
+        self.endMinutes = endMinutes
+        self.flushRows = flushRows
+        self.flushSeconds = flushSeconds
+        self._lastFlush = time.monotonic()
+
+    def collect(self, schedules, untilTime=None):
+        """
+        対象レースがなくなる (または untilTime を過ぎる) までスナップショットを取り続ける
+
+        Args:
+            schedules (list): レース情報の辞書リスト
+            untilTime (datetime, optional): 収集を打ち切る時刻
+
+        Returns:
+            int: 保存したスナップショット数
+        """
+        total = 0
+        finished = False
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, self.fetcher.maxWorkers)) as executor:
+                while True:
+                    roundStart = time.monotonic()
+                    now = datetime.datetime.now()
+                    if untilTime and now >= untilTime:
+                        break
+
+                    targets = self._racesInWindow(schedules, now)
+                    if targets:
+                        total += self._snapshot(executor, targets)
+                    elif not self._hasUpcomingRaces(schedules, now):
+                        finished = True
+                        break
+
+                    # 取得にかかった時間を差し引いて次の周期まで待つ
+                    elapsed = time.monotonic() - roundStart
+                    time.sleep(max(0.0, self.intervalSeconds - elapsed))
+        finally:
+            # 中断された場合も取得済みの分は書き出す
+            self.store.flush()
+
+        if finished:
+            # 全レースの収集が終わった開催日は1ファイルにまとめる
+            for date in sorted({race['deadlineDatetime'].strftime('%Y%m%d') for race in schedules}):
+                self.store.compact(date)
+        print(f"オッズ収集終了: 合計 {total} スナップショット")
+        return total
+
+    def _racesInWindow(self, schedules, now):
+        return [
+            race for race in schedules
+            if self.endMinutes * 60 <= (race['deadlineDatetime'] - now).total_seconds() <= self.startMinutes * 60
+        ]
+
+    def _hasUpcomingRaces(self, schedules, now):
+        return any((race['deadlineDatetime'] - now).total_seconds() >= self.endMinutes * 60 for race in schedules)
+
+    def _snapshot(self, executor, races):
+        """
+        対象レースのオッズを並列取得してストアに追記する
+        """
+        def fetch(race):
+            odds_map = self.fetcher.fetchWinOdds(race['jcd'], race['raceNo'], race['deadlineDatetime'].strftime('%Y%m%d'))
+            return race, odds_map, datetime.datetime.now()
+
+        saved = 0
+        for race, odds_map, fetchedAt in executor.map(fetch, races):
+            if odds_map:
+                self.store.append(race, odds_map, fetchedAt)
+                saved += 1
+        if (self.store.pendingRows() >= self.flushRows
+                or time.monotonic() - self._lastFlush >= self.flushSeconds):
+            self.store.flush()
+            self._lastFlush = time.monotonic()
+        print(f"{datetime.datetime.now().strftime('%H:%M:%S')} オッズ取得: {saved}/{len(races)} レース")
+        return saved
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="締切前の単勝オッズを時系列で収集・集計する")
+    argParser.add_argument('--interval', type=float, default=60, help="取得間隔(秒)")
+    argParser.add_argument('--start', type=float, default=20, help="締切何分前から取得するか")
+    argParser.add_argument('--end', type=float, default=0, help="締切何分前まで取得するか")
+    argParser.add_argument('--query-loss', type=float, metavar='MINUTES',
+                           help="収集せず、締切MINUTES分前に1番人気だった1号艇が最終的に1番人気でなくなった割合を表示する")
+    argParser.add_argument('--from', dest='dateFrom', help="集計対象の開始日 (YYYYMMDD)")
+    argParser.add_argument('--to', dest='dateTo', help="集計対象の終了日 (YYYYMMDD)")
+    argParser.add_argument('--compact', action='store_true',
+                           help="収集せず、前日までの開催日の part ファイルを1日1ファイルにまとめる")
+    args = argParser.parse_args()
+
+    if args.compact:
+        print(f"まとめた part ファイル: {OddsStore().compactFinished()} 件")
+    elif args.query_loss is not None:
+        result = OddsStore().favoriteLossRate(args.query_loss, dateFrom=args.dateFrom, dateTo=args.dateTo)
+        print(result)
+    else:
+        collector = OddsCollector(intervalSeconds=args.interval, startMinutes=args.start, endMinutes=args.end)
+        schedules = ScheduleCache().getSchedules(collector.fetcher)
+        collector.collect(schedules)
@@ -0,0 +1,246 @@
+import datetime
+import glob
+import os
+import threading
+import time
+import numpy as np
+
+DEFAULT_STORE_DIR = os.environ.get('ODDS_STORE_DIR', 'data/odds')
+
+# 1スナップショット = 1行。艇番1〜6の単勝オッズは odds[:, 0〜5] (オッズなしは NaN)
+COLUMNS = {
+    'date': np.int32,      # 開催日 (YYYYMMDD)
+    'jcd': np.int8,        # レース場コード
+    'rno': np.int8,        # レース番号
+    'ts': np.int64,        # 取得時刻 (UNIX秒)
+    'deadline': np.int64,  # 締切時刻 (UNIX秒)
+}
+BOAT_COUNT = 6
+
+
+class OddsStore:
+    """
+    単勝オッズの時系列を列指向 (NumPy配列) で追記保存するクラス
+
+    開催日ごとのディレクトリ (date=YYYYMMDD/) に、flush() のたびに part-*.npz を1ファイル追加する。
+    既存ファイルは書き換えないため、複数プロセスからの追記でも壊れない。
+    終わった開催日は compact() で1ファイル (tag ごと) にまとめ、読み込み時のファイル数を減らす。
+    読み込み時は全ファイルの列を連結し、ベクトル演算でまとめて集計する。
+    """
+    def __init__(self, baseDir=DEFAULT_STORE_DIR):
+        self.baseDir = baseDir
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def append(self, race, odds_map, fetchedAt=None):
+        """
+        1レース分のスナップショットをバッファに追加する
+
+        Args:
+            race (dict): レース情報 (jcd, raceNo, deadlineDatetime を使用)
+            odds_map (dict): {艇番: オッズ}
+            fetchedAt (datetime, optional): 取得時刻。省略時は現在時刻。
+        """
+        fetchedAt = fetchedAt or datetime.datetime.now()
+        odds = [odds_map.get(boat, np.nan) for boat in range(1, BOAT_COUNT + 1)]
+        deadline = race['deadlineDatetime']
+        row = (int(deadline.strftime('%Y%m%d')), int(race['jcd']), int(race['raceNo']),
+               int(fetchedAt.timestamp()), int(deadline.timestamp()), odds)
+        with self._lock:
+            self._buffer.append(row)
+
+    def pendingRows(self):
+        """
+        バッファに溜まっている (まだ書き出していない) 行数
+        """
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self, tag=None):
+        """
+        バッファの内容を開催日ごとの part ファイルとして書き出す
+
+        Args:
+            tag (str, optional): ファイル名に付ける識別子 (part-<tag>-*.npz)。removeParts() で一括削除できる。
+
+        Returns:
+            int: 書き出した行数
+        """
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+
+        byDate = {}
+        for row in rows:
+            byDate.setdefault(row[0], []).append(row)
+
+        for date, dateRows in byDate.items():
+            columns = {
+                name: np.array([row[i] for row in dateRows], dtype=dtype)
+                for i, (name, dtype) in enumerate(COLUMNS.items())
+            }
+            columns['odds'] = np.array([row[5] for row in dateRows], dtype=np.float32)
+            self._writePart(date, columns, tag)
+        return len(rows)
+
+    def _writePart(self, date, columns, tag=None):
+        partDir = os.path.join(self.baseDir, f"date={date}")
+        os.makedirs(partDir, exist_ok=True)
+        prefix = f"part-{tag}-" if tag else "part-"
+        fileName = f"{prefix}{time.time_ns()}-{os.getpid()}.npz"
+        tmpPath = os.path.join(partDir, f".{fileName}.tmp")
+        with open(tmpPath, 'wb') as f:
+            np.savez_compressed(f, **columns)
+        os.replace(tmpPath, os.path.join(partDir, fileName))
+        return fileName
+
+    @staticmethod
+    def _partTag(fileName):
+        """
+        part ファイル名 (part-[<tag>-]<ns>-<pid>.npz) の tag (なければ None)
+        """
+        fields = fileName[len('part-'):-len('.npz')].split('-')
+        return '-'.join(fields[:-2]) or None
+
+    def compact(self, date):
+        """
+        指定日の part ファイルを tag ごとに1ファイルへまとめる (レース・取得時刻順に並べ替える)
+
+        まとめたファイルを書き出してから元のファイルを削除するため、途中で止まってもデータは失われない。
+        追記中の日に使うと、その間に書き出された part は次回の compact() でまとめられる。
+
+        Returns:
+            int: 削除した (まとめた) ファイル数
+        """
+        partDir = os.path.join(self.baseDir, f"date={date}")
+        groups = {}
+        for path in sorted(glob.glob(os.path.join(partDir, 'part-*.npz'))):
+            groups.setdefault(self._partTag(os.path.basename(path)), []).append(path)
+
+        removed = 0
+        for tag, paths in groups.items():
+            if len(paths) < 2:
+                continue
+            parts = {name: [] for name in list(COLUMNS) + ['odds']}
+            for path in paths:
+                with np.load(path) as data:
+                    for name in parts:
+                        parts[name].append(data[name])
+            columns = {name: np.concatenate(arrays) for name, arrays in parts.items()}
+            order = np.lexsort((columns['ts'], columns['rno'], columns['jcd']))
+            self._writePart(date, {name: values[order] for name, values in columns.items()}, tag)
+            for path in paths:
+                os.remove(path)
+            removed += len(paths)
+        return removed
+
+    def compactFinished(self, today=None):
+        """
+        today より前の開催日を全て compact() する
+
+        Returns:
+            int: 削除した (まとめた) ファイル数
+        """
+        today = today or datetime.date.today().strftime('%Y%m%d')
+        removed = 0
+        for partDir in sorted(glob.glob(os.path.join(self.baseDir, 'date=*'))):
+            date = os.path.basename(partDir)[len('date='):]
+            if date < today:
+                removed += self.compact(date)
+        return removed
+
+    def removeParts(self, date, tag):
+        """
+        指定日の part-<tag>-*.npz を削除する (同じ日を書き直す前に使う)
+
+        Returns:
+            int: 削除したファイル数
+        """
+        paths = glob.glob(os.path.join(self.baseDir, f"date={date}", f"part-{tag}-*.npz"))
+        for path in paths:
+            os.remove(path)
+        return len(paths)
+
+    def load(self, dateFrom=None, dateTo=None):
+        """
+        保存済みスナップショットを列ごとに連結して返す
+
+        Args:
+            dateFrom / dateTo (str, optional): 読み込む開催日の範囲 (YYYYMMDD、両端含む)
+
+        Returns:
+            dict: {'date', 'jcd', 'rno', 'ts', 'deadline', 'odds'} の NumPy 配列
+        """
+        parts = {name: [] for name in list(COLUMNS) + ['odds']}
+        for partDir in sorted(glob.glob(os.path.join(self.baseDir, 'date=*'))):
+            date = os.path.basename(partDir)[len('date='):]
+            if (dateFrom and date < dateFrom) or (dateTo and date > dateTo):
+                continue
+            for path in sorted(glob.glob(os.path.join(partDir, 'part-*.npz'))):
+                with np.load(path) as data:
+                    for name in parts:
+                        parts[name].append(data[name])
+
+        if not parts['ts']:
+            columns = {name: np.array([], dtype=dtype) for name, dtype in COLUMNS.items()}
+            columns['odds'] = np.empty((0, BOAT_COUNT), dtype=np.float32)
+            return columns
+        return {name: np.concatenate(arrays) for name, arrays in parts.items()}
+
+    def toDataFrame(self, dateFrom=None, dateTo=None):
+        """
+        保存済みスナップショットを pandas.DataFrame (1行1スナップショット) で返す
+        """
+        import pandas as pd
+        columns = self.load(dateFrom, dateTo)
+        frame = pd.DataFrame({name: columns[name] for name in COLUMNS})
+        for boat in range(BOAT_COUNT):
+            frame[f"odds{boat + 1}"] = columns['odds'][:, boat]
+        return frame
+
+    def favoriteLossRate(self, lastMinutes=5, boat=1, dateFrom=None, dateTo=None):
+        """
+        「締切 lastMinutes 分前の時点で boat 号艇が1番人気だったレースのうち、
+        最終スナップショットで1番人気でなくなった割合」をベクトル演算で集計する
+
+        Returns:
+            dict: races (比較できたレース数) / favoriteBefore (その時点で1番人気) /
+                  lostFavorite (最終的に1番人気でなくなった) / rate (lostFavorite / favoriteBefore)
+            「最終」は締切前 lastMinutes 分以内に取得した最後のスナップショット。
+        """
+        columns = self.load(dateFrom, dateTo)
+        if len(columns['ts']) == 0:
+            return {'races': 0, 'favoriteBefore': 0, 'lostFavorite': 0, 'rate': None}
+
+        # レースを一意に表すキー (YYYYMMDD * 10000 + jcd * 100 + rno)
+        key = columns['date'].astype(np.int64) * 10000 + columns['jcd'].astype(np.int64) * 100 + columns['rno']
+        secondsLeft = columns['deadline'] - columns['ts']
+        odds = columns['odds']
+        minOdds = np.where(np.isnan(odds), np.inf, odds).min(axis=1)
+        isFavorite = odds[:, boat - 1] == minOdds
+
+        # キー → 取得時刻 の順に並べ、各レースの該当スナップショット (グループ内の最後の行) を取り出す
+        order = np.lexsort((columns['ts'], key))
+        key, secondsLeft, isFavorite = key[order], secondsLeft[order], isFavorite[order]
+
+        def lastPerRace(mask):
+            keys = key[mask]
+            values = isFavorite[mask]
+            isLast = np.r_[keys[1:] != keys[:-1], True] if len(keys) else np.array([], dtype=bool)
+            return keys[isLast], values[isLast]
+
+        beforeKeys, beforeFavorite = lastPerRace(secondsLeft >= lastMinutes * 60)
+        finalKeys, finalFavorite = lastPerRace((secondsLeft >= 0) & (secondsLeft < lastMinutes * 60))
+        # 「lastMinutes 分前」と「最終」の両方のスナップショットがあるレースのみ比較する
+        _, beforeIdx, finalIdx = np.intersect1d(beforeKeys, finalKeys, assume_unique=True, return_indices=True)
+
+        favoriteBefore = beforeFavorite[beforeIdx]
+        lost = favoriteBefore & ~finalFavorite[finalIdx]
+        favoriteCount = int(favoriteBefore.sum())
+        return {
+            'races': int(len(beforeIdx)),
+            'favoriteBefore': favoriteCount,
+            'lostFavorite': int(lost.sum()),
+            'rate': float(lost.sum()) / favoriteCount if favoriteCount else None
+        }
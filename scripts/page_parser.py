@@ -0,0 +1,510 @@
+import os
+import re
+import sys
+import time
+
+# 環境変数でバックエンドを固定できる (selectolax / lxml / bs4)
+PARSER_ENV = 'BOATRACE_HTML_PARSER'
+# 未指定時に試す順番 (高速なもの優先)
+BACKEND_PRIORITY = ('selectolax', 'lxml', 'bs4')
+
+# get_text() 相当の処理で無視するタグ (BeautifulSoup の get_text と同じ扱い)
+SKIP_TEXT_TAGS = ('script', 'style', 'template')
+
+
+def decodeHtml(content):
+    """
+    レスポンスのバイト列を文字列に変換する (公式サイトはUTF-8、念のためmetaのcharsetも見る)
+    """
+    if isinstance(content, str):
+        return content
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        m = re.search(rb'<meta[^>]+charset=["\']?([\w-]+)', content[:2048], re.IGNORECASE)
+        encoding = m.group(1).decode('ascii') if m else 'cp932'
+        return content.decode(encoding, errors='replace')
+
+
+def jcdFromHref(href):
+    """
+    raceindex へのリンクからレース場コード(jcd)を取り出す。該当しなければ None
+    """
+    if 'raceindex' not in href or 'jcd=' not in href:
+        return None
+    qs = href.split('?')[1]
+    params = {p.split('=')[0]: p.split('=')[1] for p in qs.split('&')}
+    return params.get('jcd')
+
+
+def parseOddsText(text):
+    """
+    オッズ表記を数値に変換する。欠場(0.0倍)や数値以外は None
+    """
+    if text and text.replace('.', '').isdigit():
+        val = float(text)
+        # 0.0倍は欠場や投票なしの可能性があるため除外 (最小値判定で誤検知しないように)
+        if val > 0:
+            return val
+    return None
+
+
+def iterWinOddsFragments(text):
+    """
+    「単勝」を含むテーブルのHTML断片 (<table>...</table>) を文書順に返す
+
+    文書全体を解析する前に文字列検索だけで対象テーブルを切り出すためのもの。
+    入れ子のテーブルなど単純に切り出せない構造はスキップする (呼び出し側で全体解析にフォールバック)。
+    """
+    pos = 0
+    while True:
+        idx = text.find('単勝', pos)
+        if idx < 0:
+            return
+        start = text.rfind('<table', 0, idx)
+        # 直前の <table> が「単勝」より前に閉じていれば、テーブル外の文字列 (ナビゲーション等)
+        if start >= 0 and text.find('</table', start, idx) < 0:
+            end = text.find('</table', idx)
+            if end < 0:
+                return
+            end = text.find('>', end) + 1
+            if text.find('<table', start + 6, end) < 0:
+                yield text[start:end]
+            pos = end
+        else:
+            pos = idx + 2
+
+
+class _BaseBackend:
+    """
+    各バックエンド共通の処理
+    """
+    name = None
+
+    def parseWinOddsPartial(self, content):
+        """
+        単勝テーブルだけを切り出して解析する (parseWinOdds と同じ結果を返す)
+
+        オッズページ全体ではなく数KBの断片だけを解析するため、CPU時間とメモリを大きく削減できる。
+        断片から単勝オッズが取れなかった場合のみ、文書全体の解析にフォールバックする。
+        """
+        text = decodeHtml(content)
+        for fragment in iterWinOddsFragments(text):
+            odds_map = self.parseWinOdds(fragment)
+            if odds_map:
+                return odds_map
+        return self.parseWinOdds(text)
+
+    def parseRaceResult(self, content):
+        """
+        レース結果ページの払戻金テーブルから単勝の結果を取り出す
+
+        Returns:
+            dict: {'winner': 1着の艇番, 'payout': 100円あたりの単勝払戻金}
+                  (レース不成立・結果未確定などで単勝の払戻がない場合は {})
+        """
+        text = decodeHtml(content)
+        for fragment in iterWinOddsFragments(text):
+            result = _winResultFromRows(self.parseTableRows(fragment))
+            if result:
+                return result
+        return _winResultFromRows(self.parseTableRows(text))
+
+
+class BeautifulSoupBackend(_BaseBackend):
+    """
+    BeautifulSoup (html.parser) による解析。追加ライブラリ不要のフォールバック
+    """
+    name = 'bs4'
+
+    def __init__(self):
+        from bs4 import BeautifulSoup
+        self._BeautifulSoup = BeautifulSoup
+
+    def _soup(self, content):
+        return self._BeautifulSoup(decodeHtml(content), 'html.parser')
+
+    def parseActiveStadiums(self, content):
+        soup = self._soup(content)
+        stadiums = []
+        uniqueJcds = set()
+        for a in soup.find_all('a', href=True):
+            href = a['href']
+            try:
+                jcd = jcdFromHref(href)
+            except IndexError:
+                continue
+            if jcd and jcd not in uniqueJcds:
+                block = a.find_parent(['tbody', 'tr'])
+                blockText = block.get_text(strip=True) if block else href
+                stadiums.append({'jcd': jcd, 'blockText': blockText})
+                uniqueJcds.add(jcd)
+        return stadiums
+
+    def parseStadiumSchedule(self, content):
+        soup = self._soup(content)
+        table = soup.find('table')
+        if table is None:
+            return []
+        rows = []
+        for row in table.find_all('tr'):
+            cols = row.find_all('td')
+            if len(cols) < 2:
+                continue
+            rows.append((cols[0].get_text(strip=True), cols[1].get_text(strip=True)))
+        return rows
+
+    def parseTableRows(self, content):
+        rows = []
+        for row in self._soup(content).find_all('tr'):
+            rows.append([cell.get_text(strip=True) for cell in row.find_all(['td', 'th'], recursive=False)])
+        return rows
+
+    def parseWinOdds(self, content):
+        soup = self._soup(content)
+        for table in soup.find_all('table'):
+            # 明確に「単勝」ヘッダーを持つテーブルを対象にする
+            if "単勝" not in table.get_text():
+                continue
+            odds_map = {}
+            for row in table.find_all('tr'):
+                boat_td = row.find('td', class_=lambda x: x and 'is-boatColor' in x)
+                if not boat_td:
+                    continue
+                # 構造: [艇番TD] -> [レーサー名TD] -> [オッズTD]
+                racer_td = boat_td.find_next_sibling('td')
+                odds_td = racer_td.find_next_sibling('td') if racer_td else None
+                if odds_td:
+                    _addOdds(odds_map, boat_td.get_text(strip=True), odds_td.get_text(strip=True))
+            # 単勝データが取れたら終了
+            if odds_map:
+                return odds_map
+        return {}
+
+
+class LxmlBackend(_BaseBackend):
+    """
+    lxml (libxml2) による解析
+    """
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.html
+        self._html = lxml.html
+
+    def _root(self, content):
+        text = decodeHtml(content)
+        if not text.strip():
+            return None
+        return self._html.document_fromstring(text)
+
+    @classmethod
+    def _strings(cls, el):
+        # BeautifulSoup の get_text と同様に、コメントとscript/style内のテキストは除外する
+        if el.text and el.tag not in SKIP_TEXT_TAGS:
+            yield el.text
+        for child in el:
+            if isinstance(child.tag, str):
+                yield from cls._strings(child)
+            if child.tail:
+                yield child.tail
+
+    @classmethod
+    def _text(cls, el, strip=False):
+        if strip:
+            return ''.join(s.strip() for s in cls._strings(el))
+        return ''.join(cls._strings(el))
+
+    def parseActiveStadiums(self, content):
+        root = self._root(content)
+        if root is None:
+            return []
+        stadiums = []
+        uniqueJcds = set()
+        for a in root.iter('a'):
+            href = a.get('href')
+            if href is None:
+                continue
+            try:
+                jcd = jcdFromHref(href)
+            except IndexError:
+                continue
+            if jcd and jcd not in uniqueJcds:
+                block = next((p for p in a.iterancestors('tbody', 'tr')), None)
+                blockText = self._text(block, strip=True) if block is not None else href
+                stadiums.append({'jcd': jcd, 'blockText': blockText})
+                uniqueJcds.add(jcd)
+        return stadiums
+
+    def parseStadiumSchedule(self, content):
+        root = self._root(content)
+        if root is None:
+            return []
+        table = next(root.iter('table'), None)
+        if table is None:
+            return []
+        rows = []
+        for row in table.iter('tr'):
+            cols = list(row.iter('td'))
+            if len(cols) < 2:
+                continue
+            rows.append((self._text(cols[0], strip=True), self._text(cols[1], strip=True)))
+        return rows
+
+    def parseTableRows(self, content):
+        root = self._root(content)
+        if root is None:
+            return []
+        return [[self._text(cell, strip=True) for cell in row if cell.tag in ('td', 'th')] for row in root.iter('tr')]
+
+    def parseWinOdds(self, content):
+        root = self._root(content)
+        if root is None:
+            return {}
+        for table in root.iter('table'):
+            if "単勝" not in self._text(table):
+                continue
+            odds_map = {}
+            for row in table.iter('tr'):
+                boat_td = next((td for td in row.iter('td') if 'is-boatColor' in (td.get('class') or '')), None)
+                if boat_td is None:
+                    continue
+                racer_td = next(boat_td.itersiblings('td'), None)
+                odds_td = next(racer_td.itersiblings('td'), None) if racer_td is not None else None
+                if odds_td is not None:
+                    _addOdds(odds_map, self._text(boat_td, strip=True), self._text(odds_td, strip=True))
+            if odds_map:
+                return odds_map
+        return {}
+
+
+class SelectolaxBackend(_BaseBackend):
+    """
+    selectolax (lexbor) による解析。最も高速
+    """
+    name = 'selectolax'
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._Parser = LexborHTMLParser
+
+    def _root(self, content):
+        return self._Parser(decodeHtml(content))
+
+    @staticmethod
+    def _text(node, strip=False):
+        # BeautifulSoup の get_text と同様に、コメントとscript/style内のテキストは除外する
+        parts = []
+        for child in node.traverse(include_text=True):
+            if child.tag == '-text' and child.parent.tag not in SKIP_TEXT_TAGS:
+                text = child.text_content or ''
+                parts.append(text.strip() if strip else text)
+        return ''.join(parts)
+
+    @staticmethod
+    def _nextSiblingTd(node):
+        sibling = node.next
+        while sibling is not None and sibling.tag != 'td':
+            sibling = sibling.next
+        return sibling
+
+    def parseActiveStadiums(self, content):
+        root = self._root(content)
+        stadiums = []
+        uniqueJcds = set()
+        for a in root.css('a[href]'):
+            href = a.attributes.get('href') or ''
+            try:
+                jcd = jcdFromHref(href)
+            except IndexError:
+                continue
+            if jcd and jcd not in uniqueJcds:
+                block = a.parent
+                while block is not None and block.tag not in ('tbody', 'tr'):
+                    block = block.parent
+                blockText = self._text(block, strip=True) if block is not None else href
+                stadiums.append({'jcd': jcd, 'blockText': blockText})
+                uniqueJcds.add(jcd)
+        return stadiums
+
+    def parseStadiumSchedule(self, content):
+        table = self._root(content).css_first('table')
+        if table is None:
+            return []
+        rows = []
+        for row in table.css('tr'):
+            cols = row.css('td')
+            if len(cols) < 2:
+                continue
+            rows.append((self._text(cols[0], strip=True), self._text(cols[1], strip=True)))
+        return rows
+
+    def parseTableRows(self, content):
+        rows = []
+        for row in self._root(content).css('tr'):
+            rows.append([self._text(cell, strip=True) for cell in row.iter() if cell.tag in ('td', 'th')])
+        return rows
+
+    def parseWinOdds(self, content):
+        for table in self._root(content).css('table'):
+            if "単勝" not in self._text(table):
+                continue
+            odds_map = {}
+            for row in table.css('tr'):
+                boat_td = next((td for td in row.css('td') if 'is-boatColor' in (td.attributes.get('class') or '')), None)
+                if boat_td is None:
+                    continue
+                racer_td = self._nextSiblingTd(boat_td)
+                odds_td = self._nextSiblingTd(racer_td) if racer_td is not None else None
+                if odds_td is not None:
+                    _addOdds(odds_map, self._text(boat_td, strip=True), self._text(odds_td, strip=True))
+            if odds_map:
+                return odds_map
+        return {}
+
+
+def _addOdds(odds_map, boatText, oddsText):
+    try:
+        boatNo = int(boatText)
+    except ValueError:
+        return
+    val = parseOddsText(oddsText)
+    if val is not None:
+        odds_map[boatNo] = val
+
+
+def _winResultFromRows(rows):
+    """
+    払戻金テーブルの行 ([勝式, 組番, 払戻金, 人気]) から単勝の行を探す
+    """
+    for cells in rows:
+        if '単勝' not in cells:
+            continue
+        i = cells.index('単勝')
+        if len(cells) < i + 3:
+            continue
+        boatText = cells[i + 1]
+        payoutText = cells[i + 2].replace('¥', '').replace('￥', '').replace('円', '').replace(',', '')
+        if boatText.isdigit() and payoutText.isdigit():
+            return {'winner': int(boatText), 'payout': int(payoutText)}
+    return {}
+
+
+BACKENDS = {
+    'selectolax': SelectolaxBackend,
+    'lxml': LxmlBackend,
+    'bs4': BeautifulSoupBackend,
+}
+
+
+def availableBackends():
+    """
+    インポート可能なバックエンドのインスタンスを優先順に返す
+    """
+    backends = []
+    for name in BACKEND_PRIORITY:
+        try:
+            backends.append(BACKENDS[name]())
+        except ImportError:
+            continue
+    return backends
+
+
+def getBackend(name=None):
+    """
+    HTML解析バックエンドを返す
+
+    Args:
+        name (str, optional): 'selectolax' / 'lxml' / 'bs4'。
+                              省略時は環境変数 BOATRACE_HTML_PARSER、それもなければ
+                              インストール済みの中で最も高速なものを使う。
+    """
+    name = name or os.environ.get(PARSER_ENV)
+    if name:
+        if name not in BACKENDS:
+            raise ValueError(f"未対応のHTMLパーサーです: {name} (選択肢: {', '.join(BACKENDS)})")
+        try:
+            return BACKENDS[name]()
+        except ImportError:
+            print(f"HTMLパーサー '{name}' がインストールされていないため、自動選択します。")
+
+    backends = availableBackends()
+    if not backends:
+        raise ImportError("HTMLパーサーが見つかりません。beautifulsoup4 をインストールしてください。")
+    return backends[0]
+
+
+def detectPageType(path):
+    """
+    保存済みページのファイル名からページ種別 (index / raceindex / oddstf) を判定する
+    """
+    base = os.path.basename(path)
+    for pageType in ('raceindex', 'raceresult', 'oddstf', 'index'):
+        if base.startswith(pageType):
+            return pageType
+    return None
+
+
+PAGE_METHODS = {
+    'index': 'parseActiveStadiums',
+    'raceindex': 'parseStadiumSchedule',
+    'oddstf': 'parseWinOdds',
+    'raceresult': 'parseRaceResult',
+}
+
+
+def verifyBackends(paths, repeat=5):
+    """
+    保存済みページを全バックエンドで解析し、出力が一致するか・解析時間を比較する
+
+    Returns:
+        bool: 全ページで全バックエンドの出力が一致すればTrue
+    """
+    backends = availableBackends()
+    print(f"バックエンド: {', '.join(b.name for b in backends)}")
+    allMatched = True
+
+    for path in paths:
+        pageType = detectPageType(path)
+        if pageType is None:
+            print(f"スキップ (種別不明): {path}")
+            continue
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        results = {}
+        timings = []
+        for backend in backends:
+            method = getattr(backend, PAGE_METHODS[pageType])
+            start = time.perf_counter()
+            for _ in range(repeat):
+                result = method(content)
+            elapsed = (time.perf_counter() - start) / repeat
+            results[backend.name] = result
+            timings.append(f"{backend.name}={elapsed * 1000:.2f}ms")
+
+        # オッズページは単勝テーブルのみの部分解析も比較する
+        if pageType == 'oddstf':
+            for backend in backends:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    result = backend.parseWinOddsPartial(content)
+                elapsed = (time.perf_counter() - start) / repeat
+                results[f"{backend.name}-partial"] = result
+                timings.append(f"{backend.name}-partial={elapsed * 1000:.2f}ms")
+
+        reference = results[backends[-1].name]
+        mismatched = [name for name, result in results.items() if result != reference]
+        status = "OK" if not mismatched else f"不一致: {', '.join(mismatched)}"
+        allMatched = allMatched and not mismatched
+        print(f"{status:<8} {pageType:<10} {' '.join(timings)}  {path}")
+
+    return allMatched
+
+
+if __name__ == "__main__":
+    # 使い方: python scripts/page_parser.py fixtures/pages/*.html
+    if len(sys.argv) < 2:
+        print("Usage: python page_parser.py <保存済みHTMLファイル>...")
+        sys.exit(1)
+    sys.exit(0 if verifyBackends(sys.argv[1:]) else 1)
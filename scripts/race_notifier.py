@@ -1,11 +1,19 @@
 import subprocess
+import time
 import requests
+from requests.adapters import HTTPAdapter
 import json
 try:
     from config import DISCORD_WEBHOOK_URL
 except ImportError:
     DISCORD_WEBHOOK_URL = None
 
+# Discord Webhook の1メッセージあたりの上限
+DISCORD_MAX_EMBEDS = 10
+DISCORD_MAX_EMBED_TOTAL_CHARS = 6000
+DISCORD_MAX_TITLE_CHARS = 256
+DISCORD_MAX_DESCRIPTION_CHARS = 4096
+
 class RaceNotifier:
     """
     通知を行うクラス (Mac Desktop / Discord Webhook)
@@ -17,6 +25,13 @@ class RaceNotifier:
         self.notificationTitle = "競艇レース通知"
         self.notificationSound = "default"
         self.discordWebhookUrl = DISCORD_WEBHOOK_URL
+        # レート制限 (429) 時に再送する回数と、待機時間の上限(秒)
+        self.maxRetries = 3
+        self.maxRetryWait = 60.0
+
+        # Webhook送信用の共有セッション (Keep-Aliveで接続を使い回す)
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
     
     def sendNotification(self, message, title=None):
         """
@@ -34,22 +49,123 @@ class RaceNotifier:
         else:
             return self._sendMac(message, title)
 
+    def sendBatch(self, items):
+        """
+        複数の通知をまとめて送信する。
+        Discord Webhook設定済みなら、1メッセージに複数のembedを詰めて送信する
+        (1メッセージあたり最大10件・合計6000文字まで)。なければ1件ずつMacへ送信する。
+
+        Args:
+            items (list): [{'title': str, 'message': str, 'url': str (省略可)}, ...]
+
+        Returns:
+            list: 各通知の送信結果 (True/False)。items と同じ順番。
+        """
+        if not items:
+            return []
+
+        if not self.discordWebhookUrl:
+            return [self.sendNotification(item['message'], item.get('title')) for item in items]
+
+        results = [False] * len(items)
+        batches = self._packEmbeds(items)
+        print(f"通知試行: {len(items)} 件を {len(batches)} メッセージにまとめて送信 (Method: Discord)")
+
+        for indexes, embeds in batches:
+            payload = {
+                "content": f"**[{self.notificationTitle}]** {len(embeds)}件",
+                "embeds": embeds
+            }
+            success = self._postDiscord(payload)
+            for i in indexes:
+                results[i] = success
+
+        return results
+
+    def _packEmbeds(self, items):
+        """
+        通知をDiscordの上限に収まるメッセージ単位に分割する
+
+        Returns:
+            list: [([itemのindex, ...], [embed, ...]), ...]
+        """
+        batches = []
+        indexes, embeds, totalChars = [], [], 0
+
+        for i, item in enumerate(items):
+            title = (item.get('title') or self.notificationTitle)[:DISCORD_MAX_TITLE_CHARS]
+            description = item['message'][:DISCORD_MAX_DESCRIPTION_CHARS]
+            embed = {"title": title, "description": description}
+            if item.get('url'):
+                embed["url"] = item['url']
+            chars = len(title) + len(description)
+
+            if embeds and (len(embeds) >= DISCORD_MAX_EMBEDS or totalChars + chars > DISCORD_MAX_EMBED_TOTAL_CHARS):
+                batches.append((indexes, embeds))
+                indexes, embeds, totalChars = [], [], 0
+
+            indexes.append(i)
+            embeds.append(embed)
+            totalChars += chars
+
+        if embeds:
+            batches.append((indexes, embeds))
+        return batches
+
     def _sendDiscord(self, content):
         """Discord Webhookで送信"""
         payload = {
             "content": content
         }
-        
+        return self._postDiscord(payload)
+
+    def _postDiscord(self, payload):
+        """
+        Discord Webhookへ送信する。
+        429 (レート制限) の場合は Retry-After 分待って再送し、
+        残り送信可能数が0なら X-RateLimit-Reset-After 分待ってから戻る。
+        """
+        for i in range(self.maxRetries + 1):
+            try:
+                resp = self.session.post(self.discordWebhookUrl, json=payload, timeout=30)
+
+                if resp.status_code == 429:
+                    wait = self._retryAfterSeconds(resp)
+                    if i >= self.maxRetries or wait > self.maxRetryWait:
+                        print(f"  -> Discord送信エラー: レート制限 (retry_after={wait:.1f}s)")
+                        return False
+                    print(f"  -> Discordレート制限中。{wait:.1f}秒後に再送します。")
+                    time.sleep(wait)
+                    continue
+
+                resp.raise_for_status()
+                print("  -> Discord送信成功")
+
+                # 次の送信が制限されないよう、残数0ならリセットまで待つ
+                if resp.headers.get('X-RateLimit-Remaining') == '0':
+                    resetAfter = float(resp.headers.get('X-RateLimit-Reset-After') or 0)
+                    time.sleep(min(resetAfter, self.maxRetryWait))
+                return True
+            except Exception as e:
+                print(f"  -> Discord送信エラー: {e}")
+                if hasattr(e, 'response') and e.response is not None:
+                    print(f"     Response: {e.response.text}")
+                return False
+        return False
+
+    @staticmethod
+    def _retryAfterSeconds(resp):
+        """
+        429 レスポンスから待機秒数を取り出す (JSONの retry_after を優先し、なければヘッダー)
+        """
         try:
-            resp = requests.post(self.discordWebhookUrl, json=payload)
-            resp.raise_for_status()
-            print("  -> Discord送信成功")
-            return True
-        except Exception as e:
-            print(f"  -> Discord送信エラー: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"     Response: {e.response.text}")
-            return False
+            return float(resp.json().get('retry_after'))
+        except (ValueError, TypeError, AttributeError):
+            pass
+        try:
+            return float(resp.headers.get('Retry-After') or 1.0)
+        except ValueError:
+            return 1.0
 
     def _sendMac(self, message, title):
         """Macデスクトップ通知で送信"""
@@ -0,0 +1,139 @@
+import array
+import datetime
+import sys
+
+# レース場コード(JCD)と名称のマッピング
+STADIUM_MAP = {
+    '01': '桐生', '02': '戸田', '03': '江戸川', '04': '平和島', '05': '多摩川',
+    '06': '浜名湖', '07': '蒲郡', '08': '常滑', '09': '津', '10': '三国',
+    '11': 'びわこ', '12': '住之江', '13': '尼崎', '14': '鳴門', '15': '丸亀',
+    '16': '児島', '17': '宮島', '18': '徳山', '19': '下関', '20': '若松',
+    '21': '芦屋', '22': '福岡', '23': '唐津', '24': '大村'
+}
+UNKNOWN_STADIUM = "不明"
+
+# 全レースで同じ文字列オブジェクトを共有する (JCD は 01〜99 の2桁)
+_JCD_STRINGS = [sys.intern(f"{code:02d}") for code in range(100)]
+
+
+def internJcd(jcd):
+    """
+    JCD を共有の文字列オブジェクトに変換する ('1' / 1 / '01' はいずれも '01')
+    """
+    return _JCD_STRINGS[int(jcd)]
+
+
+class RaceRecord:
+    """
+    1レース分の情報 (レース場コード・レース番号・締切時刻) を保持する軽量なクラス
+
+    締切時刻は UNIX 秒の整数、レース場コードは共有文字列で持ち、レース場名は JCD から引く。
+    従来のレース情報の辞書と同じく race['jcd'] / race.get('raceNo') の形でも読めるため、
+    辞書を前提にした処理にもそのまま渡せる。辞書が必要な場合は toDict() を使う。
+    """
+    __slots__ = ('jcd', 'raceNo', 'deadline')
+
+    KEYS = ('stadium', 'jcd', 'raceNo', 'deadlineTime', 'deadlineDatetime')
+
+    def __init__(self, jcd, raceNo, deadline):
+        """
+        Args:
+            jcd (str|int): レース場コード
+            raceNo (int): レース番号
+            deadline (int|datetime): 締切時刻 (UNIX秒 または datetime)
+        """
+        self.jcd = internJcd(jcd)
+        self.raceNo = int(raceNo)
+        if isinstance(deadline, datetime.datetime):
+            deadline = deadline.timestamp()
+        self.deadline = int(deadline)
+
+    @property
+    def stadium(self):
+        return STADIUM_MAP.get(self.jcd, UNKNOWN_STADIUM)
+
+    @property
+    def deadlineDatetime(self):
+        return datetime.datetime.fromtimestamp(self.deadline)
+
+    @property
+    def deadlineTime(self):
+        return self.deadlineDatetime.strftime('%H:%M')
+
+    # --- 辞書形式との互換 ---
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.KEYS else default
+
+    def keys(self):
+        return self.KEYS
+
+    def toDict(self):
+        return {key: getattr(self, key) for key in self.KEYS}
+
+    @classmethod
+    def fromDict(cls, data):
+        """
+        レース情報の辞書 (deadlineDatetime は datetime または ISO 形式の文字列) から作る
+        """
+        if isinstance(data, cls):
+            return data
+        deadline = data['deadlineDatetime']
+        if isinstance(deadline, str):
+            deadline = datetime.datetime.fromisoformat(deadline)
+        return cls(data['jcd'], data['raceNo'], deadline)
+
+    def __repr__(self):
+        return f"RaceRecord(jcd={self.jcd!r}, raceNo={self.raceNo}, deadline={self.deadlineDatetime.isoformat()})"
+
+    def __eq__(self, other):
+        if not isinstance(other, RaceRecord):
+            return NotImplemented
+        return (self.jcd, self.raceNo, self.deadline) == (other.jcd, other.raceNo, other.deadline)
+
+    def __hash__(self):
+        return hash((self.jcd, self.raceNo, self.deadline))
+
+
+class RaceArray:
+    """
+    多数のレースを型付き配列 (array) で列ごとに保持するコンテナ
+
+    1レースあたり約10バイトで保持し、取り出すときに RaceRecord を作る。
+    複数日分のスケジュールやバックフィルなど、大量のレースを持ち続ける場合に使う。
+    """
+    def __init__(self, races=()):
+        self.jcds = array.array('B')
+        self.raceNos = array.array('B')
+        self.deadlines = array.array('q')
+        self.extend(races)
+
+    def append(self, race):
+        race = RaceRecord.fromDict(race)
+        self.jcds.append(int(race.jcd))
+        self.raceNos.append(race.raceNo)
+        self.deadlines.append(race.deadline)
+
+    def extend(self, races):
+        for race in races:
+            self.append(race)
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return RaceRecord(_JCD_STRINGS[self.jcds[index]], self.raceNos[index], self.deadlines[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def toRecords(self):
+        return list(self)
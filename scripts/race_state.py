@@ -0,0 +1,133 @@
+import datetime
+import os
+import sqlite3
+
+# Actions のキャッシュ対象 (cache/) に置き、実行間で引き継ぐ
+DEFAULT_STATE_PATH = os.environ.get('RACE_STATE_PATH', 'cache/race_state.sqlite3')
+# 送信中のまま残った予約 (異常終了など) を無効とみなすまでの時間(分)
+CLAIM_EXPIRE_MINUTES = 10
+
+VERDICT_NO_ALERT = 1 # どの通知ルールにも該当しない (通知しない)
+VERDICT_ALERT = 0    # いずれかの通知ルールに該当 (通知対象)
+
+
+class RaceStateStore:
+    """
+    レースごとの判定結果・通知状況を保存するSQLiteストア
+
+    check_races_batch.py の実行間で状態を共有し、以下を実現する。
+      - 通知ルールに該当しないと判定済みのレースはオッズを再取得しない
+      - 通知済みのレースは再通知しない (チェック範囲が重なる高頻度実行でも重複しない)
+      - 送信前に「予約」を取り、同時に動いている実行との二重送信を防ぐ
+    """
+    def __init__(self, path=DEFAULT_STATE_PATH):
+        self.path = path
+        dirName = os.path.dirname(path)
+        if dirName:
+            os.makedirs(dirName, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS race_state (
+                race_date TEXT NOT NULL,
+                jcd TEXT NOT NULL,
+                race_no INTEGER NOT NULL,
+                verdict INTEGER,
+                checked_at TEXT,
+                claimed_at TEXT,
+                notified_at TEXT,
+                margin REAL,
+                PRIMARY KEY (race_date, jcd, race_no)
+            )
+        """)
+        # 以前の形式のファイル (margin 列なし) を引き継いだ場合は列を追加する
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(race_state)")}
+        if 'margin' not in columns:
+            self.conn.execute("ALTER TABLE race_state ADD COLUMN margin REAL")
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def raceKey(race):
+        """
+        レースを一意に表すキー (race_date, jcd, race_no)
+        """
+        return (race['deadlineDatetime'].strftime('%Y%m%d'), race['jcd'], int(race['raceNo']))
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now().isoformat(timespec='seconds')
+
+    def getStates(self, races):
+        """
+        レースごとの保存済み状態を返す
+
+        Returns:
+            dict: {(race_date, jcd, race_no): {'verdict', 'checked_at', 'notified_at', 'margin'}}
+        """
+        states = {}
+        for race in races:
+            key = self.raceKey(race)
+            row = self.conn.execute(
+                "SELECT verdict, checked_at, notified_at, margin FROM race_state WHERE race_date=? AND jcd=? AND race_no=?",
+                key
+            ).fetchone()
+            if row:
+                states[key] = {'verdict': row[0], 'checked_at': row[1], 'notified_at': row[2], 'margin': row[3]}
+        return states
+
+    def recordVerdict(self, race, matched, margin=None):
+        """
+        オッズ判定結果 (通知ルールに該当したか) を記録する (matched が None の場合は記録しない)
+
+        margin には判定時の1番人気の余裕 (RaceOdds.favoriteMargin) を記録し、再確認の優先度に使う
+        """
+        if matched is None:
+            return
+        verdict = VERDICT_ALERT if matched else VERDICT_NO_ALERT
+        self.conn.execute("""
+            INSERT INTO race_state (race_date, jcd, race_no, verdict, checked_at, margin) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (race_date, jcd, race_no)
+            DO UPDATE SET verdict=excluded.verdict, checked_at=excluded.checked_at, margin=excluded.margin
+        """, (*self.raceKey(race), verdict, self._now(), margin))
+
+    def claimNotification(self, race):
+        """
+        通知の送信予約を取る。未通知かつ他の実行が予約していない場合のみ成功する
+
+        Returns:
+            bool: 予約できたら True (このプロセスが送信してよい)
+        """
+        now = datetime.datetime.now()
+        expired = (now - datetime.timedelta(minutes=CLAIM_EXPIRE_MINUTES)).isoformat(timespec='seconds')
+        key = self.raceKey(race)
+        self.conn.execute("INSERT OR IGNORE INTO race_state (race_date, jcd, race_no) VALUES (?, ?, ?)", key)
+        cursor = self.conn.execute("""
+            UPDATE race_state SET claimed_at=?
+            WHERE race_date=? AND jcd=? AND race_no=? AND notified_at IS NULL
+              AND (claimed_at IS NULL OR claimed_at < ?)
+        """, (now.isoformat(timespec='seconds'), *key, expired))
+        return cursor.rowcount == 1
+
+    def markNotified(self, race):
+        self.conn.execute(
+            "UPDATE race_state SET notified_at=?, claimed_at=NULL WHERE race_date=? AND jcd=? AND race_no=?",
+            (self._now(), *self.raceKey(race))
+        )
+
+    def releaseClaim(self, race):
+        """
+        送信に失敗した場合に予約を取り消す (次回の実行で再送される)
+        """
+        self.conn.execute(
+            "UPDATE race_state SET claimed_at=NULL WHERE race_date=? AND jcd=? AND race_no=?",
+            self.raceKey(race)
+        )
+
+    def purge(self, keepDays=7):
+        """
+        keepDays 日より前のレースの状態を削除する
+        """
+        limit = (datetime.datetime.now() - datetime.timedelta(days=keepDays)).strftime('%Y%m%d')
+        self.conn.execute("DELETE FROM race_state WHERE race_date < ?", (limit,))
@@ -0,0 +1,174 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    ホスト単位のリクエスト間隔を制御するクラス (スレッドセーフ)
+
+    複数スレッドから同時に acquire() された場合でも、
+    リクエストの送信間隔が 1 / requestsPerSecond 秒以上空くように待機させる。
+    """
+    def __init__(self, requestsPerSecond=2.0):
+        # requestsPerSecond が 0 以下 or None の場合は制限なし
+        self.interval = 1.0 / requestsPerSecond if requestsPerSecond else 0.0
+        self._lock = threading.Lock()
+        self._nextSlot = 0.0
+
+    def acquire(self, deadline=None):
+        """
+        次のリクエスト送信枠まで待機する
+
+        Args:
+            deadline (float, optional): time.monotonic() の期限。送信枠がこれより後になる場合は予約せずに False を返す
+
+        Returns:
+            bool: 送信枠を確保できたか
+        """
+        if self.interval <= 0:
+            return True
+
+        # 送信枠の予約だけをロック内で行い、待機はロック外で行う
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._nextSlot)
+            if deadline is not None and slot >= deadline:
+                return False
+            self._nextSlot = slot + self.interval
+
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    同時リクエスト数を AIMD (加算増加・乗算減少) で自動調整するクラス (スレッドセーフ)
+
+    - 応答が latencyTarget 秒以内に成功している間は、上限を少しずつ (約 +1 / 上限分の成功) 引き上げる
+    - 429 / 5xx / タイムアウトなどの過負荷の兆候があれば、上限を decreaseFactor 倍に下げる
+      (同じ混雑で何度も下げないよう、cooldown 秒に1回まで)
+    acquire() で枠が空くまで待ち、応答後に release() で結果を報告する。
+    """
+    def __init__(self, maxConcurrency=4, minConcurrency=1, initialConcurrency=None,
+                 latencyTarget=3.0, decreaseFactor=0.5, cooldown=1.0):
+        self.maxConcurrency = max(1, maxConcurrency)
+        self.minConcurrency = max(1, min(minConcurrency, self.maxConcurrency))
+        if initialConcurrency is None:
+            initialConcurrency = max(self.minConcurrency, self.maxConcurrency / 2)
+        self.limit = float(min(self.maxConcurrency, max(self.minConcurrency, initialConcurrency)))
+        self.latencyTarget = latencyTarget
+        self.decreaseFactor = decreaseFactor
+        self.cooldown = cooldown
+        self.inFlight = 0
+        self._lastDecrease = float('-inf')
+        self._condition = threading.Condition()
+
+    def acquire(self, deadline=None):
+        """
+        同時リクエスト数が上限未満になるまで待機して枠を確保する
+
+        Args:
+            deadline (float, optional): time.monotonic() の期限。それまでに空かなければ False を返す
+
+        Returns:
+            bool: 枠を確保できたか
+        """
+        with self._condition:
+            while self.inFlight >= int(self.limit):
+                if deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self.inFlight += 1
+            return True
+
+    def release(self, latency=None, overloaded=False):
+        """
+        確保した枠を返し、応答結果に応じて上限を調整する
+
+        Args:
+            latency (float, optional): 応答までの秒数 (通信エラー時は None)
+            overloaded (bool): 429 / 5xx / タイムアウトなど、相手が過負荷と判断できる結果か
+        """
+        with self._condition:
+            self.inFlight -= 1
+            if overloaded:
+                now = time.monotonic()
+                if now - self._lastDecrease >= self.cooldown:
+                    self.limit = max(self.minConcurrency, self.limit * self.decreaseFactor)
+                    self._lastDecrease = now
+            elif latency is not None and latency <= self.latencyTarget:
+                self.limit = min(self.maxConcurrency, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """
+    相手サイトの停止を検知して、リクエストを送らずに即座に失敗させるクラス (スレッドセーフ)
+
+    - closed: 通常状態。failureThreshold 回連続で失敗したら open にする
+    - open: resetTimeout 秒間はリクエストを送らない (allow() が False)
+    - half_open: resetTimeout 経過後、1件だけ試しに送る。成功なら closed、失敗なら再び open
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failureThreshold=5, resetTimeout=60.0):
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.state = self.CLOSED
+        self.consecutiveFailures = 0
+        self._openedAt = 0.0
+        self._trialInFlight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """
+        リクエストを送ってよいか
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self._openedAt < self.resetTimeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self._trialInFlight = False
+            # half_open: 試しに送るのは同時に1件だけ
+            if self._trialInFlight:
+                return False
+            self._trialInFlight = True
+            return True
+
+    def cancelTrial(self):
+        """
+        allow() の後にリクエストを送らずに終わった場合に呼ぶ (half_open の試行枠を返す)
+
+        呼ばないと試行中のまま残り、以降の allow() が全て False になる。
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trialInFlight = False
+
+    def recordSuccess(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutiveFailures = 0
+            self._trialInFlight = False
+
+    def recordFailure(self):
+        with self._lock:
+            self.consecutiveFailures += 1
+            if self.state == self.HALF_OPEN or self.consecutiveFailures >= self.failureThreshold:
+                if self.state != self.OPEN:
+                    print(f"サーキットブレーカー: 連続 {self.consecutiveFailures} 回失敗したため "
+                          f"{self.resetTimeout:.0f}秒間リクエストを停止します。")
+                self.state = self.OPEN
+                self._openedAt = time.monotonic()
+                self._trialInFlight = False
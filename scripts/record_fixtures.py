@@ -0,0 +1,61 @@
+import argparse
+import datetime
+import os
+from schedule_fetcher import ScheduleFetcher
+from fixture_server import DEFAULT_FIXTURE_DIR
+
+
+def recordFixtures(targetDate=None, outputDir=DEFAULT_FIXTURE_DIR, oddsRacesPerStadium=3, maxStadiums=None):
+    """
+    公式サイトの index / raceindex / oddstf ページをそのまま保存し、ベンチマーク用のコーパスを作る
+
+    保存先は <outputDir>/<hd>/ 以下で、ファイル名は fixture_server.py が参照する形式
+    (index.html / raceindex_jcdXX.html / oddstf_jcdXX_rnoYY.html)。
+
+    Args:
+        targetDate (str, optional): 収集対象日 (YYYYMMDD形式)。省略時は当日。
+        oddsRacesPerStadium (int): 1場あたり保存するオッズページ数 (1Rから順に)
+        maxStadiums (int, optional): 保存するレース場数の上限
+    """
+    if targetDate is None:
+        targetDate = datetime.datetime.now().strftime('%Y%m%d')
+
+    fetcher = ScheduleFetcher()
+    dateDir = os.path.join(outputDir, targetDate)
+    os.makedirs(dateDir, exist_ok=True)
+
+    def save(url, fileName):
+        resp, _ = fetcher.fetchPage(url)
+        if not resp:
+            print(f"取得失敗: {url}")
+            return None
+        with open(os.path.join(dateDir, fileName), 'wb') as f:
+            f.write(resp.content)
+        print(f"保存: {fileName} ({len(resp.content) / 1024:.0f} KB)")
+        return resp.content
+
+    content = save(f"{fetcher.baseUrl}/index?hd={targetDate}", 'index.html')
+    if content is None:
+        return
+
+    stadiums = fetcher.parser.parseActiveStadiums(content)
+    if maxStadiums is not None:
+        stadiums = stadiums[:maxStadiums]
+
+    for stadium in stadiums:
+        jcd = stadium['jcd']
+        save(f"{fetcher.baseUrl}/raceindex?jcd={jcd}&hd={targetDate}", f"raceindex_jcd{jcd}.html")
+        for raceNo in range(1, oddsRacesPerStadium + 1):
+            save(f"{fetcher.baseUrl}/oddstf?jcd={jcd}&rno={raceNo}&hd={targetDate}",
+                 f"oddstf_jcd{jcd}_rno{raceNo:02d}.html")
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="公式サイトのページを保存してベンチマーク用コーパスを作る")
+    argParser.add_argument('--date', help="収集対象日 (YYYYMMDD)。省略時は当日")
+    argParser.add_argument('--output', default=DEFAULT_FIXTURE_DIR, help="保存先ディレクトリ")
+    argParser.add_argument('--odds-races', type=int, default=3, help="1場あたり保存するオッズページ数")
+    argParser.add_argument('--max-stadiums', type=int, help="保存するレース場数の上限")
+    args = argParser.parse_args()
+
+    recordFixtures(args.date, args.output, args.odds_races, args.max_stadiums)
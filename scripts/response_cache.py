@@ -0,0 +1,234 @@
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zlib
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Actions のキャッシュ対象 (cache/) に置き、実行間・スクリプト間で共有する
+DEFAULT_RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH', 'cache/http_responses.sqlite3')
+# キャッシュ全体の上限 (圧縮後のサイズ)。超えたら最後に使われたのが古いものから削除する
+DEFAULT_MAX_BYTES = int(float(os.environ.get('RESPONSE_CACHE_MAX_MB', '64')) * 1024 * 1024)
+
+# ページ種別ごとの有効期間(秒)。0 または未定義のページはキャッシュしない
+DEFAULT_TTLS = {
+    'index': 300,       # 開催情報 (中止・順延など) の変更検知に使うため短め
+    'raceindex': 7200,  # 締切時刻はほとんど変わらない
+    'oddstf': 20,       # オッズは締切まで変動する
+    'raceresult': 600,  # 確定前は内容が変わる (過去の日付は PAST_DATE_TTL)
+}
+# 過去の日付 (hd=) のページは内容が変わらないため長く保持する
+PAST_DATE_TTL = 30 * 86400
+# 期限切れ後もこの時間(秒)は再検証 (ETag / Last-Modified) 用に残す
+STALE_KEEP_SECONDS = 86400
+# 保存するレスポンスヘッダー
+KEPT_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+def pageType(url):
+    """
+    URLのページ種別 (index / raceindex / oddstf など)
+    """
+    return url.split('?')[0].rstrip('/').rsplit('/', 1)[-1]
+
+
+def parseTtls(text):
+    """
+    'index=300,oddstf=0' 形式の文字列を DEFAULT_TTLS に上書きした辞書を返す
+    """
+    ttls = dict(DEFAULT_TTLS)
+    for item in (text or '').split(','):
+        if '=' in item:
+            name, seconds = item.split('=', 1)
+            ttls[name.strip()] = float(seconds)
+    return ttls
+
+
+class ResponseCache:
+    """
+    公式サイトのレスポンスをSQLiteに保存し、ページ種別ごとの有効期間内は再利用するキャッシュ
+
+    - 本文は zlib で圧縮して保存し、合計サイズが maxBytes を超えたら最後に使われたのが古いものから削除する
+    - 有効期間を過ぎたレスポンスも ETag / Last-Modified があれば残し、条件付きリクエストの再検証に使う
+    - 複数スレッド・複数プロセス (WAL) から同時に使ってよい
+    ヒット数・ミス数などは stats に集計される。
+    """
+    def __init__(self, path=DEFAULT_RESPONSE_CACHE_PATH, ttls=None, maxBytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttls = ttls if ttls is not None else parseTtls(os.environ.get('RESPONSE_CACHE_TTLS'))
+        self.maxBytes = maxBytes
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'stores': 0, 'evictions': 0, 'bytesSaved': 0}
+
+        dirName = os.path.dirname(path)
+        if dirName:
+            os.makedirs(dirName, exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                page_type TEXT NOT NULL,
+                content BLOB NOT NULL,
+                headers TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                raw_size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+        self.conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time() - STALE_KEEP_SECONDS,))
+        # 保存済みの合計サイズの見積もり (put のたびに加算し、上限を超えたときだけ実際の値を数え直す)
+        self._totalBytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @classmethod
+    def fromEnv(cls):
+        """
+        環境変数 RESPONSE_CACHE が '0' でなければ既定の設定で作る (無効なら None)
+        """
+        if os.environ.get('RESPONSE_CACHE', '1') == '0':
+            return None
+        return cls()
+
+    def ttlFor(self, url):
+        """
+        URLの有効期間(秒)。0 ならキャッシュしない
+        """
+        ttl = self.ttls.get(pageType(url), 0)
+        if ttl <= 0:
+            return 0
+        dateStr = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query).get('hd', [None])[0]
+        if dateStr and dateStr < datetime.datetime.now().strftime('%Y%m%d'):
+            return PAST_DATE_TTL
+        return ttl
+
+    def get(self, url):
+        """
+        保存済みのレスポンスを返す
+
+        Returns:
+            tuple: (response, fresh)
+                response: requests.Response (保存されていなければ None)
+                fresh: 有効期間内なら True (False の場合は再検証にのみ使う)
+        """
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT content, headers, raw_size, expires_at FROM responses WHERE url=?", (url,)
+            ).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None, False
+            fresh = row[3] >= now
+            if fresh:
+                self.conn.execute("UPDATE responses SET last_access=? WHERE url=?", (now, url))
+                self.stats['hits'] += 1
+                self.stats['bytesSaved'] += row[2]
+            else:
+                self.stats['stale'] += 1
+        return self._buildResponse(url, zlib.decompress(row[0]), json.loads(row[1])), fresh
+
+    def put(self, url, resp, ttl=None):
+        """
+        レスポンスを保存する (ttl 省略時は ttlFor(url))
+        """
+        ttl = self.ttlFor(url) if ttl is None else ttl
+        if ttl <= 0 or resp.status_code != 200:
+            return
+        content = zlib.compress(resp.content, 6)
+        headers = {name: resp.headers[name] for name in KEPT_HEADERS if resp.headers.get(name)}
+        now = time.time()
+        with self._lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO responses
+                    (url, page_type, content, headers, size, raw_size, stored_at, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (url, pageType(url), content, json.dumps(headers), len(content), len(resp.content),
+                  now, now + ttl, now))
+            self.stats['stores'] += 1
+            self._totalBytes += len(content)
+            if self._totalBytes > self.maxBytes:
+                self._evict()
+
+    def touch(self, url, ttl=None):
+        """
+        再検証 (304 Not Modified) できたレスポンスの有効期間を延ばす
+        """
+        ttl = self.ttlFor(url) if ttl is None else ttl
+        now = time.time()
+        with self._lock:
+            self.conn.execute("UPDATE responses SET stored_at=?, expires_at=?, last_access=? WHERE url=?",
+                              (now, now + ttl, now, url))
+
+    def _evict(self):
+        """
+        合計サイズが上限を超えていれば、上限の9割まで最後に使われたのが古いものから削除する
+
+        見積もり (_totalBytes) は置き換え・他のプロセスの書き込みで実際とずれるため、ここで数え直す。
+        """
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self.maxBytes:
+            target = self.maxBytes * 0.9
+            evicted = []
+            for url, size in self.conn.execute("SELECT url, size FROM responses ORDER BY last_access"):
+                if total <= target:
+                    break
+                evicted.append((url,))
+                total -= size
+            self.conn.executemany("DELETE FROM responses WHERE url=?", evicted)
+            self.stats['evictions'] += len(evicted)
+        self._totalBytes = total
+
+    def summary(self):
+        """
+        件数・サイズ (ページ種別ごと) と今回の実行のヒット数などを返す
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT page_type, COUNT(*), SUM(size), SUM(raw_size) FROM responses GROUP BY page_type"
+            ).fetchall()
+            return {
+                'entries': {pageName: {'count': count, 'bytes': size, 'rawBytes': rawSize}
+                            for pageName, count, size, rawSize in rows},
+                'stats': dict(self.stats),
+            }
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM responses")
+            self._totalBytes = 0
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    @staticmethod
+    def _buildResponse(url, content, headers):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = content
+        resp.headers = CaseInsensitiveDict(headers)
+        resp.url = url
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+        return resp
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="公式サイトのレスポンスキャッシュの状況を表示する")
+    argParser.add_argument('--clear', action='store_true', help="キャッシュを全て削除する")
+    args = argParser.parse_args()
+
+    cache = ResponseCache()
+    if args.clear:
+        cache.clear()
+        print("キャッシュを削除しました。")
+    for name, entry in sorted(cache.summary()['entries'].items()):
+        print(f"{name}: {entry['count']} 件 / {entry['bytes'] / 1024:.0f} KB (展開後 {entry['rawBytes'] / 1024:.0f} KB)")
+    cache.close()
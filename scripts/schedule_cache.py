@@ -0,0 +1,201 @@
+import datetime
+import json
+import os
+from schedule_fetcher import DEFAULT_LOOKAHEAD_MINUTES, ScheduleFetcher
+from race_record import RaceRecord
+
+# 環境変数で上書き可能な既定値
+DEFAULT_CACHE_DIR = os.environ.get('SCHEDULE_CACHE_DIR', 'cache/schedules')
+DEFAULT_TTL_MINUTES = float(os.environ.get('SCHEDULE_CACHE_TTL_MINUTES', '120'))
+# 何日分のスナップショットを残すか
+KEEP_DAYS = 3
+
+
+class ScheduleCache:
+    """
+    1日分のレーススケジュールをディスク上にJSONで保存するキャッシュクラス
+
+    スナップショットは開催日 (hd) ごとに1ファイル。
+    各レース場のスケジュールは以下のいずれかの場合のみ再取得する。
+      - 前回取得からTTL(分)を超えた
+      - トップページ上のレース場ブロックのフィンガープリントが変わった (中止・順延など)
+      - 新たに開催場が追加された
+    ただし全レースの締切を過ぎた場と、lookaheadMinutes 分以内に締切のレースがない場は
+    上記に該当してもキャッシュを使い回す (先読み範囲に入った時点で再取得される)。
+    GitHub Actions では cacheDir を actions/cache で実行間に引き継ぐ想定。
+    """
+    def __init__(self, cacheDir=DEFAULT_CACHE_DIR, ttlMinutes=DEFAULT_TTL_MINUTES, lookaheadMinutes=DEFAULT_LOOKAHEAD_MINUTES):
+        self.cacheDir = cacheDir
+        self.ttl = datetime.timedelta(minutes=ttlMinutes)
+        self.lookaheadMinutes = lookaheadMinutes
+
+    def getSchedules(self, fetcher, targetDate=None, checkIndex=True):
+        """
+        キャッシュを利用して fetchAllSchedules() と同じ形式のレース情報リストを返す
+
+        Args:
+            fetcher (ScheduleFetcher): キャッシュミス時に使用するフェッチャー
+            targetDate (str, optional): 取得対象日 (YYYYMMDD形式)。省略時は当日。
+            checkIndex (bool): Trueならトップページを1回取得してフィンガープリントを照合する。
+                               FalseならTTL内のスナップショットをリクエストなしで返す。
+
+        Returns:
+            list: レース情報の辞書リスト
+        """
+        if targetDate is None:
+            targetDate = datetime.datetime.now().strftime('%Y%m%d')
+
+        now = datetime.datetime.now()
+        snapshot = self.load(targetDate)
+
+        if snapshot and not checkIndex and not self._expiredStadiums(snapshot, now):
+            print(f"スケジュールキャッシュ使用: {targetDate} (リクエストなし)")
+            fetcher.telemetry.increment('schedule_cache.hits', len(snapshot['stadiums']))
+            return self._flatten(snapshot)
+
+        activeStadiums = fetcher._getActiveStadiums(targetDate)
+        if not activeStadiums:
+            if snapshot:
+                print("トップページを取得できないため、キャッシュ済みスケジュールを使用します。")
+                return self._flatten(snapshot)
+            print("開催中のレース場が見つかりませんでした。")
+            return []
+
+        cached = snapshot['stadiums'] if snapshot else {}
+        staleStadiums = []
+        for stadium in activeStadiums:
+            entry = cached.get(stadium['jcd'])
+            if entry is None:
+                staleStadiums.append(stadium)
+            elif not self._isUpcoming(entry, now):
+                # 終了済み・次のレースがまだ先の場は再取得しない
+                # (フィンガープリントは更新しないため、変更は先読み範囲に入った時点で反映される)
+                continue
+            elif entry.get('fingerprint') != stadium.get('fingerprint'):
+                print(f"開催情報の変更を検知: {stadium['name']} (JCD:{stadium['jcd']})")
+                staleStadiums.append(stadium)
+            elif now - datetime.datetime.fromisoformat(entry['fetchedAt']) >= self.ttl:
+                staleStadiums.append(stadium)
+
+        print(f"スケジュールキャッシュ: 再利用 {len(activeStadiums) - len(staleStadiums)} 場 / 再取得 {len(staleStadiums)} 場")
+        fetcher.telemetry.increment('schedule_cache.hits', len(activeStadiums) - len(staleStadiums))
+        fetcher.telemetry.increment('schedule_cache.misses', len(staleStadiums))
+
+        refreshed = {}
+        if staleStadiums:
+            # 変更の検知・TTL切れによる再取得のため、レスポンスキャッシュの有効期間内でも公式サイトに確認する
+            races = fetcher.fetchStadiumSchedules(staleStadiums, targetDate, revalidate=True)
+            for race in races:
+                refreshed.setdefault(race['jcd'], []).append(race)
+
+        # トップページに載っているレース場のみでスナップショットを再構成する
+        stadiums = {}
+        fetchedAt = now.isoformat(timespec='seconds')
+        staleJcds = {s['jcd'] for s in staleStadiums}
+        for stadium in activeStadiums:
+            jcd = stadium['jcd']
+            if jcd in staleJcds:
+                # 取得に失敗した場合は古いデータを残し (なければ保存しない)、次回再取得させる
+                if jcd not in refreshed:
+                    if jcd in cached:
+                        stadiums[jcd] = cached[jcd]
+                    continue
+                stadiums[jcd] = {
+                    'name': stadium['name'],
+                    'fingerprint': stadium.get('fingerprint'),
+                    'fetchedAt': fetchedAt,
+                    'races': [self._serializeRace(r) for r in refreshed.get(jcd, [])]
+                }
+            else:
+                stadiums[jcd] = cached[jcd]
+
+        snapshot = {'hd': targetDate, 'savedAt': fetchedAt, 'stadiums': stadiums}
+        if staleStadiums:
+            self.save(targetDate, snapshot)
+
+        allSchedules = self._flatten(snapshot)
+        print(f"全スケジュール取得完了: 合計 {len(allSchedules)} レース")
+        return allSchedules
+
+    def load(self, targetDate):
+        """
+        スナップショットを読み込む。存在しない・壊れている場合は None
+        """
+        path = self._path(targetDate)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            if snapshot.get('hd') != targetDate:
+                return None
+            return snapshot
+        except (OSError, ValueError) as e:
+            print(f"スケジュールキャッシュ読み込みエラー: {e}")
+            return None
+
+    def save(self, targetDate, snapshot):
+        """
+        スナップショットを書き込む (途中で落ちても壊れないよう一時ファイル経由で置換)
+        """
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            path = self._path(targetDate)
+            tmpPath = f"{path}.tmp"
+            with open(tmpPath, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmpPath, path)
+            self._cleanup(targetDate)
+        except OSError as e:
+            print(f"スケジュールキャッシュ書き込みエラー: {e}")
+
+    def _path(self, targetDate):
+        return os.path.join(self.cacheDir, f"schedule_{targetDate}.json")
+
+    def _cleanup(self, targetDate):
+        """
+        KEEP_DAYS 日より古いスナップショットを削除する
+        """
+        try:
+            baseDate = datetime.datetime.strptime(targetDate, '%Y%m%d')
+        except ValueError:
+            return
+        limit = (baseDate - datetime.timedelta(days=KEEP_DAYS)).strftime('%Y%m%d')
+        for name in os.listdir(self.cacheDir):
+            if name.startswith('schedule_') and name.endswith('.json'):
+                hd = name[len('schedule_'):-len('.json')]
+                if hd < limit:
+                    os.remove(os.path.join(self.cacheDir, name))
+
+    def _expiredStadiums(self, snapshot, now):
+        return [
+            jcd for jcd, entry in snapshot['stadiums'].items()
+            if now - datetime.datetime.fromisoformat(entry['fetchedAt']) >= self.ttl and self._isUpcoming(entry, now)
+        ]
+
+    def _isUpcoming(self, entry, now):
+        """
+        スナップショット上のレース場に、先読み範囲内に締切を迎えるレースがあるか
+        """
+        races = [self._deserializeRace(race) for race in entry['races']]
+        return ScheduleFetcher.stadiumNeedsRefresh(races, now, self.lookaheadMinutes)
+
+    def _flatten(self, snapshot):
+        """
+        スナップショットをレース情報 (RaceRecord) のリスト (JCD順) に戻す
+        """
+        allSchedules = []
+        for jcd in sorted(snapshot['stadiums']):
+            for race in snapshot['stadiums'][jcd]['races']:
+                allSchedules.append(self._deserializeRace(race))
+        return allSchedules
+
+    @staticmethod
+    def _serializeRace(race):
+        data = RaceRecord.fromDict(race).toDict()
+        data['deadlineDatetime'] = data['deadlineDatetime'].isoformat()
+        return data
+
+    @staticmethod
+    def _deserializeRace(data):
+        return RaceRecord.fromDict(data)
@@ -1,49 +1,125 @@
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+import collections
 import datetime
+import email.utils
+import functools
+import hashlib
+import os
+import threading
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor, wait
+from rate_limiter import AdaptiveConcurrencyLimiter, CircuitBreaker, RateLimiter
+from telemetry import Telemetry
+from response_cache import ResponseCache, pageType
+from race_record import RaceRecord, STADIUM_MAP
+import page_parser
+
+# 再試行で回復する見込みのあるHTTPステータス (それ以外の4xxは即座に失敗とする)
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# 差分更新で再取得の対象とする締切の先読み範囲(分)
+DEFAULT_LOOKAHEAD_MINUTES = float(os.environ.get('SCHEDULE_REFRESH_LOOKAHEAD_MINUTES', '60'))
+
+
+def _timedStage(name):
+    """
+    メソッドの所要時間を self.telemetry の処理段階 name として積算するデコレーター
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.telemetry.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
 
 class ScheduleFetcher:
     """
     ボートレース公式サイトから当日のレーススケジュールを取得するクラス
     """
     # レース場コード(JCD)と名称のマッピング
-    STADIUM_MAP = {
-        '01': '桐生', '02': '戸田', '03': '江戸川', '04': '平和島', '05': '多摩川',
-        '06': '浜名湖', '07': '蒲郡', '08': '常滑', '09': '津', '10': '三国',
-        '11': 'びわこ', '12': '住之江', '13': '尼崎', '14': '鳴門', '15': '丸亀',
-        '16': '児島', '17': '宮島', '18': '徳山', '19': '下関', '20': '若松',
-        '21': '芦屋', '22': '福岡', '23': '唐津', '24': '大村'
-    }
-
-    def __init__(self):
-        # アクセス先ドメイン
-        self.baseUrl = "https://www.boatrace.jp/owpc/pc/race"
+    STADIUM_MAP = STADIUM_MAP
+
+    # ETag / Last-Modified による条件付きリクエストを行うページ
+    # (オッズページは毎回内容が変わるため対象外)
+    CONDITIONAL_PAGES = ('index', 'raceindex')
+
+    def __init__(self, maxWorkers=4, requestsPerSecond=2.0, parser=None, telemetry=None, responseCache=None):
+        """
+        Args:
+            maxWorkers (int): 並列取得時の最大同時リクエスト数
+            requestsPerSecond (float): 公式サイトへの秒間リクエスト数の上限 (0以下で無制限)
+            parser (str, optional): HTML解析バックエンド ('selectolax' / 'lxml' / 'bs4')。
+                                    省略時はインストール済みの最速のものを使う。
+            telemetry (Telemetry, optional): 計測値の記録先。省略時は新たに作る。
+            responseCache (ResponseCache, optional): レスポンスの保存先。省略時は既定のファイル
+                                    (環境変数 RESPONSE_CACHE=0 なら使わない)。False でキャッシュしない。
+        """
+        # アクセス先ドメイン (ローカルの fixture_server.py を使う場合は環境変数で差し替える)
+        self.baseUrl = os.environ.get('BOATRACE_BASE_URL', "https://www.boatrace.jp/owpc/pc/race")
         # アクセス拒否回避のためのヘッダー情報
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         }
+        self.maxWorkers = maxWorkers
+        # HTML解析バックエンド (page_parser 参照)
+        self.parser = page_parser.getBackend(parser)
+        # オッズページは単勝テーブルだけを切り出して解析する (Falseで文書全体を解析)
+        self.partialOddsParse = True
+        # サーバー負荷軽減のため、全スレッド共通でリクエスト間隔を制御する
+        self.rateLimiter = RateLimiter(requestsPerSecond)
+        # 実際の同時リクエスト数は応答状況に応じて 1〜maxWorkers の間で自動調整する
+        self.concurrencyLimiter = AdaptiveConcurrencyLimiter(maxConcurrency=maxWorkers)
+        # サイト停止中は連続失敗を検知してリクエストを止め、タイムアウト待ちで時間を使い切らないようにする
+        self.circuitBreaker = CircuitBreaker()
+        # (接続, 読み込み) のタイムアウト秒数
+        self.requestTimeout = (5, 20)
+
+        # Keep-Aliveで接続を使い回すための共有セッション
+        # (リトライは _fetchWithRetry 側で制御するため urllib3 のリトライは無効)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(maxWorkers, 4), max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
 
-    def fetchAllSchedules(self, targetDate=None):
+        # リトライ待機時間 (指数バックオフ + ジッター) の基準値と上限(秒)
+        self.backoffBase = 1.0
+        self.backoffMax = 30.0
+
+        # 条件付きリクエスト用に、ETag / Last-Modified 付きのレスポンスをURLごとに保持する
+        self._validatedResponses = {}
+        # リクエストごとの計測結果 (直近のみ保持) と集計値
+        self.fetchLog = collections.deque(maxlen=1000)
+        self.fetchStats = {'requests': 0, 'attempts': 0, 'failures': 0, 'notModified': 0, 'cacheHits': 0,
+                           'bytes': 0, 'elapsed': 0.0}
+        self._statsLock = threading.Lock()
+        # 処理段階・ページ種別ごとの所要時間、キャッシュヒット数などの計測 (telemetry.py 参照)
+        self.telemetry = telemetry or Telemetry()
+        # ページ種別ごとの有効期間内は、前回までの実行 (他のスクリプトを含む) のレスポンスを再利用する
+        self.responseCache = ResponseCache.fromEnv() if responseCache is None else (responseCache or None)
+
+    def fetchAllSchedules(self, targetDate=None, concurrent=True):
         """
         指定された日付（デフォルトは当日）の全開催場のレーススケジュールを取得して返す
         
         Args:
             targetDate (str, optional): 取得対象日 (YYYYMMDD形式)。省略時は当日。
+            concurrent (bool): Trueなら各場のページを並列取得する。
+                               Falseなら従来通り1場ずつ順番に取得する (フォールバック用)。
 
         Returns:
-            list: レース情報の辞書リスト
-                  [
-                      {
-                          'stadium': '桐生',
-                          'jcd': '01',
-                          'raceNo': 1,
-                          'deadlineTime': '15:20',
-                          'deadlineDatetime': datetime.datetimeオブジェクト
-                      },
-                      ...
-                  ]
+            list: レース情報 (RaceRecord) のリスト
+                  RaceRecord は以下の項目を属性・辞書形式 (race['jcd']) のどちらでも参照できる。
+                  {
+                      'stadium': '桐生',
+                      'jcd': '01',
+                      'raceNo': 1,
+                      'deadlineTime': '15:20',
+                      'deadlineDatetime': datetime.datetimeオブジェクト
+                  }
         """
         if targetDate is None:
             targetDate = datetime.datetime.now().strftime('%Y%m%d')
@@ -56,150 +132,464 @@ class ScheduleFetcher:
             print("開催中のレース場が見つかりませんでした。")
             return []
 
-        allSchedules = []
-
         # 2. 各レース場のスケジュールを取得
+        allSchedules = self.fetchStadiumSchedules(activeStadiums, targetDate, concurrent)
+
+        print(f"全スケジュール取得完了: 合計 {len(allSchedules)} レース")
+        return allSchedules
+
+    def refreshSchedules(self, previousSchedules, targetDate=None, lookaheadMinutes=DEFAULT_LOOKAHEAD_MINUTES, concurrent=True):
+        """
+        前回取得したスケジュールを元に、必要なレース場だけを再取得する (差分更新)
+
+        今から lookaheadMinutes 分以内に締切を迎えるレースが残っている場と、前回のデータがない場のみ
+        raceindex を取得し、それ以外 (全レース終了済み・次のレースが先の場) は前回のデータを使い回す。
+        夕方になるほど終了した場が増え、1回あたりの取得ページ数が減る。
+
+        Args:
+            previousSchedules (list): 前回の fetchAllSchedules() / refreshSchedules() の結果
+            targetDate (str, optional): 取得対象日 (YYYYMMDD形式)。省略時は当日。
+            lookaheadMinutes (float): 再取得の対象とする締切の先読み範囲(分)
+            concurrent (bool): Trueなら並列取得、Falseなら1場ずつ順番に取得
+
+        Returns:
+            list: fetchAllSchedules() と同じ形式のレース情報リスト
+        """
+        if targetDate is None:
+            targetDate = datetime.datetime.now().strftime('%Y%m%d')
+
+        # 変更 (中止・順延・締切変更) を拾うための再取得のため、responseCache の有効期間内でも再検証する
+        activeStadiums = self._getActiveStadiums(targetDate, revalidate=True)
+        if not activeStadiums:
+            print("トップページを取得できないため、前回のスケジュールを使用します。")
+            return list(previousSchedules or [])
+
+        previousByJcd = {}
+        for race in previousSchedules or []:
+            if race.deadlineDatetime.strftime('%Y%m%d') == targetDate:
+                previousByJcd.setdefault(race.jcd, []).append(race)
+
+        now = datetime.datetime.now()
+        staleStadiums = [
+            stadium for stadium in activeStadiums
+            if self.stadiumNeedsRefresh(previousByJcd.get(stadium['jcd']), now, lookaheadMinutes)
+        ]
+        print(f"差分更新: 再利用 {len(activeStadiums) - len(staleStadiums)} 場 / 再取得 {len(staleStadiums)} 場")
+
+        refreshed = {}
+        for race in self.fetchStadiumSchedules(staleStadiums, targetDate, concurrent, revalidate=True) if staleStadiums else []:
+            refreshed.setdefault(race.jcd, []).append(race)
+
+        # 取得に失敗した場は前回のデータを残す
+        allSchedules = []
         for stadium in activeStadiums:
-            jcd = stadium['jcd']
-            stadiumName = stadium['name']
-            print(f"取得中: {stadiumName} (JCD:{jcd})")
-            
-            schedules = self._getStadiumSchedule(jcd, targetDate)
-            
-            # レース場名などの情報を付与
-            for race in schedules:
-                race['stadium'] = stadiumName
-            
-            allSchedules.extend(schedules)
-            
-            # サーバー負荷軽減のため少し待機
-            time.sleep(random.uniform(1.0, 2.0))
+            allSchedules.extend(refreshed.get(stadium['jcd']) or previousByJcd.get(stadium['jcd'], []))
 
         print(f"全スケジュール取得完了: 合計 {len(allSchedules)} レース")
         return allSchedules
 
-    def _fetchWithRetry(self, url, maxRetries=3):
+    @staticmethod
+    def stadiumNeedsRefresh(races, now, lookaheadMinutes=DEFAULT_LOOKAHEAD_MINUTES):
+        """
+        レース場のスケジュールを再取得すべきか判定する
+
+        前回のデータがない場合と、now から lookaheadMinutes 分以内に締切を迎えるレースがある場合に True。
+        全レースの締切を過ぎた場や、次のレースが先読み範囲より後の場は False。
+        """
+        if not races:
+            return True
+        horizon = now + datetime.timedelta(minutes=lookaheadMinutes)
+        return any(now <= race.deadlineDatetime <= horizon for race in races)
+
+    def fetchStadiumSchedules(self, stadiums, targetDate, concurrent=True, revalidate=False):
+        """
+        指定したレース場のみのスケジュールを取得して返す
+
+        Args:
+            stadiums (list): _getActiveStadiums() が返すレース場情報のリスト
+            targetDate (str): 取得対象日 (YYYYMMDD形式)
+            concurrent (bool): Trueなら並列取得、Falseなら1場ずつ順番に取得
+            revalidate (bool): Trueなら responseCache の有効期間内でも公式サイトに確認する
+                               (変更を検知した場の再取得用。変わっていなければ 304 で済む)
+
+        Returns:
+            list: fetchAllSchedules() と同じ形式のレース情報リスト
+        """
+        if concurrent and self.maxWorkers > 1:
+            return self._fetchStadiumSchedulesConcurrent(stadiums, targetDate, revalidate)
+        return self._fetchStadiumSchedulesSerial(stadiums, targetDate, revalidate)
+
+    def _fetchStadiumSchedulesSerial(self, activeStadiums, dateStr, revalidate=False):
+        """
+        各レース場のスケジュールを1場ずつ順番に取得する内部メソッド
+        """
+        allSchedules = []
+
+        # 送信間隔は _fetchWithRetry 内で rateLimiter が制御する
+        for stadium in activeStadiums:
+            allSchedules.extend(self._fetchOneStadium(stadium, dateStr, revalidate))
+
+        return allSchedules
+
+    def _fetchStadiumSchedulesConcurrent(self, activeStadiums, dateStr, revalidate=False):
+        """
+        各レース場のスケジュールをスレッドプールで並列取得する内部メソッド
+        
+        同時リクエスト数は maxWorkers、送信間隔は rateLimiter で制限する。
+        結果はレース場の並び順 (JCD順) を維持して結合する。
+        """
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            results = executor.map(lambda stadium: self._fetchOneStadium(stadium, dateStr, revalidate), activeStadiums)
+
+            allSchedules = []
+            for schedules in results:
+                allSchedules.extend(schedules)
+
+        return allSchedules
+
+    def _fetchOneStadium(self, stadium, dateStr, revalidate=False):
+        """
+        1場分のスケジュールを取得する (レース場名は RaceRecord が JCD から引く)
+        """
+        jcd = stadium['jcd']
+        print(f"取得中: {stadium['name']} (JCD:{jcd})")
+        
+        return self._getStadiumSchedule(jcd, dateStr, revalidate)
+
+    def fetchPage(self, url, maxRetries=3, revalidate=False, deadline=None):
         """
         リトライ機能付きのURL取得メソッド
+
+        - 共有セッションで接続を使い回す
+        - 429/5xx・通信エラーのみ指数バックオフ (ジッター付き) で再試行し、Retry-After を尊重する
+        - 404 などそれ以外のエラーは再試行せずに失敗とする
+        - index / raceindex は ETag / Last-Modified で再検証し、304 なら前回のレスポンスを返す
+        - サーキットブレーカーが開いている間はリクエストを送らずに失敗とする
+        - responseCache の有効期間内のページはリクエストを送らずに保存済みのレスポンスを返す
+          (期限切れでも ETag / Last-Modified があれば再検証に使う)
+        - revalidate=True なら有効期間内でも保存済みのレスポンスを返さず、再検証 (条件付きリクエスト) する
+        - deadline (time.monotonic() の期限) を指定すると、送信待ち・タイムアウト・再試行の待機を
+          その時刻までに収め、過ぎたら失敗とする
+        各リクエストの所要時間・ステータスは fetchLog / fetchStats に記録される。
+
+        Returns:
+            tuple: (response, status)
+                response: requests.Response (失敗時は None)
+                status: 最後に受け取ったHTTPステータス (応答がなければ None)。
+                        失敗時に isMissingPage(status) なら、ページが存在しない (再試行しても変わらない)
         """
+        start = time.monotonic()
+        conditional = self._isConditionalPage(url)
+        cached = self._validatedResponses.get(url) if conditional else None
+
+        ttl = self.responseCache.ttlFor(url) if self.responseCache else 0
+        if ttl > 0:
+            stored, fresh = self.responseCache.get(url)
+            if fresh and not revalidate:
+                self._recordCacheHit(url)
+                return stored, 200
+            if not fresh:
+                self.telemetry.increment(f"response_cache.misses.{self._pageType(url)}")
+            if stored is not None and conditional and cached is None:
+                cached = stored
+
+        status = None
         for i in range(maxRetries):
+            if deadline is not None and time.monotonic() >= deadline:
+                return self._deadlineExceeded(url, status, start, i), status
+
+            # サイト停止中と判断している間は即座に失敗させる
+            if not self.circuitBreaker.allow():
+                print(f"サーキットブレーカー作動中のため取得を中止します: {url}")
+                self.telemetry.increment('http.circuit_rejected')
+                self._recordFetch(url, status, start, i, 0, failed=True)
+                return None, status
+
+            # 並列実行時もホスト全体の送信間隔を守る
+            if not self.rateLimiter.acquire(deadline):
+                # 送らずに終わるため、half_open の試行枠を返す
+                self.circuitBreaker.cancelTrial()
+                return self._deadlineExceeded(url, status, start, i), status
+
+            headers = {}
+            if cached is not None:
+                if cached.headers.get('ETag'):
+                    headers['If-None-Match'] = cached.headers['ETag']
+                if cached.headers.get('Last-Modified'):
+                    headers['If-Modified-Since'] = cached.headers['Last-Modified']
+
+            retryAfter = None
             try:
-                resp = requests.get(url, headers=self.headers, timeout=30)
-                resp.raise_for_status()
-                return resp
+                resp = self._send(url, headers, deadline)
+                if resp is None:
+                    self.circuitBreaker.cancelTrial()
+                    return self._deadlineExceeded(url, status, start, i), status
+                status = resp.status_code
+
+                if status == 304 and cached is not None:
+                    if ttl > 0:
+                        self.responseCache.touch(url, ttl)
+                    self._recordFetch(url, status, start, i + 1, 0, notModified=True)
+                    return cached, status
+
+                if status in RETRY_STATUSES:
+                    retryAfter = self._parseRetryAfter(resp.headers.get('Retry-After'))
+                    print(f"接続エラー (試行 {i+1}/{maxRetries}): HTTP {status} {url}")
+                else:
+                    resp.raise_for_status()
+                    if conditional and (resp.headers.get('ETag') or resp.headers.get('Last-Modified')):
+                        self._validatedResponses[url] = resp
+                    if ttl > 0:
+                        self.responseCache.put(url, resp, ttl)
+                    self._recordFetch(url, status, start, i + 1, len(resp.content))
+                    return resp, status
+            except requests.exceptions.HTTPError as e:
+                # 404 など、再試行しても結果が変わらないエラー
+                print(f"取得失敗 (再試行なし): {e}")
+                self._recordFetch(url, status, start, i + 1, 0, failed=True)
+                return None, status
             except requests.exceptions.RequestException as e:
                 print(f"接続エラー (試行 {i+1}/{maxRetries}): {e}")
-                time.sleep(2)
+
+            if i < maxRetries - 1:
+                delay = self._backoffDelay(i, retryAfter)
+                if delay is None:
+                    print(f"Retry-After ({retryAfter:.0f}秒) が長すぎるため再試行を中止します。")
+                    break
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    return self._deadlineExceeded(url, status, start, i + 1), status
+                time.sleep(delay)
+
+        self._recordFetch(url, status, start, maxRetries, 0, failed=True)
+        return None, status
+
+    def _fetchWithRetry(self, url, maxRetries=3, revalidate=False, deadline=None):
+        """
+        fetchPage() のレスポンスのみを返す (失敗時は None)
+        """
+        return self.fetchPage(url, maxRetries, revalidate, deadline)[0]
+
+    @staticmethod
+    def isMissingPage(status):
+        """
+        再試行しても結果が変わらない 4xx (404 など。開催のない日・場のページ) か
+        """
+        return status is not None and 400 <= status < 500 and status not in RETRY_STATUSES
+
+    def _deadlineExceeded(self, url, status, start, attempts):
+        """
+        制限時間 (deadline) を過ぎたため取得を打ち切ったことを記録して None を返す
+        """
+        print(f"制限時間を過ぎたため取得を中止します: {url}")
+        self.telemetry.increment('http.deadline_exceeded')
+        self._recordFetch(url, status, start, attempts, 0, failed=True)
         return None
 
-    def _getActiveStadiums(self, dateStr):
+    def _send(self, url, headers, deadline=None):
+        """
+        1回分のリクエストを送り、結果を同時実行数の調整とサーキットブレーカーに反映する
+
+        deadline までに同時実行の枠が空かなければ None を返す。タイムアウトも deadline までに収める。
+        """
+        if not self.concurrencyLimiter.acquire(deadline):
+            return None
+        timeout = self.requestTimeout
+        if deadline is not None:
+            remaining = max(0.1, deadline - time.monotonic())
+            timeout = tuple(min(seconds, remaining) for seconds in timeout)
+        sentAt = time.monotonic()
+        latency = None
+        overloaded = True
+        try:
+            resp = self.session.get(url, headers=headers, timeout=timeout)
+            latency = time.monotonic() - sentAt
+            overloaded = resp.status_code in RETRY_STATUSES
+            return resp
+        finally:
+            # 429 / 5xx / タイムアウト・通信エラーは過負荷 (または停止) の兆候として扱う
+            self.concurrencyLimiter.release(latency, overloaded)
+            if overloaded:
+                self.circuitBreaker.recordFailure()
+                self.telemetry.increment('http.overloaded')
+            else:
+                self.circuitBreaker.recordSuccess()
+
+    def _isConditionalPage(self, url):
+        return self._pageType(url) in self.CONDITIONAL_PAGES
+
+    @staticmethod
+    def _pageType(url):
+        """
+        URLのページ種別 (index / raceindex / oddstf など)
+        """
+        return pageType(url)
+
+    def _backoffDelay(self, attempt, retryAfter=None):
+        """
+        再試行までの待機秒数を返す (フルジッター付き指数バックオフ)。
+        Retry-After が上限を超える場合は None (再試行しない)。
+        """
+        delay = random.uniform(0, min(self.backoffMax, self.backoffBase * (2 ** attempt)))
+        if retryAfter is not None:
+            if retryAfter > self.backoffMax:
+                return None
+            delay = max(delay, retryAfter)
+        return delay
+
+    @staticmethod
+    def _parseRetryAfter(value):
+        """
+        Retry-After ヘッダー (秒数 or HTTP日付) を秒数に変換する
+        """
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            retryAt = email.utils.parsedate_to_datetime(value)
+            now = datetime.datetime.now(retryAt.tzinfo)
+            return max(0.0, (retryAt - now).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def _recordFetch(self, url, status, start, attempts, size, notModified=False, failed=False):
+        """
+        1リクエスト (リトライ込み) の計測結果を記録する
+        """
+        elapsed = time.monotonic() - start
+        with self._statsLock:
+            self.fetchLog.append({
+                'url': url,
+                'status': status,
+                'elapsed': elapsed,
+                'attempts': attempts,
+                'bytes': size,
+                'notModified': notModified,
+                'failed': failed
+            })
+            self.fetchStats['requests'] += 1
+            self.fetchStats['attempts'] += attempts
+            self.fetchStats['bytes'] += size
+            self.fetchStats['elapsed'] += elapsed
+            if notModified:
+                self.fetchStats['notModified'] += 1
+            if failed:
+                self.fetchStats['failures'] += 1
+
+        pageType = self._pageType(url)
+        self.telemetry.observe(f"request.{pageType}", elapsed)
+        self.telemetry.increment(f"http.requests.{pageType}")
+        self.telemetry.increment(f"http.bytes.{pageType}", size)
+        if attempts > 1:
+            self.telemetry.increment('http.retries', attempts - 1)
+        if notModified:
+            self.telemetry.increment(f"http.not_modified.{pageType}")
+        if failed:
+            self.telemetry.increment(f"http.failures.{pageType}")
+
+    def _recordCacheHit(self, url):
+        """
+        responseCache から返したページを記録する (リクエスト数には含めない)
+        """
+        with self._statsLock:
+            self.fetchStats['cacheHits'] += 1
+        self.telemetry.increment(f"response_cache.hits.{self._pageType(url)}")
+
+    @_timedStage('active_stadiums')
+    def _getActiveStadiums(self, dateStr, revalidate=False):
         """
         開催中のレース場一覧を取得する内部メソッド
         """
         url = f"{self.baseUrl}/index?hd={dateStr}"
-        resp = self._fetchWithRetry(url)
+        resp = self._fetchWithRetry(url, revalidate=revalidate)
         if not resp:
             print("トップページの取得に失敗しました。")
             return []
             
         try:
-            soup = BeautifulSoup(resp.content, 'html.parser')
-            
-            stadiums = []
-            uniqueJcds = set()
-
-            for a in soup.find_all('a', href=True):
-                href = a['href']
-                if 'raceindex' in href and 'jcd=' in href:
-                    try:
-                        # URLパラメータからjcd抽出
-                        qs = href.split('?')[1]
-                        params = {p.split('=')[0]: p.split('=')[1] for p in qs.split('&')}
-                        jcd = params.get('jcd')
-                        
-                        if jcd and jcd not in uniqueJcds:
-                            # レース場名をマッピングから取得
-                            name = self.STADIUM_MAP.get(jcd, "不明")
-                            
-                            stadiums.append({'jcd': jcd, 'name': name})
-                            uniqueJcds.add(jcd)
-                    except Exception as e:
-                        print(f"レース場リンク解析エラー: {e}")
-                        continue
-            
-            stadiums.sort(key=lambda x: x['jcd'])
-            return stadiums
+            with self.telemetry.stage('parse.index'):
+                entries = self.parser.parseActiveStadiums(resp.content)
+            return self.buildActiveStadiums(entries)
             
         except Exception as e:
             print(f"トップページ解析エラー: {e}")
             return []
 
-    def _getStadiumSchedule(self, jcd, dateStr):
+    @classmethod
+    def buildActiveStadiums(cls, entries):
+        """
+        parseActiveStadiums() の結果からレース場情報のリスト (JCD順) を作る
+        """
+        stadiums = []
+        for entry in entries:
+            jcd = entry['jcd']
+            # レース場名をマッピングから取得
+            name = cls.STADIUM_MAP.get(jcd, "不明")
+
+            # 一覧上のレース場ブロック (開催日次・中止表示など) から
+            # 変更検知用のフィンガープリントを作成する
+            fingerprint = hashlib.sha1(entry['blockText'].encode('utf-8')).hexdigest()[:16]
+            
+            stadiums.append({'jcd': jcd, 'name': name, 'fingerprint': fingerprint})
+        
+        stadiums.sort(key=lambda x: x['jcd'])
+        return stadiums
+
+    @_timedStage('stadium_schedule')
+    def _getStadiumSchedule(self, jcd, dateStr, revalidate=False):
         """
         特定レース場のスケジュールを取得する内部メソッド
         """
         url = f"{self.baseUrl}/raceindex?jcd={jcd}&hd={dateStr}"
-        scheduleList = []
         
-        resp = self._fetchWithRetry(url)
+        resp = self._fetchWithRetry(url, revalidate=revalidate)
         if not resp:
             return []
             
         try:
-            soup = BeautifulSoup(resp.content, 'html.parser')
-            
-            tables = soup.find_all('table')
-            if not tables:
-                return []
-            
-            # 最初のテーブルがスケジュール表
-            table = tables[0]
-            
-            # tbodyに限定せず、テーブル内の全行を取得する
-            # (複数のtbodyがある場合や、thead/tfootの構造に対応するため)
-            rows = table.find_all('tr')
-            
-            # print(f"JCD{jcd}: Row count (all) = {len(rows)}")
+            # 最初のテーブル (スケジュール表) の各行の [レース番号, 締切時刻] テキスト
+            with self.telemetry.stage('parse.raceindex'):
+                rows = self.parser.parseStadiumSchedule(resp.content)
+            return self.buildSchedule(jcd, dateStr, rows)
+                    
+        except Exception as e:
+            print(f"スケジュールページ取得エラー (JCD:{jcd}): {e}")
+            return []
 
-            
-            for i, row in enumerate(rows):
-                cols = row.find_all('td')
-                if len(cols) < 2:
-                    continue
+    @staticmethod
+    def buildSchedule(jcd, dateStr, rows):
+        """
+        parseStadiumSchedule() の [レース番号, 締切時刻] テキストからレース情報 (RaceRecord) のリストを作る
+        """
+        scheduleList = []
+        for raceNoText, deadlineText in rows:
+            try:
+                raceNoText = raceNoText.replace('R', '')
                 
-                try:
-                    raceNoText = cols[0].get_text(strip=True).replace('R', '')
-                    deadlineText = cols[1].get_text(strip=True)
+                if raceNoText.isdigit() and ':' in deadlineText:
+                    raceNo = int(raceNoText)
                     
-                    if raceNoText.isdigit() and ':' in deadlineText:
-                        raceNo = int(raceNoText)
-                        
-                        dtStr = f"{dateStr} {deadlineText}"
-                        deadlineDt = datetime.datetime.strptime(dtStr, "%Y%m%d %H:%M")
-                        
-                        scheduleList.append({
-                            'jcd': jcd,
-                            'raceNo': raceNo,
-                            'deadlineTime': deadlineText,
-                            'deadlineDatetime': deadlineDt
-                        })
-                except Exception as e:
-                    continue
-
-
+                    dtStr = f"{dateStr} {deadlineText}"
+                    deadlineDt = datetime.datetime.strptime(dtStr, "%Y%m%d %H:%M")
                     
-        except Exception as e:
-            print(f"スケジュールページ取得エラー (JCD:{jcd}): {e}")
-            
+                    scheduleList.append(RaceRecord(jcd, raceNo, deadlineDt))
+            except Exception as e:
+                continue
         return scheduleList
 
 
-    def check1stBoatPopularity(self, jcd, raceNo, dateStr=None):
+    @_timedStage('win_odds')
+    def fetchWinOdds(self, jcd, raceNo, dateStr=None, deadline=None):
         """
-        指定レースの単勝オッズを取得し、1号艇が一番人気(オッズ最小)か判定する
+        指定レースの単勝オッズを取得する
+
+        Args:
+            deadline (float, optional): time.monotonic() の期限 (_fetchWithRetry 参照)
         
         Returns:
-            bool: 1号艇が一番人気ならTrue
+            dict: {艇番: オッズ} (欠場などでオッズのない艇は含まない)
             None: データ取得失敗時など
         """
         if dateStr is None:
@@ -207,88 +597,97 @@ class ScheduleFetcher:
             
         url = f"{self.baseUrl}/oddstf?jcd={jcd}&rno={raceNo}&hd={dateStr}"
         
-        resp = self._fetchWithRetry(url)
+        resp = self._fetchWithRetry(url, deadline=deadline)
         if not resp:
             return None
             
         try:
-            soup = BeautifulSoup(resp.content, 'html.parser')
-            
-            # 単勝オッズが含まれるテーブルを探す
             # ボートレース公式サイトの構造: 
             # <table class="is-w495">...<thead>...<th>単勝</th>...
+            with self.telemetry.stage('parse.oddstf'):
+                if self.partialOddsParse:
+                    odds_map = self.parser.parseWinOddsPartial(resp.content)
+                else:
+                    odds_map = self.parser.parseWinOdds(resp.content)
             
-            odds_map = {} # {boatNo: odds}
-            
-            # 全テーブル走査
-            tables = soup.find_all('table')
-            found_tansho_table = False
-            
-            for table in tables:
-                # 明確に「単勝」ヘッダーを持つテーブルを対象にする
-                if "単勝" not in table.get_text():
-                    continue
-
-                found_tansho_table = True
-                # 行データを解析
-                rows = table.find_all('tr')
-                for row in rows:
-                    # 構造: 
-                    # <td class="is-boatColor1 is-fs14"><span ...>1</span></td>
-                    # <td class="is-p10-0"><span class="is-fs14">1.5</span></td>
-                    
-                    # 艇番の取得
-                    boat_td = row.find('td', class_=lambda x: x and 'is-boatColor' in x)
-                    if not boat_td:
-                        continue
-                        
-                    try:
-                        boatNo = int(boat_td.get_text(strip=True))
-                        
-                        # オッズの取得
-                        # 構造: [艇番TD] -> [レーサー名TD] -> [オッズTD]
-                        # find_next_sibling() 1回だとレーサー名になるので、もう一度呼ぶか、クラスで探す
-                        
-                        racer_td = boat_td.find_next_sibling('td')
-                        if racer_td:
-                            odds_td = racer_td.find_next_sibling('td')
-                            
-                            if odds_td:
-                                odds_text = odds_td.get_text(strip=True)
-                                if odds_text and odds_text.replace('.', '').isdigit():
-                                    val = float(odds_text)
-                                    # 0.0倍は欠場や投票なしの可能性があるため除外 (最小値判定で誤検知しないように)
-                                    if val > 0:
-                                        odds_map[boatNo] = val
-                    except ValueError:
-                        continue
-                
-                # 単勝データが取れたらループ終了
-                if odds_map:
-                    break
-            
-            if odds_map:
-                # オッズでソート (昇順)
-                sorted_odds = sorted(odds_map.items(), key=lambda x: x[1])
-                
-                # 一番人気の艇番とオッズ
-                favorite_boat = sorted_odds[0][0]
-                favorite_odds = sorted_odds[0][1]
-                
-                # 同率1位の可能性があるため、複数の場合を考慮してもよいが
-                # 「1号艇が一番人気（単独または同率）」であれば条件OKとする
-                
-                # 1号艇のオッズが一番人気のオッズと同じならTrue
-                is_favorite = (odds_map.get(1) == favorite_odds)
-                
-                return is_favorite
-            
-            return None
+            return odds_map or None
 
         except Exception as e:
             print(f"Error parsing odds: {e}")
             return None
 
+    def check1stBoatPopularity(self, jcd, raceNo, dateStr=None):
+        """
+        指定レースの単勝オッズを取得し、1号艇が一番人気(オッズ最小)か判定する
+        
+        Returns:
+            bool: 1号艇が一番人気ならTrue
+            None: データ取得失敗時など
+        """
+        odds_map = self.fetchWinOdds(jcd, raceNo, dateStr)
+        if not odds_map:
+            return None
+
+        # 一番人気のオッズ
+        favorite_odds = min(odds_map.values())
+        
+        # 同率1位の可能性があるため、複数の場合を考慮してもよいが
+        # 「1号艇が一番人気（単独または同率）」であれば条件OKとする
+        
+        # 1号艇のオッズが一番人気のオッズと同じならTrue
+        return odds_map.get(1) == favorite_odds
+
+    def fetchWinOddsConcurrent(self, races, timeoutSeconds=None):
+        """
+        複数レースの単勝オッズを並列取得し、fetchWinOdds() の結果をまとめて返す
+
+        Returns:
+            tuple: (results, timedOut)
+                results: [(race, odds_map), ...] 締切の早い順。odds_map は取得失敗時 (例外を含む) None
+                timedOut: [race, ...] 制限時間内に取得が終わらなかったレース (締切の早い順)
+        """
+        return self._runConcurrent(races, self.fetchWinOdds, timeoutSeconds)
+
+    def _runConcurrent(self, races, func, timeoutSeconds):
+        """
+        func(jcd, raceNo, dateStr, deadline=...) を各レースについて並列実行し、締切の早い順に結果を返す
+
+        実行中のスレッドは止められないため、制限時間は各リクエストにも deadline として渡し、
+        送信待ち・タイムアウト・再試行をその時刻までに打ち切らせる。
+        """
+        orderedRaces = sorted(races, key=lambda r: r['deadlineDatetime'])
+        if not orderedRaces:
+            return [], []
+
+        deadline = time.monotonic() + timeoutSeconds if timeoutSeconds is not None else None
+        executor = ThreadPoolExecutor(max_workers=max(1, self.maxWorkers))
+        futures = [
+            executor.submit(
+                func,
+                race.jcd, race.raceNo, race.deadlineDatetime.strftime('%Y%m%d'), deadline=deadline
+            )
+            for race in orderedRaces
+        ]
+        done, _ = wait(futures, timeout=timeoutSeconds)
+        # 制限時間を過ぎたものは待たずに打ち切る (未着手のものはキャンセル、実行中のものは deadline で終わる)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        results = []
+        timedOut = []
+        for race, future in zip(orderedRaces, futures):
+            if future not in done:
+                timedOut.append(race)
+                continue
+            # 1レースの想定外のエラー (キャッシュのDBエラー・解析エラーなど) で他のレースを止めない
+            try:
+                results.append((race, future.result()))
+            except Exception as e:
+                print(f"オッズ取得エラー ({race.stadium} {race.raceNo}R): {e}")
+                self.telemetry.increment('odds.errors')
+                results.append((race, None))
+
+        return results, timedOut
+
 
 if __name__ == "__main__":
     # テスト実行
@@ -0,0 +1,65 @@
+import bisect
+import datetime
+import math
+from race_record import RaceArray, RaceRecord
+
+
+class ScheduleIndex:
+    """
+    レース情報を締切時刻順に並べ、時間範囲での検索を二分探索で行うインデックス
+
+    締切時刻は UNIX 秒で保持するため、日付をまたぐ (複数日分の) スケジュールもそのまま扱える。
+    レースは RaceArray (型付き配列) に保持し、検索結果は RaceRecord のリストで返す。
+    インデックスは作成時点のスケジュールの写しであり、スケジュールを再取得したら作り直す。
+    """
+    def __init__(self, schedules=()):
+        records = sorted((RaceRecord.fromDict(race) for race in schedules),
+                         key=lambda race: (race.deadline, race.jcd, race.raceNo))
+        self.races = RaceArray(records)
+        self.deadlines = self.races.deadlines
+
+    def __len__(self):
+        return len(self.races)
+
+    def __iter__(self):
+        return iter(self.races)
+
+    def between(self, start, end):
+        """
+        締切が start 以上 end 未満のレースを締切の早い順に返す
+
+        Args:
+            start / end (datetime): 範囲の両端
+        """
+        # 締切は整数秒なので、「d >= t」は「d >= ceil(t)」と同じ
+        lo = bisect.bisect_left(self.deadlines, math.ceil(start.timestamp()))
+        hi = bisect.bisect_left(self.deadlines, math.ceil(end.timestamp()), lo)
+        return self.races[lo:hi]
+
+    def window(self, now, minOffsetMinutes, maxOffsetMinutes):
+        """
+        締切までの残り時間が minOffsetMinutes 分以上 maxOffsetMinutes 分未満のレースを返す
+        """
+        return self.between(now + datetime.timedelta(minutes=minOffsetMinutes),
+                            now + datetime.timedelta(minutes=maxOffsetMinutes))
+
+    def after(self, t):
+        """
+        締切が t より後のレースを締切の早い順に返す
+        """
+        return self.races[bisect.bisect_right(self.deadlines, math.floor(t.timestamp())):]
+
+    def nextRace(self, t):
+        """
+        t より後に締切を迎える最初のレースを返す (なければ None)
+        """
+        i = bisect.bisect_right(self.deadlines, math.floor(t.timestamp()))
+        return self.races[i] if i < len(self.races) else None
+
+    def nextDeadline(self, t):
+        """
+        t より後の最初の締切時刻を返す (なければ None)
+        """
+        race = self.nextRace(t)
+        return race.deadlineDatetime if race else None
+
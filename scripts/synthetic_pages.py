@@ -0,0 +1,218 @@
+import argparse
+import datetime
+import os
+import random
+from race_record import RaceRecord, STADIUM_MAP
+
+# 1番人気になる艇の既定の割合 (1号艇〜6号艇)。実際のレースと同程度に1号艇が多い
+DEFAULT_FAVORITE_WEIGHTS = (0.55, 0.15, 0.12, 0.1, 0.05, 0.03)
+BOAT_COUNT = 6
+DAY_LABELS = ('初日', '2日目', '3日目', '4日目', '5日目', '最終日')
+
+_HEAD = """<!DOCTYPE html>
+<html lang="ja">
+<head>
+<meta charset="UTF-8">
+<title>{title}｜BOAT RACE オフィシャルウェブサイト</title>
+</head>
+<body>
+<main class="main">
+"""
+_TAIL = """</main>
+</body>
+</html>
+"""
+
+
+class SyntheticDay:
+    """
+    公式サイトと同じ構造の index / raceindex / oddstf / raceresult ページを乱数で作るクラス (規模・負荷の検証用)
+
+    - 各場のレースは raceIntervalMinutes 間隔で、開始時刻は場ごとにずらす
+    - burstAt を指定すると、各場のいずれかのレースの締切が burstAt 〜 burstAt + burstWidthMinutes に入るよう
+      場ごとのスケジュールをずらす (多数のレースの締切が同時に来る状況)
+    - 1番人気になる艇は favoriteWeights の割合で選び、1番人気のオッズは favoriteOddsRange から選ぶ
+    - レース結果 (raceresult) の1着はオッズから逆算した勝率で選び、払戻金は単勝オッズ × 100円とする
+    同じ seed なら同じページを作る。
+    """
+    def __init__(self, date, stadiums=24, racesPerStadium=12, firstDeadline='08:30', raceIntervalMinutes=30,
+                 burstAt=None, burstWidthMinutes=2, favoriteWeights=DEFAULT_FAVORITE_WEIGHTS,
+                 favoriteOddsRange=(1.1, 4.0), seed=0):
+        """
+        Args:
+            date (datetime.date): 開催日
+            stadiums (int): 開催場数 (1〜24、JCDの小さい順)
+            burstAt (datetime, optional): 締切を集中させる時刻
+        """
+        self.date = date
+        self.dateStr = date.strftime('%Y%m%d')
+        self.random = random.Random(f"{seed}-{self.dateStr}")
+        self.jcds = sorted(STADIUM_MAP)[:stadiums]
+        self.favoriteWeights = favoriteWeights
+        self.favoriteOddsRange = favoriteOddsRange
+
+        first = datetime.datetime.combine(date, datetime.datetime.strptime(firstDeadline, '%H:%M').time())
+        dayEnd = datetime.datetime.combine(date, datetime.time(23, 59))
+        self.races = []
+        self.odds = {}
+        self.results = {}
+        for jcd in self.jcds:
+            if burstAt is not None:
+                # いずれかのレースが集中時刻に入るように、場ごとの開始時刻を決める
+                anchorRace = self.random.randrange(racesPerStadium)
+                offset = self.random.uniform(0, burstWidthMinutes * 60)
+                start = burstAt + datetime.timedelta(seconds=offset, minutes=-anchorRace * raceIntervalMinutes)
+            else:
+                start = first + datetime.timedelta(minutes=self.random.randrange(0, max(1, raceIntervalMinutes * 2)))
+            start = start.replace(second=0, microsecond=0)
+            for i in range(racesPerStadium):
+                deadline = start + datetime.timedelta(minutes=i * raceIntervalMinutes)
+                # 日付をまたぐレースは作らない (締切時刻は HH:MM 表記のため)
+                if deadline.date() != date or deadline > dayEnd:
+                    continue
+                race = RaceRecord(jcd, i + 1, deadline)
+                self.races.append(race)
+                self.odds[(jcd, i + 1)] = self._generateOdds()
+                self.results[(jcd, i + 1)] = self._drawWinner(self.odds[(jcd, i + 1)])
+
+    def _generateOdds(self):
+        """
+        1レース分の単勝オッズ {艇番: オッズ} を作る
+        """
+        favorite = self.random.choices(range(1, BOAT_COUNT + 1), weights=self.favoriteWeights)[0]
+        favoriteOdds = round(self.random.uniform(*self.favoriteOddsRange), 1)
+        odds = {favorite: favoriteOdds}
+        for boat in range(1, BOAT_COUNT + 1):
+            if boat != favorite:
+                # 1番人気より必ず高いオッズにする (同率1位は作らない)
+                odds[boat] = round(favoriteOdds * self.random.uniform(1.1, 30.0) + 0.1, 1)
+        return odds
+
+    def _drawWinner(self, odds):
+        """
+        オッズから逆算した勝率で1着を決め、(1着の艇番, 単勝払戻金) を返す
+        """
+        boats = sorted(odds)
+        winner = self.random.choices(boats, weights=[1.0 / odds[boat] for boat in boats])[0]
+        return winner, int(round(odds[winner] * 10)) * 10
+
+    def raceList(self):
+        """
+        生成したレース (RaceRecord) を締切の早い順に返す
+        """
+        return sorted(self.races, key=lambda race: (race.deadline, race.jcd, race.raceNo))
+
+    def renderIndex(self):
+        rows = []
+        for jcd in self.jcds:
+            label = DAY_LABELS[int(jcd) % len(DAY_LABELS)]
+            rows.append(
+                f'      <tbody>\n        <tr>\n'
+                f'          <td><a href="/owpc/pc/race/raceindex?jcd={jcd}&amp;hd={self.dateStr}">{STADIUM_MAP[jcd]}</a></td>\n'
+                f'          <td>一般</td>\n          <td>{label}</td>\n'
+                f'        </tr>\n      </tbody>\n'
+            )
+        return (_HEAD.format(title='本日のレース') + '<div class="table1">\n  <table class="is-strited1 is-wAuto">\n'
+                '    <thead><tr><th>レース場</th><th>グレード</th><th>日次</th></tr></thead>\n'
+                + ''.join(rows) + '  </table>\n</div>\n' + _TAIL)
+
+    def renderRaceindex(self, jcd):
+        rows = []
+        for race in self.races:
+            if race.jcd == jcd:
+                rows.append(
+                    f'      <tr>\n'
+                    f'        <td class="is-fBold"><a href="/owpc/pc/race/racelist?rno={race.raceNo}&amp;jcd={jcd}&amp;hd={self.dateStr}">{race.raceNo}R</a></td>\n'
+                    f'        <td>{race.deadlineTime}</td>\n'
+                    f'      </tr>\n'
+                )
+        return (_HEAD.format(title=f'{STADIUM_MAP[jcd]} レース一覧') + '<div class="table1">\n  <table class="is-w495">\n'
+                '    <thead><tr><th>レース</th><th>締切予定時刻</th></tr></thead>\n    <tbody>\n'
+                + ''.join(rows) + '    </tbody>\n  </table>\n</div>\n' + _TAIL)
+
+    def renderOddstf(self, jcd, raceNo):
+        odds = self.odds[(jcd, raceNo)]
+        rows = []
+        for boat in range(1, BOAT_COUNT + 1):
+            rows.append(
+                f'        <tbody class="is-fs12">\n          <tr>\n'
+                f'            <td class="is-fs14 is-boatColor{boat}">{boat}</td>\n'
+                f'            <td class="is-fs18 is-fBold">選手{boat}</td>\n'
+                f'            <td class="oddsPoint">{odds[boat]:.1f}</td>\n'
+                f'          </tr>\n        </tbody>\n'
+            )
+        return (_HEAD.format(title=f'{STADIUM_MAP[jcd]} {raceNo}R 単勝・複勝オッズ')
+                + '<div class="table1">\n      <table class="is-w495">\n'
+                '        <thead><tr><th colspan="2">ボート</th><th>単勝オッズ</th></tr></thead>\n'
+                + ''.join(rows) + '      </table>\n</div>\n' + _TAIL)
+
+    def renderRaceResult(self, jcd, raceNo):
+        winner, payout = self.results[(jcd, raceNo)]
+        return (_HEAD.format(title=f'{STADIUM_MAP[jcd]} {raceNo}R 結果')
+                + '<div class="table1">\n  <table class="is-w495">\n'
+                '    <thead><tr><th>勝式</th><th>組番</th><th>払戻金</th><th>人気</th></tr></thead>\n'
+                f'    <tbody><tr><td>単勝</td><td>{winner}</td><td>&yen;{payout:,}</td><td></td></tr></tbody>\n'
+                '  </table>\n</div>\n' + _TAIL)
+
+    def writeFixtures(self, outputDir):
+        """
+        fixture_server.py が参照する形式 (<outputDir>/<hd>/index.html など) でページを書き出す
+
+        Returns:
+            int: 書き出したページ数
+        """
+        dateDir = os.path.join(outputDir, self.dateStr)
+        os.makedirs(dateDir, exist_ok=True)
+        pages = {'index.html': self.renderIndex()}
+        for jcd in self.jcds:
+            pages[f"raceindex_jcd{jcd}.html"] = self.renderRaceindex(jcd)
+        for race in self.races:
+            pages[f"oddstf_jcd{race.jcd}_rno{race.raceNo:02d}.html"] = self.renderOddstf(race.jcd, race.raceNo)
+            pages[f"raceresult_jcd{race.jcd}_rno{race.raceNo:02d}.html"] = self.renderRaceResult(race.jcd, race.raceNo)
+        for fileName, body in pages.items():
+            with open(os.path.join(dateDir, fileName), 'w', encoding='utf-8') as f:
+                f.write(body)
+        return len(pages)
+
+
+def generateDays(startDate, days=1, **kwargs):
+    """
+    startDate から days 日分の SyntheticDay を作る (burstAt は初日のみに適用)
+    """
+    result = []
+    for i in range(days):
+        dayKwargs = dict(kwargs)
+        if i > 0:
+            dayKwargs.pop('burstAt', None)
+        result.append(SyntheticDay(startDate + datetime.timedelta(days=i), **dayKwargs))
+    return result
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="公式サイトと同じ構造の架空のページを作る (fixture_server.py で配信できる)")
+    argParser.add_argument('--output', required=True, help="出力先ディレクトリ")
+    argParser.add_argument('--date', default=None, help="初日 (YYYYMMDD、省略時は当日)")
+    argParser.add_argument('--days', type=int, default=1)
+    argParser.add_argument('--stadiums', type=int, default=24)
+    argParser.add_argument('--races', type=int, default=12, help="1場あたりのレース数")
+    argParser.add_argument('--interval', type=int, default=30, help="レース間隔(分)")
+    argParser.add_argument('--burst-at', default=None, help="締切を集中させる時刻 (HH:MM、初日のみ)")
+    argParser.add_argument('--burst-width', type=float, default=2, help="締切を集中させる幅(分)")
+    argParser.add_argument('--favorite-weights', default=None,
+                           help="1番人気になる艇の割合 (カンマ区切り6個、例: 0.55,0.15,0.12,0.1,0.05,0.03)")
+    argParser.add_argument('--seed', type=int, default=0)
+    args = argParser.parse_args()
+
+    startDate = (datetime.datetime.strptime(args.date, '%Y%m%d').date() if args.date
+                 else datetime.date.today())
+    burstAt = None
+    if args.burst_at:
+        burstAt = datetime.datetime.combine(startDate, datetime.datetime.strptime(args.burst_at, '%H:%M').time())
+    weights = (tuple(float(w) for w in args.favorite_weights.split(','))
+               if args.favorite_weights else DEFAULT_FAVORITE_WEIGHTS)
+
+    for day in generateDays(startDate, args.days, stadiums=args.stadiums, racesPerStadium=args.races,
+                            raceIntervalMinutes=args.interval, burstAt=burstAt,
+                            burstWidthMinutes=args.burst_width, favoriteWeights=weights, seed=args.seed):
+        count = day.writeFixtures(args.output)
+        print(f"{day.dateStr}: {len(day.races)} レース / {count} ページ")
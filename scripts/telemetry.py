@@ -0,0 +1,133 @@
+import contextlib
+import datetime
+import json
+import os
+import re
+import threading
+import time
+
+# 1実行ごとのサマリーを1行ずつ追記するファイル
+DEFAULT_TELEMETRY_PATH = os.environ.get('TELEMETRY_PATH', 'logs/run_telemetry.jsonl')
+# node_exporter の textfile collector 用の出力先 (未設定なら出力しない)
+DEFAULT_PROMETHEUS_PATH = os.environ.get('PROMETHEUS_TEXTFILE')
+
+
+class Telemetry:
+    """
+    1回の実行の計測値 (処理段階ごとの所要時間・リクエストごとのレイテンシ・各種カウンター) を集めるクラス
+
+    - stage(name): with ブロックの所要時間を段階名ごとに積算する (並列実行時はスレッドの合計)
+    - observe(name, seconds): リクエストなど1回ごとの所要時間を記録し、分布 (p50/p95/max) を出す
+    - increment(name, value): バイト数・リトライ回数・キャッシュヒット数などを数える
+    複数スレッドから同時に呼び出してよい。
+    """
+    def __init__(self):
+        self.startedAt = datetime.datetime.now()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}   # 段階名 -> {'calls', 'seconds'}
+        self.timings = {}  # 名前 -> [秒, ...]
+        self.counters = {} # 名前 -> 値
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.addStage(name, time.perf_counter() - start)
+
+    def addStage(self, name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += seconds
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self.timings.setdefault(name, []).append(seconds)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """
+        計測結果をJSONに変換できる辞書で返す
+        """
+        with self._lock:
+            return {
+                'startedAt': self.startedAt.isoformat(timespec='seconds'),
+                'durationSeconds': round(time.perf_counter() - self._start, 3),
+                'stages': {
+                    name: {'calls': entry['calls'], 'seconds': round(entry['seconds'], 4)}
+                    for name, entry in sorted(self.stages.items())
+                },
+                'timings': {name: self._distribution(samples) for name, samples in sorted(self.timings.items())},
+                'counters': dict(sorted(self.counters.items())),
+            }
+
+    @staticmethod
+    def _distribution(samples):
+        ordered = sorted(samples)
+
+        def percentile(p):
+            return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+        return {
+            'count': len(ordered),
+            'sum': round(sum(ordered), 4),
+            'p50': round(percentile(0.5), 4),
+            'p95': round(percentile(0.95), 4),
+            'max': round(ordered[-1], 4),
+        }
+
+    def writeJson(self, path=DEFAULT_TELEMETRY_PATH, extra=None):
+        """
+        サマリーをJSON Lines形式で追記する (日をまたいだ推移の確認用)
+        """
+        record = self.summary()
+        if extra:
+            record.update(extra)
+        dirName = os.path.dirname(path)
+        if dirName:
+            os.makedirs(dirName, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return record
+
+    def writePrometheus(self, path=DEFAULT_PROMETHEUS_PATH, prefix='boatrace'):
+        """
+        Prometheus のテキスト形式で書き出す (node_exporter の textfile collector 向けに一時ファイル経由で置換)
+        """
+        summary = self.summary()
+        lines = [
+            f"# TYPE {prefix}_run_duration_seconds gauge",
+            f"{prefix}_run_duration_seconds {summary['durationSeconds']}",
+            f"# TYPE {prefix}_run_timestamp_seconds gauge",
+            f"{prefix}_run_timestamp_seconds {int(self.startedAt.timestamp())}",
+            f"# TYPE {prefix}_stage_seconds gauge",
+        ]
+        for name, entry in summary['stages'].items():
+            lines.append(f'{prefix}_stage_seconds{{stage="{name}"}} {entry["seconds"]}')
+        lines.append(f"# TYPE {prefix}_stage_calls gauge")
+        for name, entry in summary['stages'].items():
+            lines.append(f'{prefix}_stage_calls{{stage="{name}"}} {entry["calls"]}')
+        lines.append(f"# TYPE {prefix}_latency_seconds summary")
+        for name, dist in summary['timings'].items():
+            for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'), ('1', 'max')):
+                lines.append(f'{prefix}_latency_seconds{{name="{name}",quantile="{quantile}"}} {dist[key]}')
+            lines.append(f'{prefix}_latency_seconds_sum{{name="{name}"}} {dist["sum"]}')
+            lines.append(f'{prefix}_latency_seconds_count{{name="{name}"}} {dist["count"]}')
+        for name, value in summary['counters'].items():
+            metric = f"{prefix}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+
+        dirName = os.path.dirname(path)
+        if dirName:
+            os.makedirs(dirName, exist_ok=True)
+        tmpPath = f"{path}.tmp"
+        with open(tmpPath, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmpPath, path)
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from rate_limiter import CircuitBreaker  # noqa: E402
+from schedule_fetcher import ScheduleFetcher  # noqa: E402
+
+URL = 'http://127.0.0.1:9/owpc/pc/race/oddstf?jcd=01&rno=1&hd=20250801'
+
+
+def halfOpenFetcher():
+    """
+    サーキットブレーカーが open で、次の allow() から half_open の試行になるフェッチャー
+    """
+    fetcher = ScheduleFetcher(maxWorkers=2, requestsPerSecond=0, responseCache=False)
+    fetcher.circuitBreaker = CircuitBreaker(failureThreshold=1, resetTimeout=0.0)
+    fetcher.circuitBreaker.recordFailure()
+    assert fetcher.circuitBreaker.state == CircuitBreaker.OPEN
+    return fetcher
+
+
+def test_trial_released_when_rate_limit_slot_misses_deadline():
+    fetcher = halfOpenFetcher()
+    # 次の送信枠を期限より後にする
+    fetcher.rateLimiter.interval = 60.0
+    fetcher.rateLimiter._nextSlot = time.monotonic() + 60.0
+
+    resp, status = fetcher.fetchPage(URL, deadline=time.monotonic() + 0.05)
+
+    assert resp is None and status is None
+    assert fetcher.circuitBreaker.state == CircuitBreaker.HALF_OPEN
+    assert fetcher.circuitBreaker.allow()
+
+
+def test_trial_released_when_concurrency_slot_misses_deadline():
+    fetcher = halfOpenFetcher()
+    # 同時実行の枠を埋めておく
+    fetcher.concurrencyLimiter.inFlight = int(fetcher.concurrencyLimiter.limit)
+
+    resp, status = fetcher.fetchPage(URL, deadline=time.monotonic() + 0.05)
+
+    assert resp is None and status is None
+    assert fetcher.circuitBreaker.state == CircuitBreaker.HALF_OPEN
+    assert fetcher.circuitBreaker.allow()
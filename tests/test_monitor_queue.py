@@ -0,0 +1,37 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from monitor_races import RaceMonitor  # noqa: E402
+from race_record import RaceRecord  # noqa: E402
+
+
+def dueRace(monitor, raceNo=1, deadline=None):
+    # チェック時刻 (締切 notificationOffsetMinutes 分前) を過ぎ、締切前のレース
+    deadline = deadline or datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(
+        minutes=monitor.notificationOffsetMinutes - 1)
+    return RaceRecord('01', raceNo, deadline)
+
+
+def test_checked_race_is_not_requeued_by_schedule_refresh():
+    monitor = RaceMonitor()
+    race = dueRace(monitor)
+    monitor._mergeSchedules([race])
+    assert monitor._popDueRaces() == [race]
+
+    # 同じ内容のスケジュールを再取得しても、確認済みのレースは登録し直さない
+    monitor._mergeSchedules([dueRace(monitor, deadline=race.deadlineDatetime)])
+    assert monitor._popDueRaces() == []
+
+
+def test_checked_race_is_requeued_when_deadline_changes():
+    monitor = RaceMonitor()
+    race = dueRace(monitor)
+    monitor._mergeSchedules([race])
+    assert monitor._popDueRaces() == [race]
+
+    moved = dueRace(monitor, deadline=race.deadlineDatetime + datetime.timedelta(seconds=30))
+    monitor._mergeSchedules([moved])
+    assert monitor._popDueRaces() == [moved]
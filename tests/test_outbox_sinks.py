@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from notification_outbox import NotificationOutbox, STATUS_PENDING  # noqa: E402
+
+
+class RecordingSink:
+    name = 'discord'
+    batchSize = 50
+    expires = True
+
+    def deliver(self, items):
+        return [True] * len(items)
+
+
+def insertPending(outbox, sink, raceKey, createdAt):
+    outbox.conn.execute("""
+        INSERT INTO outbox (sink, race_key, payload, status, created_at, next_attempt_at)
+        VALUES (?, ?, '{}', ?, ?, ?)
+    """, (sink, raceKey, STATUS_PENDING, createdAt, createdAt))
+
+
+def statuses(path):
+    outbox = NotificationOutbox([], path=path)
+    rows = dict(outbox.conn.execute("SELECT race_key, status FROM outbox").fetchall())
+    outbox.conn.close()
+    return rows
+
+
+def test_unconfigured_sink_rows_are_not_counted_and_are_retired(tmp_path):
+    path = str(tmp_path / 'outbox.sqlite3')
+    outbox = NotificationOutbox([RecordingSink()], path=path)
+    oldTime = time.time() - 8 * 86400
+    insertPending(outbox, 'sheets', 'old', oldTime)
+    insertPending(outbox, 'sheets', 'recent', time.time())
+
+    # 設定されていない送信先の行は未送信件数 (送信待ちの上限判定) に数えない
+    assert outbox.pendingCount() == 0
+    result = outbox.close(timeout=0.1)
+    assert set(result) == {'discord'}
+
+    # 古い行は破棄され、新しい行は設定が戻ったときのために残る
+    assert statuses(path) == {'recent': STATUS_PENDING}
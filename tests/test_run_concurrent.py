@@ -0,0 +1,24 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+from race_record import RaceRecord  # noqa: E402
+from schedule_fetcher import ScheduleFetcher  # noqa: E402
+
+
+def test_one_failing_race_does_not_abort_the_others():
+    fetcher = ScheduleFetcher(maxWorkers=2, requestsPerSecond=0, responseCache=False)
+
+    def fetchWinOdds(jcd, raceNo, dateStr, deadline=None):
+        if raceNo == 2:
+            raise ValueError('malformed page')
+        return {1: 1.5, 2: 3.0}
+
+    now = datetime.datetime.now()
+    races = [RaceRecord('01', raceNo, now + datetime.timedelta(minutes=raceNo)) for raceNo in (1, 2, 3)]
+    results, timedOut = fetcher._runConcurrent(races, fetchWinOdds, 5.0)
+
+    assert timedOut == []
+    assert [(race.raceNo, odds) for race, odds in results] == [(1, {1: 1.5, 2: 3.0}), (2, None), (3, {1: 1.5, 2: 3.0})]